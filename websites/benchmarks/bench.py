@@ -0,0 +1,295 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import threading
+import subprocess
+from time import monotonic
+from datetime import datetime
+from typing import Any, Dict, List
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+WEBSITES_DIR = os.path.join(BENCHMARKS_DIR, '..')
+sys.path.append(WEBSITES_DIR)
+from common.pacing import Pacer
+from common.driver_pool import DriverPool, browser_rss
+
+from server import FixtureServer
+
+
+# both sites have a scraper.py and a models.py, so every scenario runs in its own process
+SCENARIOS = {
+    'vinted-soup': 'vinted',
+    'vinted-webdriver': 'vinted',
+    'vinted-http': 'vinted',
+    'mercari-dom': 'mercari',
+    # every card stays rendered, to measure what pruning saves
+    'mercari-dom-unpruned': 'mercari',
+    'mercari-item-pages': 'mercari',
+    # items from the search responses read over webdriver bidi, see captured_batches
+    'mercari-capture': 'mercari',
+    'mercari-http': 'mercari',
+}
+
+# counts the WebDriver round trips of the browsers of a pool and samples the
+# peak memory of the browsers and of this process
+class Probe:
+    def __init__(self, sample_interval: float = 0.25) -> None:
+        self.lock = threading.Lock()
+        self.commands: Dict[str, Dict[str, float]] = {}
+        self.drivers = []
+        self.peak_browser_rss = 0
+        self.peak_process_rss = 0
+
+        self.sample_interval = sample_interval
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self._sample, name='ProbeSampler', daemon=True)
+
+    @property
+    def num_round_trips(self) -> int:
+        return int(sum(command['count'] for command in self.commands.values()))
+
+    def start(self):
+        self.sampler.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.sampler.join()
+
+    def wrap_driver(self, driver):
+        execute = driver.execute
+
+        def timed_execute(driver_command, params=None):
+            ts = monotonic()
+            try:
+                return execute(driver_command, params)
+            finally:
+                self._record(self.commands, driver_command, monotonic() - ts)
+
+        driver.execute = timed_execute
+        with self.lock:
+            self.drivers.append(driver)
+
+    def _record(self, table: Dict[str, Dict[str, float]], name: str, elapsed: float):
+        with self.lock:
+            entry = table.setdefault(name, {'count': 0, 'seconds': 0})
+            entry['count'] += 1
+            entry['seconds'] += elapsed
+
+    def _sample(self):
+        page_size = os.sysconf('SC_PAGE_SIZE')
+        while not self.stopped.wait(self.sample_interval):
+            with self.lock:
+                drivers = list(self.drivers)
+            browser_total = 0
+            for driver in drivers:
+                try:
+                    browser_total += browser_rss(driver) or 0
+                except Exception:
+                    pass
+            try:
+                with open('/proc/self/statm', 'r') as file:
+                    process_rss = int(file.read().split()[1]) * page_size
+            except (OSError, IndexError, ValueError):
+                process_rss = 0
+            self.peak_browser_rss = max(self.peak_browser_rss, browser_total)
+            self.peak_process_rss = max(self.peak_process_rss, process_rss)
+
+
+class ProbedDriverPool(DriverPool):
+    def __init__(self, probe: Probe, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.probe = probe
+
+    def _launch(self):
+        driver = super()._launch()
+        self.probe.wrap_driver(driver)
+        return driver
+
+
+def run_scenario(scenario: str, num_items: int, num_sessions: int, latency: float) -> Dict[str, Any]:
+    site = SCENARIOS[scenario]
+    sys.path.insert(0, os.path.join(WEBSITES_DIR, site, f'{site}_search'))
+
+    # results and logs of the scrapers go to a scratch directory
+    os.chdir(tempfile.mkdtemp(prefix=f'bench-{scenario}-'))
+
+    # no sleeps and no politeness budget, the server is local
+    pacer = Pacer(rate=1e6, burst=1e6, min_interval=0, jitter=0)
+    probe = Probe()
+
+    with FixtureServer(num_items=num_items, latency=latency) as server:
+        pool = ProbedDriverPool(probe, max_num_drivers=num_sessions, headless=True, bidi=scenario.endswith('capture'))
+        scraper = _make_scraper(scenario, server, pool, pacer, num_items, num_sessions)
+        scraper._sleep = lambda *args: None
+
+        probe.start()
+        ts = monotonic()
+        try:
+            scraper.run()
+        finally:
+            elapsed = monotonic() - ts
+            probe.stop()
+            pool.close()
+        num_requests = server.num_requests
+
+    num_scraped = sum(len(result.items) for result in scraper.result_map.values())
+    # the http scrapers are not instrumented
+    metrics = scraper.metrics.snapshot() if hasattr(scraper, 'metrics') else {'phases': {}, 'counters': {}}
+    return {
+        'scenario': scenario,
+        'num_items': num_scraped,
+        'num_sessions': num_sessions,
+        'latency': latency,
+        'elapsed': elapsed,
+        'items_per_sec': num_scraped / elapsed if elapsed > 0 else 0,
+        'num_round_trips': probe.num_round_trips,
+        'round_trips_per_item': probe.num_round_trips / num_scraped if num_scraped > 0 else None,
+        'num_requests': num_requests,
+        'peak_browser_rss': probe.peak_browser_rss,
+        'peak_process_rss': probe.peak_process_rss,
+        'commands': probe.commands,
+        'phases': metrics['phases'],
+        'counters': metrics['counters'],
+    }
+
+
+def _make_scraper(scenario: str, server: FixtureServer, pool: DriverPool, pacer: Pacer, num_items: int, num_sessions: int):
+    if scenario.startswith('vinted'):
+        from scraper import VintedSearchScrapeTask, VintedSearchScraper
+        from http_scraper import VintedSearchHttpScraper
+
+        task = VintedSearchScrapeTask(
+            id=scenario,
+            search_text='shirt',
+            max_num_items=num_items,
+            max_num_pages=-(-num_items // server.vinted_per_page),
+            scrape_item_page=False,
+            base_url=server.url,
+        )
+        if scenario == 'vinted-http':
+            return VintedSearchHttpScraper(verbose=False, tasks=[task], pacer=pacer, fallback=False)
+        return VintedSearchScraper(
+            verbose=False,
+            tasks=[task],
+            extract_mode=scenario.split('-', 1)[1],
+            pacer=pacer,
+            driver_pool=pool,
+            max_num_sessions=num_sessions,
+        )
+
+    from scraper import MercariSearchTask, MercariSearchScraper
+    from http_scraper import MercariSearchHttpScraper
+
+    task = MercariSearchTask(
+        id=scenario,
+        keyword='T-Shirt',
+        max_num_items=num_items,
+        scrape_item_page=scenario == 'mercari-item-pages',
+        base_url=server.url,
+    )
+    if scenario == 'mercari-http':
+        return MercariSearchHttpScraper(
+            search_query_hash='benchmark',
+            verbose=False,
+            tasks=[task],
+            page_size=server.mercari_batch_size,
+            pacer=pacer,
+            fallback=False,
+        )
+    return MercariSearchScraper(
+        max_num_threads=1,
+        verbose=False,
+        tasks=[task],
+        pacer=pacer,
+        driver_pool=pool,
+        capture=scenario == 'mercari-capture',
+        max_num_rendered_cards=None if scenario == 'mercari-dom-unpruned' else 240,
+    )
+
+
+# prints the change of every scenario against a baseline report, False if
+# any got slower than `tolerance` allows
+def compare(baseline: List[Dict[str, Any]], report: List[Dict[str, Any]], tolerance: float) -> bool:
+    baseline_map = {entry['scenario']: entry for entry in baseline}
+    ok = True
+    for entry in report:
+        base = baseline_map.get(entry['scenario'])
+        if base is None or base['items_per_sec'] == 0:
+            continue
+        ratio = entry['items_per_sec'] / base['items_per_sec']
+        regressed = ratio < 1 - tolerance
+        ok = ok and not regressed
+        print(f"{entry['scenario']:<20} {base['items_per_sec']:8.1f} -> {entry['items_per_sec']:8.1f} items/s ({ratio:.2f}x){'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def _version() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=BENCHMARKS_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scrapers against a local stand-in of the sites.")
+    parser.add_argument('scenarios', nargs='*', default=list(SCENARIOS), help=f"any of {', '.join(SCENARIOS)}, all by default")
+    parser.add_argument('--num-items', type=int, default=480)
+    parser.add_argument('--num-sessions', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0, help="seconds the server waits before every response")
+    parser.add_argument('--output', default=None, help="report path, defaults to benchmarks/results/<ts>-<version>.json")
+    parser.add_argument('--compare', default=None, help="baseline report to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    # internal, runs one scenario and writes its entry to --output
+    parser.add_argument('--worker', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    for scenario in args.scenarios + ([args.worker] if args.worker else []):
+        if scenario not in SCENARIOS:
+            parser.error(f"unknown scenario {scenario}")
+
+    if args.worker is not None:
+        entry = run_scenario(args.worker, args.num_items, args.num_sessions, args.latency)
+        with open(args.output, 'w') as file:
+            json.dump(entry, file)
+        return
+
+    version = _version()
+    report = []
+    for scenario in args.scenarios:
+        with tempfile.NamedTemporaryFile(suffix='.json') as entry_file:
+            subprocess.run([
+                sys.executable, os.path.abspath(__file__),
+                '--worker', scenario,
+                '--num-items', str(args.num_items),
+                '--num-sessions', str(args.num_sessions),
+                '--latency', str(args.latency),
+                '--output', entry_file.name,
+            ], check=True)
+            entry = json.load(entry_file)
+
+        entry['version'] = version
+        report.append(entry)
+        print(f"{scenario:<20} {entry['items_per_sec']:8.1f} items/s  {entry['round_trips_per_item'] or 0:6.2f} round trips/item  "
+              f"peak browser rss {entry['peak_browser_rss'] / 1024 ** 2:7.1f} MiB")
+
+    output = args.output
+    if output is None:
+        os.makedirs(os.path.join(BENCHMARKS_DIR, 'results'), exist_ok=True)
+        output = os.path.join(BENCHMARKS_DIR, 'results', f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{version}.json")
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"report saved to {output}")
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)
+        if not compare(baseline, report, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+import os
+import io
+import json
+import html
+import threading
+from time import sleep
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from typing import Any, Dict, List
+
+from PIL import Image
+
+__all__ = [
+    'FixtureServer',
+]
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+BRANDS = ['Zara', 'Nike', 'Uniqlo', 'Adidas', 'Levis', 'Mango', 'Carhartt', 'Patagonia']
+SIZES = ['XS', 'S', 'M', 'L', 'XL']
+CONDITIONS = ['New', 'Like new', 'Good', 'Fair', 'Poor']
+
+
+def _load_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name), 'r') as file:
+        return file.read()
+
+
+def _render(template: str, **fields) -> str:
+    for key, value in fields.items():
+        template = template.replace('{{' + key + '}}', str(value))
+    return template
+
+
+def _jpeg(size: int = 64) -> bytes:
+    buffer = io.BytesIO()
+    Image.new('RGB', (size, size), (200, 120, 40)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+# local stand-in for vinted and mercari over one deterministic catalog of `num_items` items,
+# point tasks at it with `base_url=server.url`
+class FixtureServer:
+    def __init__(
+        self,
+        num_items: int = 2000,
+        vinted_per_page: int = 96,
+        mercari_batch_size: int = 30,
+        num_photos: int = 4,
+        latency: float = 0,
+        host: str = '127.0.0.1',
+        port: int = 0,
+    ) -> None:
+        self.num_items = num_items
+        self.vinted_per_page = vinted_per_page
+        self.mercari_batch_size = mercari_batch_size
+        self.num_photos = num_photos
+        self.latency = latency
+
+        self.templates = {
+            name: _load_fixture(f'{name}.html')
+            for name in ['vinted_catalog', 'vinted_item_card', 'mercari_search', 'mercari_item_card', 'mercari_item']
+        }
+        self.image = _jpeg()
+
+        self.num_requests = 0
+        self.num_range_requests = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='FixtureServer', daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> 'FixtureServer':
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # the catalog, the same for every site and query
+
+    def vinted_item(self, idx: int) -> Dict[str, Any]:
+        item_id = str(4000000000 + idx)
+        return {
+            'id': item_id,
+            'title': f'{BRANDS[idx % len(BRANDS)]} shirt #{idx}',
+            'brand_title': BRANDS[idx % len(BRANDS)],
+            'size_title': SIZES[idx % len(SIZES)],
+            'status': CONDITIONS[idx % len(CONDITIONS)],
+            'price': {'amount': f'{3 + idx * 37 % 200}.00', 'currency_code': 'USD'},
+            'url': f'{self.url}/items/{item_id}-shirt',
+            'user': {'login': f'seller{idx % 97}'},
+            'photos': [
+                {'url': f'{self.url}/img/v{item_id}-{photo_idx}.jpg', 'full_size_url': f'{self.url}/img/v{item_id}-{photo_idx}.jpg'}
+                for photo_idx in range(self.num_photos)
+            ],
+        }
+
+    def mercari_item(self, idx: int) -> Dict[str, Any]:
+        item_id = f'm{50000000000 + idx}'
+        return {
+            'id': item_id,
+            'name': f'{BRANDS[idx % len(BRANDS)]} T-Shirt #{idx}',
+            'description': f'{BRANDS[idx % len(BRANDS)]} T-Shirt #{idx}',
+            'status': 'on_sale',
+            'price': 300 + idx * 37 % 20000,
+            'brand': {'name': BRANDS[idx % len(BRANDS)]},
+            'itemCondition': {'name': CONDITIONS[idx % len(CONDITIONS)]},
+            'photos': [
+                {'imageUrl': f'{self.url}/img/{item_id}-{photo_idx}.jpg', 'thumbnail': f'{self.url}/img/thumb/{item_id}-{photo_idx}.jpg'}
+                for photo_idx in range(self.num_photos)
+            ],
+        }
+
+    def mercari_items(self, offset: int, length: int) -> List[Dict[str, Any]]:
+        return [self.mercari_item(idx) for idx in range(offset, min(offset + length, self.num_items))]
+
+    # pages
+
+    def vinted_catalog_page(self, params: Dict[str, str]) -> str:
+        page_idx = int(params.get('page', '1'))
+        start = (page_idx - 1) * self.vinted_per_page
+        cards = []
+        for idx in range(start, min(start + self.vinted_per_page, self.num_items)):
+            item = self.vinted_item(idx)
+            cards.append(_render(
+                self.templates['vinted_item_card'],
+                id=item['id'],
+                url=item['url'],
+                img_url=item['photos'][0]['url'],
+                description=html.escape(item['title']),
+                brand=html.escape(item['brand_title']),
+                size=item['size_title'],
+                status=item['status'],
+                price=f"${item['price']['amount']}",
+            ))
+        return _render(
+            self.templates['vinted_catalog'],
+            search_text=html.escape(params.get('search_text', '')),
+            items='\n'.join(cards),
+            next_page_url=f'/catalog?search_text={params.get("search_text", "")}&page={page_idx + 1}',
+        )
+
+    def vinted_catalog_json(self, params: Dict[str, str]) -> Dict[str, Any]:
+        page_idx = int(params.get('page', '1'))
+        per_page = int(params.get('per_page', str(self.vinted_per_page)))
+        start = (page_idx - 1) * per_page
+        return {
+            'items': [self.vinted_item(idx) for idx in range(start, min(start + per_page, self.num_items))],
+            'pagination': {'current_page': page_idx, 'total_pages': -(-self.num_items // per_page)},
+        }
+
+    def mercari_search_page(self, params: Dict[str, str]) -> str:
+        cards = []
+        for item in self.mercari_items(0, self.mercari_batch_size):
+            cards.append(_render(
+                self.templates['mercari_item_card'],
+                id=item['id'],
+                price=item['price'],
+                price_text=f"${item['price'] / 100}",
+                status=item['status'],
+                brand=html.escape(item['brand']['name']),
+                condition=item['itemCondition']['name'],
+                description=html.escape(item['description']),
+                img_url=item['photos'][0]['thumbnail'],
+            ))
+        return _render(
+            self.templates['mercari_search'],
+            search_text=html.escape(params.get('keyword', '')),
+            items='\n'.join(cards),
+            offset=len(cards),
+            total=self.num_items,
+            length=self.mercari_batch_size,
+            query=json.dumps(params.get('keyword', '')),
+        )
+
+    def mercari_search_json(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        criteria = payload.get('variables', {}).get('criteria', {})
+        items = self.mercari_items(int(criteria.get('offset', 0)), int(criteria.get('length', self.mercari_batch_size)))
+        return {'data': {'search': {'itemsList': items, 'count': self.num_items}}}
+
+    def mercari_item_page(self, item_id: str) -> str:
+        item = self.mercari_item(int(item_id.lstrip('m')) - 50000000000)
+        photos = [
+            f'    <div class="PhotoIndicators__ImageWrapper-sc-1"><img src="{photo["imageUrl"]}?w=800" alt=""></div>'
+            for photo in item['photos']
+        ]
+        return _render(
+            self.templates['mercari_item'],
+            description=html.escape(item['description']),
+            photos='\n'.join(photos),
+            price_text=f"${item['price'] / 100}",
+        )
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self._count()
+                url = urlsplit(self.path)
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+                if url.path == '/':
+                    self._send(200, 'text/html', b'<html><body></body></html>', headers={'Set-Cookie': 'session=benchmark'})
+                elif url.path == '/catalog':
+                    self._send(200, 'text/html', server.vinted_catalog_page(params).encode())
+                elif url.path == '/api/v2/catalog/items':
+                    self._send(200, 'application/json', json.dumps(server.vinted_catalog_json(params)).encode())
+                elif url.path == '/search/':
+                    self._send(200, 'text/html', server.mercari_search_page(params).encode())
+                elif url.path.startswith('/us/item/'):
+                    self._send(200, 'text/html', server.mercari_item_page(url.path.strip('/').split('/')[-1]).encode())
+                elif url.path.startswith('/img/'):
+                    self._send_image()
+                else:
+                    self._send(404, 'text/plain', b'not found')
+
+            def do_POST(self):
+                self._count()
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if urlsplit(self.path).path == '/v1/api':
+                    self._send(200, 'application/json', json.dumps(server.mercari_search_json(payload)).encode())
+                else:
+                    self._send(404, 'text/plain', b'not found')
+
+            def _count(self):
+                with server.lock:
+                    server.num_requests += 1
+                if server.latency > 0:
+                    sleep(server.latency)
+
+            # only the open ended ranges resumed downloads ask for, bytes=<offset>-
+            def _send_image(self):
+                size = len(server.image)
+                range_header = self.headers.get('Range', '')
+                if not range_header.startswith('bytes='):
+                    self._send(200, 'image/jpeg', server.image)
+                    return
+                with server.lock:
+                    server.num_range_requests += 1
+                offset = int(range_header[len('bytes='):].split('-')[0])
+                if offset >= size:
+                    self._send(416, 'text/plain', b'', headers={'Content-Range': f'bytes */{size}'})
+                else:
+                    self._send(206, 'image/jpeg', server.image[offset:], headers={'Content-Range': f'bytes {offset}-{size - 1}/{size}'})
+
+            def _send(self, status: int, content_type: str, body: bytes, headers: Dict[str, str] = {}):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
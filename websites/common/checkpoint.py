@@ -0,0 +1,53 @@
+import os
+import json
+from typing import Any, Dict, Optional
+
+__all__ = [
+    'CheckpointStore',
+    'MemoryCheckpointStore',
+]
+
+
+# progress of running tasks, one JSON file per task, replaced atomically
+class CheckpointStore:
+    def __init__(self, root: str = 'checkpoints') -> None:
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+
+    def path_of(self, task_id: str) -> str:
+        return os.path.join(self.root, f'{task_id}.json')
+
+    def save(self, task_id: str, state: Dict[str, Any]):
+        path = self.path_of(task_id)
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as file:
+            file.write(json.dumps(state, ensure_ascii=False))
+        os.replace(f'{path}.tmp', path)
+
+    def load(self, task_id: str) -> Optional[Dict[str, Any]]:
+        path = self.path_of(task_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.loads(file.read())
+
+    def clear(self, task_id: str):
+        path = self.path_of(task_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# checkpoints of one process kept in memory, e.g. to hand a task over from one scraper to another
+class MemoryCheckpointStore(CheckpointStore):
+    def __init__(self) -> None:
+        self.states: Dict[str, str] = {}
+
+    def save(self, task_id: str, state: Dict[str, Any]):
+        # serialized like on disk, later changes of state don't leak in
+        self.states[task_id] = json.dumps(state, ensure_ascii=False)
+
+    def load(self, task_id: str) -> Optional[Dict[str, Any]]:
+        state = self.states.get(task_id)
+        return json.loads(state) if state is not None else None
+
+    def clear(self, task_id: str):
+        self.states.pop(task_id, None)
@@ -0,0 +1,130 @@
+from array import array
+from dataclasses import fields
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from common.result_writer import read_records
+
+__all__ = [
+    'ColumnarItems',
+]
+
+
+# items of one dataclass kept column by column, categorical fields dictionary encoded
+# NOTE: `to_arrow` and `to_parquet` need pyarrow
+class ColumnarItems:
+    def __init__(self, item_cls: type, categorical: Optional[Sequence[str]] = None) -> None:
+        self.item_cls = item_cls
+        self.names = [f.name for f in fields(item_cls)]
+        if categorical is None:
+            categorical = getattr(item_cls, 'categorical_fields', ())
+        defaults = item_cls()
+        self.list_names = {name for name in self.names if isinstance(getattr(defaults, name), list)}
+        self.categorical_names = {name for name in categorical if name not in self.list_names}
+
+        self.num_items = 0
+        self.columns: Dict[str, Any] = {}
+        # distinct values and their codes per categorical field
+        self.dictionaries: Dict[str, List[Any]] = {}
+        self.lookups: Dict[str, Dict[Any, int]] = {}
+        for name in self.names:
+            if name in self.categorical_names:
+                self.columns[name] = array('I')
+                self.dictionaries[name] = []
+                self.lookups[name] = {}
+            elif name in self.list_names:
+                # values of item idx are values[offsets[idx]:offsets[idx + 1]]
+                self.columns[name] = (array('Q', [0]), [])
+            else:
+                self.columns[name] = []
+
+    @classmethod
+    def from_items(cls, item_cls: type, items: Iterable[Any], categorical: Optional[Sequence[str]] = None) -> 'ColumnarItems':
+        columnar = cls(item_cls, categorical=categorical)
+        columnar.extend(items)
+        return columnar
+
+    # reads the item records of a results/*.jsonl file
+    @classmethod
+    def from_jsonl(cls, item_cls: type, path: str, categorical: Optional[Sequence[str]] = None) -> 'ColumnarItems':
+        return cls.from_items(
+            item_cls,
+            (item_cls(**record['item']) for record in read_records(path) if record['type'] == 'item'),
+            categorical=categorical
+        )
+
+    def append(self, item: Any):
+        for name in self.names:
+            value = getattr(item, name)
+            column = self.columns[name]
+            if name in self.categorical_names:
+                lookup = self.lookups[name]
+                code = lookup.get(value)
+                if code is None:
+                    code = lookup[value] = len(self.dictionaries[name])
+                    self.dictionaries[name].append(value)
+                column.append(code)
+            elif name in self.list_names:
+                offsets, values = column
+                values.extend(value)
+                offsets.append(len(values))
+            else:
+                column.append(value)
+        self.num_items += 1
+
+    def extend(self, items: Iterable[Any]):
+        for item in items:
+            self.append(item)
+
+    def __len__(self) -> int:
+        return self.num_items
+
+    def __getitem__(self, idx: int) -> Any:
+        if idx < 0:
+            idx += self.num_items
+        if not 0 <= idx < self.num_items:
+            raise IndexError('item index out of range')
+        return self.item_cls(**{name: self._value(name, idx) for name in self.names})
+
+    def __iter__(self) -> Iterator[Any]:
+        for idx in range(self.num_items):
+            yield self[idx]
+
+    # values of one field over all items, decoded
+    def column(self, name: str) -> List[Any]:
+        return [self._value(name, idx) for idx in range(self.num_items)]
+
+    def to_arrow(self):
+        pa = _import_pyarrow()
+        arrays = []
+        for name in self.names:
+            column = self.columns[name]
+            if name in self.categorical_names:
+                arrays.append(pa.DictionaryArray.from_arrays(pa.array(column, type=pa.uint32()), pa.array(self.dictionaries[name])))
+            elif name in self.list_names:
+                offsets, values = column
+                arrays.append(pa.LargeListArray.from_arrays(pa.array(offsets, type=pa.int64()), pa.array(values, type=pa.string())))
+            else:
+                arrays.append(pa.array(column))
+        return pa.Table.from_arrays(arrays, names=self.names)
+
+    def to_parquet(self, path: str):
+        _import_pyarrow()
+        import pyarrow.parquet as pq
+        pq.write_table(self.to_arrow(), path)
+
+    def _value(self, name: str, idx: int) -> Any:
+        column = self.columns[name]
+        if name in self.categorical_names:
+            return self.dictionaries[name][column[idx]]
+        if name in self.list_names:
+            offsets, values = column
+            return values[offsets[idx]:offsets[idx + 1]]
+        return column[idx]
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError("Arrow/Parquet export needs pyarrow, pip install pyarrow") from e
+    return pyarrow
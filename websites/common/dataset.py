@@ -0,0 +1,212 @@
+import io
+import os
+import json
+import logging
+import tarfile
+from time import time
+from collections import deque
+from dataclasses import asdict
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image
+
+from common.downloader import image_path
+from common.image_store import ImageStore
+from common.result_writer import read_records
+
+__all__ = [
+    'ShardWriter',
+    'DatasetBuilder',
+]
+
+
+# WebDataset-style tar shards, a shard is written as .tmp and renamed once full
+class ShardWriter:
+    def __init__(
+        self,
+        root: str = 'dataset',
+        prefix: str = 'shard',
+        max_num_samples: int = 1000,
+        max_shard_size: int = 512 * 1024 * 1024,
+    ) -> None:
+        assert max_num_samples > 0 and max_shard_size > 0
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.prefix = prefix
+        self.max_num_samples = max_num_samples
+        self.max_shard_size = max_shard_size
+
+        self.shards: List[Dict[str, Any]] = []
+        self.tar: Optional[tarfile.TarFile] = None
+        self.shard: Optional[Dict[str, Any]] = None
+
+    @property
+    def num_samples(self) -> int:
+        return sum(shard['num_samples'] for shard in self.shards) + (self.shard['num_samples'] if self.shard is not None else 0)
+
+    def write(self, key: str, files: Dict[str, bytes]):
+        # webdataset splits the key from the extension at the first dot
+        assert '.' not in key and '/' not in key, key
+        if self.shard is None:
+            self._open()
+
+        for ext, content in files.items():
+            info = tarfile.TarInfo(name=f'{key}.{ext}')
+            info.size = len(content)
+            info.mtime = int(time())
+            info.mode = 0o444
+            self.tar.addfile(info, io.BytesIO(content))
+        self.shard['num_samples'] += 1
+        self.shard['size'] = self.tar.fileobj.tell()
+
+        if self.shard['num_samples'] >= self.max_num_samples or self.shard['size'] >= self.max_shard_size:
+            self._close_shard()
+
+    def close(self):
+        if self.shard is not None:
+            self._close_shard()
+        manifest = {
+            'num_shards': len(self.shards),
+            'num_samples': self.num_samples,
+            'shards': self.shards,
+        }
+        path = os.path.join(self.root, 'manifest.json')
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, ensure_ascii=False, indent=2)
+        os.replace(f'{path}.tmp', path)
+
+    def _open(self):
+        name = f'{self.prefix}-{len(self.shards):06d}.tar'
+        self.tar = tarfile.open(os.path.join(self.root, f'{name}.tmp'), 'w')
+        self.shard = {'name': name, 'num_samples': 0, 'size': 0}
+
+    def _close_shard(self):
+        self.tar.close()
+        path = os.path.join(self.root, self.shard['name'])
+        os.replace(f'{path}.tmp', path)
+        self.shard['size'] = os.path.getsize(path)
+        self.shards.append(self.shard)
+        self.tar = None
+        self.shard = None
+
+
+# runs in the worker processes, returns (jpeg, width, height) or (None, error, 0)
+def _process_image(path: str, max_size: int, min_size: int, quality: int) -> Tuple[Optional[bytes], Any, int]:
+    try:
+        with Image.open(path) as image:
+            # decodes the whole image, truncated downloads fail here
+            image.load()
+            if min(image.size) < min_size:
+                return None, f'too small: {image.size[0]}x{image.size[1]}', 0
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, format='JPEG', quality=quality, optimize=True)
+            return buffer.getvalue(), image.size[0], image.size[1]
+    except Exception as e:
+        return None, f'undecodable: {e!r}', 0
+
+
+# one sample per image: the image downscaled and re-encoded as JPEG plus the item metadata,
+# images are decoded and encoded in a process pool, duplicates go in once
+class DatasetBuilder:
+    def __init__(
+        self,
+        root: str = 'dataset',
+        images_root: str = 'images',
+        store: Optional[ImageStore] = None,
+        max_size: int = 512,
+        min_size: int = 32,
+        quality: int = 90,
+        max_num_processes: Optional[int] = None,
+        max_num_samples_per_shard: int = 1000,
+        max_shard_size: int = 512 * 1024 * 1024,
+        max_num_in_flight: Optional[int] = None,
+        dedupe: bool = True,
+    ) -> None:
+        self.logger = logging.getLogger(name='DatasetBuilder')
+        self.logger.setLevel(logging.INFO)
+
+        self.images_root = images_root
+        self.store = store
+        self.max_size = max_size
+        self.min_size = min_size
+        self.quality = quality
+        self.dedupe = dedupe
+
+        self.writer = ShardWriter(root=root, max_num_samples=max_num_samples_per_shard, max_shard_size=max_shard_size)
+        self.max_num_processes = max_num_processes if max_num_processes is not None else os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.max_num_processes)
+        # keeps every process busy while bounding the encoded images held in memory
+        self.max_num_in_flight = max_num_in_flight if max_num_in_flight is not None else 4 * self.max_num_processes
+        self.pending: Deque[Tuple[str, Dict[str, Any], Future]] = deque()
+        self.seen_paths = set()
+
+        self.num_missing = 0
+        self.num_invalid = 0
+        self.num_duplicates = 0
+
+    def __enter__(self) -> 'DatasetBuilder':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_items(self, items: Iterable[Any], site: str):
+        for item in items:
+            metadata = asdict(item)
+            for img_idx, url in enumerate(item.img_urls):
+                path = self._locate(url)
+                if path is None or not os.path.exists(path):
+                    self.num_missing += 1
+                    continue
+                if self.dedupe:
+                    if path in self.seen_paths:
+                        self.num_duplicates += 1
+                        continue
+                    self.seen_paths.add(path)
+
+                key = f'{site}_{item.id}_{img_idx}'.replace('.', '_').replace('/', '_')
+                sample = {'site': site, 'img_idx': img_idx, 'img_url': url, 'item': metadata}
+                while len(self.pending) >= self.max_num_in_flight:
+                    self._write_next()
+                future = self.executor.submit(_process_image, path, self.max_size, self.min_size, self.quality)
+                self.pending.append((key, sample, future))
+
+    # adds the items of a results/*.jsonl file
+    def add_results(self, path: str, item_cls: type, site: str):
+        self.add_items((item_cls(**record['item']) for record in read_records(path) if record['type'] == 'item'), site=site)
+
+    def close(self):
+        try:
+            while self.pending:
+                self._write_next()
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+            self.writer.close()
+        self.logger.info(msg=(
+            f"{self.writer.num_samples} samples in {len(self.writer.shards)} shards, "
+            f"{self.num_missing} images missing, {self.num_invalid} invalid, {self.num_duplicates} duplicates skipped"
+        ))
+
+    def _locate(self, url: str) -> Optional[str]:
+        if self.store is not None:
+            return self.store.path_of(url)
+        return image_path(self.images_root, url)
+
+    # samples are written in the order they were added
+    def _write_next(self):
+        key, sample, future = self.pending.popleft()
+        content, width, height = future.result()
+        if content is None:
+            self.num_invalid += 1
+            self.logger.debug(msg=f"skip {sample['img_url']}: {width}")
+            return
+        sample['width'] = width
+        sample['height'] = height
+        self.writer.write(key, {
+            'jpg': content,
+            'json': json.dumps(sample, ensure_ascii=False).encode('utf-8'),
+        })
@@ -0,0 +1,58 @@
+from typing import Any, Dict, Iterable, List, Sequence, Set
+
+from common.item_index import ItemIndex
+
+__all__ = [
+    'DeltaTracker',
+]
+
+
+# one delta crawl of a query: stops at the high-water mark of the last crawl or at a batch
+# of indexed items, indexed items come back as delta records of their changed `fields`
+class DeltaTracker:
+    def __init__(
+        self,
+        index: ItemIndex,
+        site: str,
+        query: str,
+        fields: Sequence[str],
+        max_num_mark_ids: int = 50,
+        record_mark: bool = True,
+    ) -> None:
+        self.index = index
+        self.site = site
+        self.query = query
+        self.fields = list(fields)
+        self.max_num_mark_ids = max_num_mark_ids
+        self.record_mark = record_mark
+
+        mark = index.mark(site, query)
+        self.mark_ids: Set[str] = set(mark['item_ids']) if mark is not None else set()
+        self.mark_ts = mark['ts'] if mark is not None else None
+        self.top_ids: List[str] = []
+        self.reached = False
+        self.num_changed_items = 0
+
+    def states(self, items: Iterable[Any]) -> Dict[str, Dict[str, Any]]:
+        return {item.id: {name: getattr(item, name) for name in self.fields} for item in items}
+
+    # returns the delta records of the changed indexed items, sets `reached` once the crawl can stop
+    def observe(self, items: List[Any], known_ids: Set[str]) -> List[Dict[str, Any]]:
+        item_ids = [item.id for item in items]
+        if len(self.top_ids) < self.max_num_mark_ids:
+            self.top_ids.extend(item_ids[:self.max_num_mark_ids - len(self.top_ids)])
+
+        # the shortest run of indexed items ending the batch
+        start = len(item_ids)
+        while start > 0 and item_ids[start - 1] in known_ids:
+            start -= 1
+        if item_ids and any(idx == 0 or item_ids[idx] in self.mark_ids for idx in range(start, len(item_ids))):
+            self.reached = True
+
+        changes = self.index.changes(self.site, self.states(item for item in items if item.id in known_ids))
+        self.num_changed_items += len(changes)
+        return [{'id': item_id, 'changes': changed} for item_id, changed in changes.items()]
+
+    def finish(self):
+        if self.record_mark and self.top_ids:
+            self.index.set_mark(self.site, self.query, self.top_ids)
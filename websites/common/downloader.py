@@ -0,0 +1,207 @@
+import os
+import hashlib
+import logging
+import threading
+from time import sleep
+from queue import Queue
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common.image_store import ImageStore
+
+__all__ = [
+    'ImageDownloader',
+    'image_path',
+]
+
+
+# where ImageDownloader saves the image of url under root, without a store
+def image_path(root: str, url: str) -> str:
+    digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    return os.path.join(root, digest[:2], f'{digest}{_ext_of(url)}')
+
+
+def _ext_of(url: str) -> str:
+    ext = os.path.splitext(urlsplit(url).path)[1].lower()
+    if ext not in ['.jpg', '.jpeg', '.png', '.webp', '.gif']:
+        ext = '.jpg'
+    return ext
+
+
+# downloads `img_urls` on a fixed set of threads while browsing goes on,
+# `submit` blocks once `max_num_in_flight` urls are pending
+class ImageDownloader:
+    def __init__(
+        self,
+        root: str = 'images',
+        max_num_threads: int = 8,
+        max_num_conns_per_host: int = 4,
+        max_num_in_flight: int = 256,
+        max_num_retries: int = 3,
+        timeout: float = 10,
+        chunk_size: int = 64 * 1024,
+        store: Optional[ImageStore] = None,
+    ) -> None:
+        assert max_num_threads > 0 and max_num_conns_per_host > 0 and max_num_in_flight > 0
+
+        self.logger = logging.getLogger(name='ImageDownloader')
+
+        self.root = root
+        self.max_num_threads = max_num_threads
+        self.max_num_conns_per_host = max_num_conns_per_host
+        self.max_num_retries = max_num_retries
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.store = store
+
+        self.queue: Queue[Optional[str]] = Queue(maxsize=max_num_in_flight)
+        self.workers = []
+        self.session_local = threading.local()
+
+        self.lock = threading.Lock()
+        self.host_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        # urls queued or downloading, a url leaves once it is on disk so the disk check takes over
+        self.in_flight = set()
+
+        self.num_downloaded = 0
+        self.num_skipped = 0
+        self.num_failed = 0
+
+    def start(self):
+        os.makedirs(self.root, exist_ok=True)
+        for worker_idx in range(self.max_num_threads):
+            worker = threading.Thread(target=self._work, name=f'ImageDownloader-{worker_idx}', daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def close(self):
+        # wait for pending urls, then stop the workers
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        self.logger.info(msg=f"{self.num_downloaded} images downloaded, {self.num_skipped} skipped, {self.num_failed} failed")
+
+    def __enter__(self) -> 'ImageDownloader':
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, url: str):
+        if not url:
+            return
+        with self.lock:
+            if url in self.in_flight:
+                return
+            self.in_flight.add(url)
+        # blocks while too many urls are in flight
+        self.queue.put(url)
+
+    def submit_items(self, items: Iterable):
+        for item in items:
+            for url in item.img_urls:
+                self.submit(url)
+
+    def path_of(self, url: str) -> str:
+        return image_path(self.root, url)
+
+    @property
+    def session(self) -> requests.Session:
+        # one keep-alive session per worker thread
+        session = getattr(self.session_local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=self.max_num_conns_per_host)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self.session_local.session = session
+        return session
+
+    def _host_semaphore(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.host_semaphores:
+                self.host_semaphores[host] = threading.BoundedSemaphore(self.max_num_conns_per_host)
+            return self.host_semaphores[host]
+
+    def _work(self):
+        while True:
+            url = self.queue.get()
+            if url is None:
+                break
+            try:
+                self._download(url)
+            except Exception:
+                self.logger.exception(msg=f"failed to download {url}")
+                self._count('num_failed')
+            finally:
+                with self.lock:
+                    self.in_flight.discard(url)
+
+    def _count(self, name: str):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _download(self, url: str):
+        path = self.path_of(url)
+        if os.path.exists(path) or (self.store is not None and url in self.store):
+            self._count('num_skipped')
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        part_path = f'{path}.part'
+
+        for retry_idx in range(self.max_num_retries + 1):
+            if retry_idx > 0:
+                sleep(min(2 ** retry_idx, 30))
+            try:
+                with self._host_semaphore(url):
+                    if self._fetch(url, part_path):
+                        self._finish(url, part_path, path)
+                        self._count('num_downloaded')
+                        return
+            except requests.HTTPError as e:
+                # 4xx other than 429, retrying won't help
+                self.logger.error(msg=f"failed to download {url}: {e}")
+                self._count('num_failed')
+                return
+            except requests.RequestException as e:
+                self.logger.warning(msg=f"retry {retry_idx + 1}/{self.max_num_retries} for {url}: {e}")
+
+        self.logger.error(msg=f"give up downloading {url}")
+        self._count('num_failed')
+
+    def _finish(self, url: str, part_path: str, path: str):
+        if self.store is None:
+            os.replace(part_path, path)
+            return
+        with open(part_path, 'rb') as file:
+            self.store.put(url, file.read(), ext=_ext_of(url))
+        os.remove(part_path)
+
+    # returns False when the request should be retried
+    def _fetch(self, url: str, part_path: str) -> bool:
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {'Range': f'bytes={offset}-'} if offset > 0 else {}
+
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 416:
+                # the part file is already complete
+                return True
+            if response.status_code == 429 or response.status_code >= 500:
+                self.logger.warning(msg=f"got {response.status_code} from {url}")
+                return False
+            response.raise_for_status()
+
+            # the server ignored the Range header, start over
+            mode = 'ab' if response.status_code == 206 else 'wb'
+            with open(part_path, mode) as file:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    file.write(chunk)
+        return True
@@ -0,0 +1,215 @@
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from selenium import webdriver
+
+__all__ = [
+    'DriverPool',
+    'LEAN_FIREFOX_PREFS',
+    'browser_rss',
+]
+
+
+# we only read urls out of the DOM, so skip everything that is only there to be looked at
+LEAN_FIREFOX_PREFS: Dict[str, Any] = {
+    # images and web fonts
+    'permissions.default.image': 2,
+    'gfx.downloadable_fonts.enabled': False,
+    'browser.display.use_document_fonts': 0,
+    # media
+    'media.autoplay.default': 5,
+    'media.hardware-video-decoding.enabled': False,
+    # telemetry and reporting
+    'toolkit.telemetry.enabled': False,
+    'toolkit.telemetry.unified': False,
+    'toolkit.telemetry.archive.enabled': False,
+    'datareporting.healthreport.uploadEnabled': False,
+    'datareporting.policy.dataSubmissionEnabled': False,
+    'browser.crashReports.unsubmittedCheck.autoSubmit2': False,
+    'app.shield.optoutstudies.enabled': False,
+    'app.normandy.enabled': False,
+    # prefetching and speculative connections
+    'network.prefetch-next': False,
+    'network.dns.disablePrefetch': True,
+    'network.predictor.enabled': False,
+    'network.http.speculative-parallel-limit': 0,
+    'browser.urlbar.speculativeConnect.enabled': False,
+    # background chatter
+    'app.update.auto': False,
+    'browser.shell.checkDefaultBrowser': False,
+    'browser.newtabpage.enabled': False,
+    'browser.safebrowsing.malware.enabled': False,
+    'browser.safebrowsing.phishing.enabled': False,
+    'extensions.update.enabled': False,
+}
+
+
+# resident memory in bytes of a Firefox and all its content processes, None
+# where /proc is not available
+def browser_rss(driver) -> Optional[int]:
+    pid = driver.capabilities.get('moz:processID')
+    if pid is None or not os.path.isdir('/proc'):
+        return None
+
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as file:
+                # the command name may contain spaces, fields after it are fixed
+                ppid = int(file.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    rss = 0
+    pids = [pid]
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    while pids:
+        pid = pids.pop()
+        try:
+            with open(f'/proc/{pid}/statm', 'r') as file:
+                rss += int(file.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            continue
+        pids.extend(children.get(pid, []))
+    return rss
+
+
+# warm Firefox instances shared across tasks, launched lazily and recycled
+# after `max_num_pages` navigations or above `max_rss` bytes
+class DriverPool:
+    def __init__(
+        self,
+        max_num_drivers: int = 1,
+        max_num_pages: int = 500,
+        max_rss: int = 2 * 1024 ** 3,
+        headless: bool = False,
+        lean: bool = True,
+        prefs: Optional[Dict[str, Any]] = None,
+        bidi: bool = False,
+    ) -> None:
+        assert max_num_drivers > 0
+
+        self.logger = logging.getLogger(name='DriverPool')
+
+        self.max_num_drivers = max_num_drivers
+        self.max_num_pages = max_num_pages
+        self.max_rss = max_rss
+        self.headless = headless
+        self.prefs = dict(LEAN_FIREFOX_PREFS) if lean else {}
+        self.prefs.update(prefs or {})
+        self.bidi = bidi
+
+        self.cond = threading.Condition()
+        self.idle_drivers: List[webdriver.Firefox] = []
+        self.page_counts: Dict[int, int] = {}
+        self.num_drivers = 0
+        self.closed = False
+
+    def acquire(self) -> webdriver.Firefox:
+        with self.cond:
+            if self.closed:
+                raise RuntimeError("the driver pool is closed")
+            while True:
+                if self.idle_drivers:
+                    driver = self.idle_drivers.pop()
+                    break
+                if self.num_drivers < self.max_num_drivers:
+                    self.num_drivers += 1
+                    driver = None
+                    break
+                self.cond.wait()
+
+        if driver is not None and not self._is_healthy(driver):
+            self.logger.warning(msg=f"{driver} is unresponsive, relaunch")
+            self._quit(driver)
+            driver = None
+
+        if driver is None:
+            try:
+                driver = self._launch()
+            except Exception:
+                with self.cond:
+                    self.num_drivers -= 1
+                    self.cond.notify()
+                raise
+        return driver
+
+    def release(self, driver: webdriver.Firefox, broken: bool = False):
+        recycle = broken or self.page_counts.get(id(driver), 0) >= self.max_num_pages
+        if not recycle and self.max_rss is not None:
+            rss = browser_rss(driver)
+            recycle = rss is not None and rss > self.max_rss
+
+        with self.cond:
+            keep = not recycle and not self.closed
+            if keep:
+                self.idle_drivers.append(driver)
+            else:
+                self.num_drivers -= 1
+            self.cond.notify()
+
+        if not keep:
+            if recycle:
+                self.logger.info(msg=f"recycle {driver} after {self.page_counts.get(id(driver), 0)} pages")
+            self._quit(driver)
+
+    @contextmanager
+    def session(self) -> Iterator[webdriver.Firefox]:
+        driver = self.acquire()
+        try:
+            yield driver
+        finally:
+            self.release(driver)
+
+    def count_page(self, driver: webdriver.Firefox, num_pages: int = 1):
+        with self.cond:
+            self.page_counts[id(driver)] = self.page_counts.get(id(driver), 0) + num_pages
+
+    # quits idle drivers now and the ones still in use once they are released
+    def close(self):
+        with self.cond:
+            self.closed = True
+            drivers = self.idle_drivers
+            self.idle_drivers = []
+            self.num_drivers -= len(drivers)
+        for driver in drivers:
+            self._quit(driver)
+
+    def __enter__(self) -> 'DriverPool':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _launch(self) -> webdriver.Firefox:
+        options = webdriver.FirefoxOptions()
+        if self.headless:
+            options.add_argument('-headless')
+        for key, value in self.prefs.items():
+            options.set_preference(key, value)
+        if self.bidi:
+            options.set_capability('webSocketUrl', True)
+        driver = webdriver.Firefox(options=options)
+        self.logger.info(msg=f"{driver} launched")
+        return driver
+
+    def _is_healthy(self, driver: webdriver.Firefox) -> bool:
+        try:
+            return driver.execute_script("return 1;") == 1
+        except Exception:
+            return False
+
+    def _quit(self, driver: webdriver.Firefox):
+        with self.cond:
+            self.page_counts.pop(id(driver), None)
+        try:
+            driver.quit()
+            self.logger.info(msg=f"{driver} exited gracefully")
+        except Exception:
+            pass
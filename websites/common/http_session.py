@@ -0,0 +1,110 @@
+import logging
+from time import monotonic, sleep
+from typing import Any, Dict, Optional
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common.pacing import Pacer
+
+__all__ = [
+    'Blocked',
+    'HttpSession',
+]
+
+
+# the site refuses to serve us over plain HTTP, time to fall back to a browser
+class Blocked(Exception):
+    pass
+
+
+# keep-alive session for a site's JSON endpoints, bootstrapped with the cookies of `bootstrap_path`
+class HttpSession:
+    USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64; rv:126.0) Gecko/20100101 Firefox/126.0'
+
+    def __init__(
+        self,
+        base_url: str,
+        bootstrap_path: str = '/',
+        pacer: Optional[Pacer] = None,
+        headers: Optional[Dict[str, str]] = None,
+        max_num_retries: int = 3,
+        timeout: float = 15,
+        pool_maxsize: int = 8,
+    ) -> None:
+        self.logger = logging.getLogger(name='HttpSession')
+
+        self.base_url = base_url
+        self.domain = urlsplit(base_url).netloc
+        self.bootstrap_path = bootstrap_path
+        self.pacer = pacer if pacer is not None else Pacer()
+        self.max_num_retries = max_num_retries
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'User-Agent': self.USER_AGENT,
+            'Accept-Language': 'en-US,en;q=0.9',
+        })
+        self.session.headers.update(headers or {})
+        self.bootstrapped = False
+
+    def close(self):
+        self.session.close()
+
+    def bootstrap(self):
+        self._request('GET', self.bootstrap_path, headers={'Accept': 'text/html'}, bootstrap=False)
+        self.bootstrapped = True
+
+    def get_json(self, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        return self._request('GET', path, params=params).json()
+
+    def post_json(self, path: str, payload: Any) -> Any:
+        return self._request('POST', path, json=payload).json()
+
+    def _request(self, method: str, path: str, bootstrap: bool = True, **kwargs) -> requests.Response:
+        if bootstrap and not self.bootstrapped:
+            self.bootstrap()
+
+        url = urljoin(self.base_url, path)
+        kwargs.setdefault('headers', {'Accept': 'application/json'})
+        reauthed = False
+
+        for retry_idx in range(self.max_num_retries + 1):
+            if retry_idx > 0:
+                sleep(min(2 ** retry_idx, 30))
+
+            self.pacer.acquire(self.domain)
+            ts = monotonic()
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except requests.RequestException as e:
+                self.logger.warning(msg=f"retry {retry_idx + 1}/{self.max_num_retries} for {url}: {e}")
+                continue
+
+            challenged = response.status_code in [403, 429] or self._is_challenge(response, bootstrap)
+            self.pacer.report(self.domain, monotonic() - ts, challenged=challenged)
+
+            if response.status_code == 401 and bootstrap and not reauthed:
+                # the session cookies expired
+                reauthed = True
+                self.bootstrap()
+                continue
+            if challenged:
+                self.logger.warning(msg=f"blocked by {url} with {response.status_code}")
+                continue
+            if response.status_code >= 500:
+                self.logger.warning(msg=f"got {response.status_code} from {url}")
+                continue
+            response.raise_for_status()
+            return response
+
+        raise Blocked(f"{method} {url} failed after {self.max_num_retries} retries")
+
+    def _is_challenge(self, response: requests.Response, expect_json: bool) -> bool:
+        # a JSON endpoint answering with HTML is a challenge page
+        return expect_json and 'text/html' in response.headers.get('Content-Type', '')
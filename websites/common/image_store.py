@@ -0,0 +1,180 @@
+import io
+import os
+import sqlite3
+import hashlib
+import threading
+from typing import Any, List, Optional, Tuple
+
+from PIL import Image
+
+__all__ = [
+    'BKTree',
+    'ImageStore',
+    'dhash',
+    'hamming_distance',
+]
+
+
+# 64-bit difference hash of an image, None if the image can't be decoded
+def dhash(content: bytes, hash_size: int = 8) -> Optional[int]:
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            image = image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+            pixels = image.tobytes()
+    except Exception:
+        return None
+
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | int(left > right)
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+# Burkhard-Keller tree over hamming distance, finds every value within a
+# given distance of a query without comparing against all the values
+class BKTree:
+    def __init__(self) -> None:
+        # node: (value, payload, {distance: child})
+        self.root: Optional[Tuple[int, Any, dict]] = None
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, value: int, payload: Any):
+        self.size += 1
+        if self.root is None:
+            self.root = (value, payload, {})
+            return
+        node = self.root
+        while True:
+            distance = hamming_distance(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, payload, {})
+                return
+            node = child
+
+    # returns (distance, payload) of every value within max_distance, nearest first
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, Any]]:
+        matches = []
+        nodes = [self.root] if self.root is not None else []
+        while nodes:
+            node = nodes.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= max_distance:
+                matches.append((distance, node[1]))
+            # triangle inequality, only these subtrees can hold matches
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    nodes.append(child)
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+
+# content-addressed image store, `index.db` maps every url to the sha256 of its image,
+# images within `max_distance` bits of a stored one are not written again
+class ImageStore:
+    def __init__(self, root: str = 'images', max_distance: int = 4) -> None:
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.max_distance = max_distance
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(root, 'index.db'), check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS images (
+                digest TEXT PRIMARY KEY,
+                ext TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                phash TEXT
+            );
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                -- digest of the content actually fetched from url, differs from digest for near duplicates
+                content_digest TEXT NOT NULL
+            );
+        """)
+        self.conn.commit()
+
+        self.tree = BKTree()
+        for digest, phash in self.conn.execute("SELECT digest, phash FROM images WHERE phash IS NOT NULL"):
+            self.tree.add(int(phash, 16), digest)
+
+    def __contains__(self, url: str) -> bool:
+        return self.digest_of(url) is not None
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def digest_of(self, url: str) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute("SELECT digest FROM urls WHERE url = ?", (url,)).fetchone()
+        return row[0] if row is not None else None
+
+    def path_of(self, url: str) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT images.digest, images.ext FROM urls JOIN images ON urls.digest = images.digest WHERE urls.url = ?",
+                (url,)
+            ).fetchone()
+        return self._object_path(*row) if row is not None else None
+
+    # stores the image fetched from url, returns the digest url now points to
+    def put(self, url: str, content: bytes, ext: str = '.jpg') -> str:
+        content_digest = hashlib.sha256(content).hexdigest()
+        phash = dhash(content)
+
+        with self.lock:
+            digest = self._find_duplicate(content_digest, phash)
+            if digest is None:
+                digest = content_digest
+                path = self._object_path(digest, ext)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(f'{path}.tmp', 'wb') as file:
+                    file.write(content)
+                os.replace(f'{path}.tmp', path)
+                self.conn.execute(
+                    "INSERT INTO images (digest, ext, size, phash) VALUES (?, ?, ?, ?)",
+                    (digest, ext, len(content), f'{phash:016x}' if phash is not None else None)
+                )
+                if phash is not None:
+                    self.tree.add(phash, digest)
+
+            self.conn.execute(
+                "INSERT OR REPLACE INTO urls (url, digest, content_digest) VALUES (?, ?, ?)",
+                (url, digest, content_digest)
+            )
+            self.conn.commit()
+        return digest
+
+    def _find_duplicate(self, content_digest: str, phash: Optional[int]) -> Optional[str]:
+        row = self.conn.execute("SELECT digest FROM images WHERE digest = ?", (content_digest,)).fetchone()
+        if row is not None:
+            return row[0]
+        # same content seen before as a near duplicate
+        row = self.conn.execute("SELECT digest FROM urls WHERE content_digest = ?", (content_digest,)).fetchone()
+        if row is not None:
+            return row[0]
+        # relisted photos are usually re-encoded or resized, so also match perceptually
+        if phash is not None:
+            matches = self.tree.search(phash, self.max_distance)
+            if matches:
+                return matches[0][1]
+        return None
+
+    def _object_path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.root, 'objects', digest[:2], digest[2:4], f'{digest}{ext}')
@@ -0,0 +1,121 @@
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+__all__ = [
+    'ItemIndex',
+]
+
+
+# items scraped so far keyed by (site, item id), plus the fields and top ids delta crawls compare against
+class ItemIndex:
+    def __init__(self, path: str = 'index/items.db') -> None:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS items (
+                site TEXT NOT NULL,
+                item_id TEXT NOT NULL,
+                first_seen TEXT NOT NULL,
+                last_seen TEXT NOT NULL,
+                state TEXT,
+                PRIMARY KEY (site, item_id)
+            );
+            CREATE TABLE IF NOT EXISTS marks (
+                site TEXT NOT NULL,
+                query TEXT NOT NULL,
+                item_ids TEXT NOT NULL,
+                ts TEXT NOT NULL,
+                PRIMARY KEY (site, query)
+            );
+        """)
+        # indexes created before states were kept
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(items)")]
+        if 'state' not in columns:
+            self.conn.execute("ALTER TABLE items ADD COLUMN state TEXT")
+        self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    # returns the ids among item_ids which are already indexed
+    def known(self, site: str, item_ids: Iterable[str]) -> Set[str]:
+        item_ids = list(set(item_ids))
+        known_ids = set()
+        with self.lock:
+            # stay below the sqlite limit of bound parameters
+            for start in range(0, len(item_ids), 500):
+                chunk = item_ids[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT item_id FROM items WHERE site = ? AND item_id IN ({', '.join('?' * len(chunk))})",
+                    (site, *chunk)
+                )
+                known_ids.update(row[0] for row in rows)
+        return known_ids
+
+    # records item_ids as seen now, keeping the first seen time of known ones,
+    # and the states given for some of them
+    def touch(self, site: str, item_ids: Iterable[str], states: Optional[Dict[str, Dict[str, Any]]] = None):
+        ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        states = states or {}
+        with self.lock:
+            self.conn.executemany(
+                "INSERT INTO items (site, item_id, first_seen, last_seen, state) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (site, item_id) DO UPDATE SET last_seen = excluded.last_seen, state = COALESCE(excluded.state, state)",
+                [
+                    (site, item_id, ts, ts, json.dumps(states[item_id], ensure_ascii=False) if item_id in states else None)
+                    for item_id in item_ids
+                ]
+            )
+            self.conn.commit()
+
+    # returns {item id: {field: [last value, value]}} of the fields which
+    # changed since the last state recorded, items without one are left out
+    def changes(self, site: str, states: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, List[Any]]]:
+        item_ids = list(states)
+        changes = {}
+        with self.lock:
+            for start in range(0, len(item_ids), 500):
+                chunk = item_ids[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT item_id, state FROM items WHERE site = ? AND state IS NOT NULL AND item_id IN ({', '.join('?' * len(chunk))})",
+                    (site, *chunk)
+                )
+                for item_id, state in rows:
+                    last_state = json.loads(state)
+                    changed = {
+                        key: [last_state.get(key), value]
+                        for key, value in states[item_id].items()
+                        if last_state.get(key) != value
+                    }
+                    if changed:
+                        changes[item_id] = changed
+        return changes
+
+    # the ids at the top of the last crawl of query and when it ran, None before the first one
+    def mark(self, site: str, query: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self.conn.execute("SELECT item_ids, ts FROM marks WHERE site = ? AND query = ?", (site, query)).fetchone()
+        if row is None:
+            return None
+        return {'item_ids': json.loads(row[0]), 'ts': row[1]}
+
+    def set_mark(self, site: str, query: str, item_ids: List[str]):
+        ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO marks (site, query, item_ids, ts) VALUES (?, ?, ?, ?)",
+                (site, query, json.dumps(item_ids), ts)
+            )
+            self.conn.commit()
+
+    def count(self, site: str) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM items WHERE site = ?", (site,)).fetchone()[0]
@@ -0,0 +1,250 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Dict, Iterator, Optional
+
+__all__ = [
+    'event',
+    'JsonLinesFormatter',
+    'LogPipeline',
+]
+
+
+# fields of a LogRecord which are not extra fields of the call
+RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'task_id', 'console'}
+
+
+# `extra` of a structured log call, e.g. logger.debug(msg="new item", extra=event('item', id=item.id))
+def event(name: str, **fields: Any) -> Dict[str, Any]:
+    return {'event': name, **fields}
+
+
+# one JSON object per record: time, level, logger, task, message, the extra
+# fields of the call and the traceback if any
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': f"{datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S')}.{int(record.msecs):03d}",
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'task_id': getattr(record, 'task_id', None),
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _PipelineHandler(QueueHandler):
+    # records below WARNING are dropped on a full queue, the others wait and go to stderr past that
+
+    def __init__(self, pipeline: 'LogPipeline', console: bool) -> None:
+        super().__init__(pipeline.queue)
+        self.pipeline = pipeline
+        self.console = console
+
+    def emit(self, record: logging.LogRecord):
+        rate = self.pipeline.sample_rates.get(getattr(record, 'event', None))
+        if rate is not None and random.random() >= rate:
+            self.pipeline._count('num_sampled_out')
+            return
+        super().emit(record)
+
+    # the message is merged and the traceback rendered here since the record
+    # leaves the thread, the rest of the formatting happens on the listener
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        record.task_id = getattr(self.pipeline.local, 'task_id', None)
+        record.console = self.console
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            if record.levelno < logging.WARNING:
+                self.queue.put_nowait(record)
+            else:
+                self.queue.put(record, timeout=self.pipeline.max_enqueue_wait)
+        except queue.Full:
+            if record.levelno < logging.WARNING:
+                self.pipeline._count('num_dropped')
+            else:
+                self.pipeline._count('num_overflowed')
+                sys.stderr.write(self.pipeline.router.formatter.format(record) + '\n')
+
+
+class _TaskRouter(logging.Handler):
+    # runs on the listener thread, writes every record to the file of its task
+    # or to the shared file, and the records of loggers attached with console to stderr
+
+    def __init__(self, pipeline: 'LogPipeline') -> None:
+        super().__init__()
+        self.pipeline = pipeline
+        self.formatter = JsonLinesFormatter()
+        self.console = logging.StreamHandler(sys.stderr)
+        self.console.setFormatter(logging.Formatter(fmt="[%(levelname)s] %(asctime)s | %(message)s", datefmt='%Y-%m-%d %H:%M:%S'))
+        # least recently used last
+        self.files: OrderedDict[str, RotatingFileHandler] = OrderedDict()
+
+    def emit(self, record: logging.LogRecord):
+        close_task_id = getattr(record, 'close_task_id', None)
+        if close_task_id is not None:
+            handler = self.files.pop(close_task_id, None)
+            if handler is not None:
+                handler.close()
+            return
+
+        name = record.task_id if record.task_id is not None else self.pipeline.name
+        handler = self.files.get(name)
+        if handler is None:
+            os.makedirs(self.pipeline.root, exist_ok=True)
+            handler = RotatingFileHandler(
+                filename=os.path.join(self.pipeline.root, f'{name}.log'),
+                maxBytes=self.pipeline.max_file_size,
+                backupCount=self.pipeline.max_num_backups,
+                encoding='utf-8',
+            )
+            handler.setFormatter(self.formatter)
+            self.files[name] = handler
+            if len(self.files) > self.pipeline.max_num_open_files:
+                self.files.popitem(last=False)[1].close()
+        else:
+            self.files.move_to_end(name)
+        handler.handle(record)
+
+        if record.console:
+            self.console.handle(record)
+
+    def close(self):
+        for handler in self.files.values():
+            handler.close()
+        self.files.clear()
+        super().close()
+
+
+# loggers put records on a bounded queue, one listener thread writes them as JSON lines per task
+# NOTE: events are sampled at `sample_rates` before queueing, the per-item ones are DEBUG records
+class LogPipeline:
+    _shared: Optional['LogPipeline'] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        root: str = 'logs',
+        name: str = 'spiders',
+        max_queue_size: int = 10000,
+        max_enqueue_wait: float = 1,
+        max_file_size: int = 32 * 1024 * 1024,
+        max_num_backups: int = 3,
+        max_num_open_files: int = 64,
+        sample_rates: Optional[Dict[str, float]] = None,
+    ) -> None:
+        assert max_queue_size > 0 and max_num_open_files > 0
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.name = name
+        self.max_enqueue_wait = max_enqueue_wait
+        self.max_file_size = max_file_size
+        self.max_num_backups = max_num_backups
+        self.max_num_open_files = max_num_open_files
+        self.sample_rates = sample_rates if sample_rates is not None else {'item': 0.05}
+
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.task_refs: Dict[str, int] = {}
+        self.counters = {'num_dropped': 0, 'num_overflowed': 0, 'num_sampled_out': 0}
+
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self.router = _TaskRouter(self)
+        self.listener = QueueListener(self.queue, self.router)
+        self.listener.start()
+        self.closed = False
+
+    # the pipeline of this process, started on first use and flushed at exit
+    @classmethod
+    def shared(cls) -> 'LogPipeline':
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+                atexit.register(cls._shared.close)
+            return cls._shared
+
+    @property
+    def num_dropped(self) -> int:
+        return self.counters['num_dropped']
+
+    @property
+    def num_overflowed(self) -> int:
+        return self.counters['num_overflowed']
+
+    @property
+    def num_sampled_out(self) -> int:
+        return self.counters['num_sampled_out']
+
+    def attach(self, logger: logging.Logger, console: bool = False):
+        # once per logger, attaching it again only turns console on
+        for handler in logger.handlers:
+            if isinstance(handler, _PipelineHandler) and handler.pipeline is self:
+                handler.console = handler.console or console
+                return
+        logger.addHandler(_PipelineHandler(self, console=console))
+
+    # records logged by the current thread within this block go to the file of task_id
+    @contextmanager
+    def task(self, task_id: str) -> Iterator[None]:
+        with self.lock:
+            self.task_refs[task_id] = self.task_refs.get(task_id, 0) + 1
+
+        last_task_id = getattr(self.local, 'task_id', None)
+        self.local.task_id = task_id
+        try:
+            yield
+        finally:
+            self.local.task_id = last_task_id
+            with self.lock:
+                self.task_refs[task_id] -= 1
+                done = self.task_refs[task_id] == 0
+                if done:
+                    del self.task_refs[task_id]
+            if done:
+                self._close_task(task_id)
+
+    # writes the records still queued and closes the files
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        self.listener.stop()
+        self.router.close()
+        if self.num_dropped > 0:
+            sys.stderr.write(f"{self.num_dropped} log records dropped on a full queue\n")
+
+    # closes the file of task_id once the records before it are written, a full
+    # queue leaves it to the open files cap
+    def _close_task(self, task_id: str):
+        try:
+            self.queue.put_nowait(logging.makeLogRecord({'close_task_id': task_id}))
+        except queue.Full:
+            pass
+
+    def _count(self, counter: str):
+        with self.lock:
+            self.counters[counter] += 1
@@ -0,0 +1,169 @@
+import os
+import json
+import threading
+from time import monotonic, time
+from contextlib import contextmanager
+from typing import IO, Any, Dict, Iterator, List, Optional
+
+__all__ = [
+    'Metrics',
+]
+
+
+# wall time per phase, counters and gauges, shared by the worker threads of a scraper,
+# self times leave out nested phases so they add up to the timed wall time
+class Metrics:
+    def __init__(self, name: str, root: str = 'metrics', trace_dir: Optional[str] = None) -> None:
+        self.name = name
+        self.root = root
+        self.trace_dir = trace_dir
+        if trace_dir is not None:
+            os.makedirs(trace_dir, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, int] = {}
+        self.gauges: Dict[str, float] = {}
+        self.local = threading.local()
+
+        # trace files stay open while any thread works on their task
+        self.traces: Dict[str, IO[str]] = {}
+        self.trace_refs: Dict[str, int] = {}
+
+    def count(self, counter: str, n: int = 1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def gauge(self, name: str, value: float):
+        with self.lock:
+            self.gauges[name] = value
+            self._trace({'gauge': name, 'ts': time(), 'value': value})
+
+    @contextmanager
+    def time(self, phase: str) -> Iterator[None]:
+        stack: List[List[float]] = self._stack()
+        # [start, seconds spent in nested phases]
+        frame = [monotonic(), 0]
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            stack.pop()
+            seconds = monotonic() - frame[0]
+            if len(stack) > 0:
+                stack[-1][1] += seconds
+            self._record(phase, seconds, seconds - frame[1])
+
+    # phases timed by the current thread within this block go to the trace of task_id
+    @contextmanager
+    def task(self, task_id: str) -> Iterator[None]:
+        if self.trace_dir is not None:
+            with self.lock:
+                if task_id not in self.traces:
+                    self.traces[task_id] = open(os.path.join(self.trace_dir, f'{task_id}.jsonl'), 'a', encoding='utf-8')
+                    self.trace_refs[task_id] = 0
+                self.trace_refs[task_id] += 1
+
+        last_task_id = getattr(self.local, 'task_id', None)
+        self.local.task_id = task_id
+        try:
+            yield
+        finally:
+            self.local.task_id = last_task_id
+            if self.trace_dir is not None:
+                with self.lock:
+                    self.trace_refs[task_id] -= 1
+                    if self.trace_refs[task_id] == 0:
+                        self.traces.pop(task_id).close()
+                        del self.trace_refs[task_id]
+
+    # counts the WebDriver commands sent to driver from now on as `webdriver_calls`
+    def watch(self, driver):
+        if getattr(driver, 'spiders_metrics', None) is None:
+            execute = driver.execute
+
+            def counted_execute(driver_command, params=None):
+                driver.spiders_metrics.count('webdriver_calls')
+                return execute(driver_command, params)
+
+            driver.execute = counted_execute
+        # a pooled browser counts for the scraper using it last
+        driver.spiders_metrics = self
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'name': self.name,
+                'ts': time(),
+                'phases': {phase: dict(entry) for phase, entry in self.phases.items()},
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+            }
+
+    def to_prometheus(self) -> str:
+        snapshot = self.snapshot()
+        label = f'scraper="{self.name}"'
+        lines = []
+
+        for metric, field, kind, help in [
+            ('spiders_phase_seconds_total', 'seconds', 'counter', 'Wall time spent in a phase, nested phases included.'),
+            ('spiders_phase_self_seconds_total', 'self_seconds', 'counter', 'Wall time spent in a phase, nested phases excluded.'),
+            ('spiders_phase_calls_total', 'count', 'counter', 'Times a phase was entered.'),
+            ('spiders_phase_max_seconds', 'max_seconds', 'gauge', 'Longest single run of a phase.'),
+        ]:
+            lines.append(f'# HELP {metric} {help}')
+            lines.append(f'# TYPE {metric} {kind}')
+            for phase, entry in sorted(snapshot['phases'].items()):
+                lines.append(f'{metric}{{{label},phase="{phase}"}} {entry[field]}')
+
+        for counter, value in sorted(snapshot['counters'].items()):
+            metric = f'spiders_{counter}_total'
+            lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{metric}{{{label}}} {value}')
+
+        for gauge, value in sorted(snapshot['gauges'].items()):
+            metric = f'spiders_{gauge}'
+            lines.append(f'# TYPE {metric} gauge')
+            lines.append(f'{metric}{{{label}}} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, self.name)
+        # replaced atomically, a scrape of the file never sees half a snapshot
+        with self.save_lock:
+            with open(f'{path}.json.tmp', 'w', encoding='utf-8') as file:
+                file.write(json.dumps(self.snapshot(), indent=2))
+            os.replace(f'{path}.json.tmp', f'{path}.json')
+            with open(f'{path}.prom.tmp', 'w', encoding='utf-8') as file:
+                file.write(self.to_prometheus())
+            os.replace(f'{path}.prom.tmp', f'{path}.prom')
+
+    def _stack(self) -> List[List[float]]:
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def _record(self, phase: str, seconds: float, self_seconds: float):
+        with self.lock:
+            entry = self.phases.get(phase)
+            if entry is None:
+                entry = self.phases[phase] = {'count': 0, 'seconds': 0, 'self_seconds': 0, 'max_seconds': 0}
+            entry['count'] += 1
+            entry['seconds'] += seconds
+            entry['self_seconds'] += self_seconds
+            entry['max_seconds'] = max(entry['max_seconds'], seconds)
+            self._trace({'phase': phase, 'ts': time() - seconds, 'seconds': seconds})
+
+    # to the trace of the task of the current thread, if any, under self.lock
+    def _trace(self, record: Dict[str, Any]):
+        task_id = getattr(self.local, 'task_id', None)
+        trace = self.traces.get(task_id) if task_id is not None else None
+        if trace is not None:
+            record['thread'] = threading.current_thread().name
+            trace.write(json.dumps(record))
+            trace.write('\n')
+            trace.flush()
@@ -0,0 +1,199 @@
+import re
+import json
+import logging
+import threading
+from base64 import b64decode
+from queue import Queue, Empty
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import trio
+from trio_websocket import open_websocket_url
+
+__all__ = [
+    'CapturedResponse',
+    'NetworkCapture',
+    'start_capture',
+]
+
+
+@dataclass
+class CapturedResponse:
+    url: str
+    status: int
+    body: Any
+
+
+# Records the JSON responses a page fetches by itself for the urls matching url_pattern,
+# over the WebDriver BiDi connection of a browser launched with DriverPool(bidi=True).
+# Bodies are kept by a network data collector, which needs Firefox 143 or later,
+# start() raises on a browser without one.
+class NetworkCapture:
+    def __init__(self, driver, url_pattern: str, timeout: float = 10, max_body_size: int = 16 * 1024 * 1024) -> None:
+        self.logger = logging.getLogger(name='NetworkCapture')
+
+        self.driver = driver
+        self.url_regex = re.compile(url_pattern)
+        self.timeout = timeout
+        self.max_body_size = max_body_size
+
+        self.responses: Queue[CapturedResponse] = Queue()
+        self.ready = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.trio_token: Optional[trio.lowlevel.TrioToken] = None
+        self.cancel_scope: Optional[trio.CancelScope] = None
+        self.error: Optional[BaseException] = None
+
+        # bidi commands in flight, by id
+        self.websocket = None
+        self.next_command_id = 0
+        self.waiters: Dict[int, trio.MemorySendChannel] = {}
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='NetworkCapture', daemon=True)
+        self.thread.start()
+        if not self.ready.wait(timeout=self.timeout) or self.trio_token is None:
+            raise RuntimeError(f"network capture failed to start: {self.error!r}")
+
+    def stop(self):
+        if self.trio_token is not None:
+            try:
+                self.trio_token.run_sync_soon(self.cancel_scope.cancel)
+            except trio.RunFinishedError:
+                pass
+        if self.thread is not None:
+            self.thread.join(timeout=self.timeout)
+        self.trio_token = None
+
+    # the responses captured since the last call, oldest first
+    def drain(self) -> List[CapturedResponse]:
+        responses = []
+        while True:
+            try:
+                responses.append(self.responses.get_nowait())
+            except Empty:
+                return responses
+
+    # like drain(), but waits up to timeout seconds for the first response
+    def wait(self, timeout: float) -> List[CapturedResponse]:
+        try:
+            responses = [self.responses.get(timeout=timeout)]
+        except Empty:
+            return []
+        return responses + self.drain()
+
+    def __enter__(self) -> 'NetworkCapture':
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        try:
+            trio.run(self._listen)
+        except Exception as e:
+            self.error = e
+            self.logger.warning(msg=f"network capture stopped: {e!r}")
+        finally:
+            self.ready.set()
+
+    async def _listen(self):
+        url = self.driver.capabilities.get('webSocketUrl')
+        if not isinstance(url, str):
+            raise RuntimeError("the browser has no webdriver bidi connection, launch it with DriverPool(bidi=True)")
+
+        # base64 bodies are a third larger
+        async with open_websocket_url(url, max_message_size=2 * self.max_body_size) as self.websocket:
+            async with trio.open_nursery() as nursery:
+                # bodies are fetched one at a time in the order the responses completed
+                send_completed, receive_completed = trio.open_memory_channel(1024)
+                nursery.start_soon(self._read, send_completed)
+
+                collector = (await self._command('network.addDataCollector', {
+                    'dataTypes': ['response'],
+                    'maxEncodedDataSize': self.max_body_size,
+                }))['collector']
+                subscription = await self._command('session.subscribe', {'events': ['network.responseCompleted']})
+
+                # stop() only cancels the fetch loop, the reader stays up for the cleanup
+                with trio.CancelScope() as self.cancel_scope:
+                    self.trio_token = trio.lowlevel.current_trio_token()
+                    self.ready.set()
+                    async for request_id, response in receive_completed:
+                        body = await self._response_body(collector, request_id, response)
+                        if body is not None:
+                            self.responses.put(CapturedResponse(url=response['url'], status=response['status'], body=body))
+
+                # the collector and the subscription outlive this connection otherwise
+                try:
+                    with trio.move_on_after(self.timeout):
+                        if 'subscription' in subscription:
+                            await self._command('session.unsubscribe', {'subscriptions': [subscription['subscription']]})
+                        else:
+                            await self._command('session.unsubscribe', {'events': ['network.responseCompleted']})
+                        await self._command('network.removeDataCollector', {'collector': collector})
+                except Exception as e:
+                    self.logger.warning(msg=f"network capture cleanup failed: {e!r}")
+                nursery.cancel_scope.cancel()
+
+    # dispatches command results to their waiters and the matching completed responses to the fetch loop
+    async def _read(self, send_completed: trio.MemorySendChannel):
+        while True:
+            message = json.loads(await self.websocket.get_message())
+            if message.get('id') is not None:
+                waiter = self.waiters.pop(message['id'], None)
+                if waiter is not None:
+                    waiter.send_nowait(message)
+            elif message.get('method') == 'network.responseCompleted':
+                params = message['params']
+                response = params['response']
+                if self.url_regex.search(response['url']) and 'json' in (response.get('mimeType') or ''):
+                    # never blocks, command results come in on this loop too
+                    try:
+                        send_completed.send_nowait((params['request']['request'], response))
+                    except trio.WouldBlock:
+                        self.logger.warning(msg=f"too many bodies to fetch, {response['url']} dropped")
+
+    async def _command(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        self.next_command_id += 1
+        command_id = self.next_command_id
+        send_result, receive_result = trio.open_memory_channel(1)
+        self.waiters[command_id] = send_result
+        await self.websocket.send_message(json.dumps({'id': command_id, 'method': method, 'params': params}))
+        message = await receive_result.receive()
+        if message.get('type') == 'error':
+            raise RuntimeError(f"{method} failed: {message.get('error')}: {message.get('message')}")
+        return message['result']
+
+    async def _response_body(self, collector: str, request_id: str, response: Dict[str, Any]) -> Optional[Any]:
+        try:
+            data = (await self._command('network.getData', {
+                'dataType': 'response',
+                'collector': collector,
+                'request': request_id,
+                # the browser frees the body once read
+                'disown': True,
+            }))['bytes']
+            body = b64decode(data['value']) if data['type'] == 'base64' else data['value']
+            return json.loads(body)
+        except Exception as e:
+            self.logger.warning(msg=f"no body for {response['url']}: {e!r}")
+            return None
+
+
+# a started capture of driver, or None once the browser turned out unable to capture, e.g. a
+# Firefox older than 143 without data collectors, so the caller reads the page instead.
+# Such a browser is not tried again
+def start_capture(driver, url_pattern: str, logger: Optional[logging.Logger] = None) -> Optional[NetworkCapture]:
+    if getattr(driver, 'spiders_no_capture', False):
+        return None
+    capture = NetworkCapture(driver, url_pattern)
+    try:
+        capture.start()
+    except Exception as e:
+        capture.stop()
+        driver.spiders_no_capture = True
+        (logger or capture.logger).warning(msg=f"no network capture, pages are read from the DOM: {e!r}")
+        return None
+    return capture
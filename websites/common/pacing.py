@@ -0,0 +1,138 @@
+import random
+import logging
+import threading
+from time import monotonic, sleep
+from dataclasses import dataclass, field
+from typing import Dict
+
+__all__ = [
+    'Pacer',
+    'wait_until',
+    'wait_network_idle',
+    'is_challenge_page',
+]
+
+
+@dataclass
+class DomainBudget:
+    tokens: float = field(default=0)
+    refill_ts: float = field(default=0)
+    next_ts: float = field(default=0)
+    backoff: float = field(default=1)
+
+
+# token bucket per domain, stretched by a backoff factor on slow loads and challenge pages
+class Pacer:
+    def __init__(
+        self,
+        rate: float = 0.5,
+        burst: int = 4,
+        min_interval: float = 1,
+        jitter: float = 0.3,
+        slow_threshold: float = 10,
+        max_backoff: float = 32,
+    ) -> None:
+        assert rate > 0 and burst > 0
+        self.logger = logging.getLogger(name='Pacer')
+
+        self.rate = rate
+        self.burst = burst
+        self.min_interval = min_interval
+        self.jitter = jitter
+        self.slow_threshold = slow_threshold
+        self.max_backoff = max_backoff
+
+        self.lock = threading.Lock()
+        self.budgets: Dict[str, DomainBudget] = {}
+
+    # blocks until a request to domain is within budget, returns the seconds waited
+    def acquire(self, domain: str) -> float:
+        with self.lock:
+            now = monotonic()
+            budget = self.budgets.get(domain)
+            if budget is None:
+                budget = self.budgets[domain] = DomainBudget(tokens=self.burst, refill_ts=now, next_ts=now)
+
+            rate = self.rate / budget.backoff
+            budget.tokens = min(self.burst, budget.tokens + (now - budget.refill_ts) * rate)
+            budget.refill_ts = now
+
+            # reserve the slot now, concurrent callers queue up behind it
+            ts = max(now, budget.next_ts)
+            if budget.tokens < 1:
+                ts = max(ts, now + (1 - budget.tokens) / rate)
+            ts += random.uniform(0, self.jitter) * self.min_interval * budget.backoff
+            budget.tokens -= 1
+            budget.next_ts = ts + self.min_interval * budget.backoff
+
+        delay = max(0, ts - monotonic())
+        sleep(delay)
+        return delay
+
+    # feeds back how long a page took to become ready and whether it was a challenge page
+    def report(self, domain: str, elapsed: float, challenged: bool = False):
+        with self.lock:
+            budget = self.budgets.setdefault(domain, DomainBudget(tokens=self.burst, refill_ts=monotonic()))
+            if challenged:
+                budget.backoff = min(self.max_backoff, budget.backoff * 4)
+            elif elapsed > self.slow_threshold:
+                budget.backoff = min(self.max_backoff, budget.backoff * 1.5)
+            else:
+                budget.backoff = max(1, budget.backoff * 0.9)
+            backoff = budget.backoff
+
+        if challenged or elapsed > self.slow_threshold:
+            self.logger.warning(msg=f"{domain} {'challenged' if challenged else f'slow ({elapsed:.1f}s)'}, backoff x{backoff:.1f}")
+
+    def backoff_of(self, domain: str) -> float:
+        with self.lock:
+            budget = self.budgets.get(domain)
+            return budget.backoff if budget is not None else 1
+
+
+# polls a JS predicate until it returns true, False on timeout
+def wait_until(driver, script: str, *args, timeout: float = 10, poll: float = 0.25) -> bool:
+    deadline = monotonic() + timeout
+    while True:
+        if driver.execute_script(script, *args):
+            return True
+        if monotonic() >= deadline:
+            return False
+        sleep(poll)
+
+
+# true once no resource finished loading for arguments[0] ms
+NETWORK_IDLE_JS = """
+if (window.__spidersNetwork === undefined) {
+    performance.setResourceTimingBufferSize(100000);
+    window.__spidersNetwork = { count: -1, ts: 0 };
+}
+const count = performance.getEntriesByType('resource').length;
+const now = performance.now();
+if (count !== window.__spidersNetwork.count) {
+    window.__spidersNetwork.count = count;
+    window.__spidersNetwork.ts = now;
+}
+return document.readyState === 'complete' && now - window.__spidersNetwork.ts >= arguments[0];
+"""
+
+
+def wait_network_idle(driver, idle: float = 0.5, timeout: float = 10) -> bool:
+    return wait_until(driver, NETWORK_IDLE_JS, int(idle * 1000), timeout=timeout)
+
+
+# challenge pages are short, so only look at the body text of short pages
+CHALLENGE_JS = """
+const body = document.body ? document.body.innerText : '';
+const text = (document.title + ' ' + (body.length < 3000 ? body : '')).toLowerCase();
+return ['captcha', 'are you a robot', 'access denied', 'just a moment', 'unusual traffic', 'too many requests']
+    .some((marker) => text.includes(marker))
+    || document.querySelector('iframe[src*=captcha], #challenge-form, #cf-challenge-running') !== null;
+"""
+
+
+def is_challenge_page(driver) -> bool:
+    try:
+        return bool(driver.execute_script(CHALLENGE_JS))
+    except Exception:
+        return False
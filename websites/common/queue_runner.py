@@ -0,0 +1,106 @@
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from common.checkpoint import CheckpointStore
+from common.driver_pool import DriverPool
+from common.log_pipeline import LogPipeline
+from common.metrics import Metrics
+from common.task_queue import TaskQueue, QueuedTask, QueueWorker
+
+__all__ = [
+    'QueueRunner',
+]
+
+
+# runs the tasks of one site from a TaskQueue with resume, one scraper per task over one shared
+# browser pool. Sites build their tasks and scrapers in `create_scraper` and report with `summarize`
+class QueueRunner:
+    def __init__(
+        self,
+        queue: TaskQueue,
+        site: str,
+        num_workers: int = 1,
+        num_drivers: int = 1,
+        bidi: bool = False,
+        worker_id: Optional[str] = None,
+        wait: bool = True,
+        headless: bool = False,
+        verbose: bool = True,
+        **scraper_kwargs,
+    ) -> None:
+        # the scrapers of the tasks log through the same pipeline
+        self.log_pipeline = scraper_kwargs.setdefault('log_pipeline', LogPipeline.shared())
+        self.logger = logging.getLogger(name=type(self).__name__)
+        self.logger.setLevel(logging.INFO)
+        self.verbose = verbose
+        self.log_pipeline.attach(self.logger, console=verbose)
+        self.log_pipeline.attach(logging.getLogger(name='QueueWorker'), console=verbose)
+
+        self.queue = queue
+        self.site = site
+        self.worker = QueueWorker(
+            queue,
+            site=site,
+            run_task=self._run_task,
+            progress=self._progress,
+            num_workers=num_workers,
+            worker_id=worker_id,
+            wait=wait,
+        )
+
+        self.scraper_kwargs = scraper_kwargs
+        self.scraper_kwargs.setdefault('checkpoint', CheckpointStore())
+        # one snapshot for all the tasks run here
+        self.scraper_kwargs.setdefault('metrics', Metrics(name=f'{site}_search'))
+        self.owns_driver_pool = 'driver_pool' not in scraper_kwargs
+        if self.owns_driver_pool:
+            self.scraper_kwargs['driver_pool'] = DriverPool(max_num_drivers=num_drivers, headless=headless, bidi=bidi)
+
+        self.lock = threading.Lock()
+        self.scraper_map: Dict[str, Any] = {}
+
+    def run(self):
+        try:
+            self.worker.run()
+        finally:
+            if self.owns_driver_pool:
+                self.scraper_kwargs['driver_pool'].close()
+        self.logger.info(msg=f"queue drained: {self.queue.stats(self.site)}")
+
+    # returns the task of payload and a scraper running only that task
+    def create_scraper(self, payload: Dict[str, Any]):
+        raise NotImplementedError
+
+    # progress of a task, sent along with the heartbeats and in the result of the task
+    def summarize(self, result) -> Dict[str, Any]:
+        return {'num_items': result.num_items, 'num_known_items': result.num_known_items}
+
+    def _run_task(self, queued: QueuedTask) -> Dict[str, Any]:
+        with self.lock:
+            task, scraper = self.create_scraper(queued.payload)
+            self.scraper_map[task.id] = scraper
+
+        try:
+            scraper.run(resume=True)
+        finally:
+            with self.lock:
+                del self.scraper_map[task.id]
+
+        if task.id in scraper.failed_task_ids:
+            raise RuntimeError(f"task {task.id} failed, see logs/{task.id}.log on {queued.worker_id}")
+        result = scraper.result_map[task.id]
+        return {
+            'worker_id': queued.worker_id,
+            'path': f'results/{task.id}.jsonl',
+            **self.summarize(result),
+            'launch_ts': result.launch_ts,
+            'finish_ts': result.finish_ts,
+        }
+
+    def _progress(self, queued: QueuedTask) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            scraper = self.scraper_map.get(queued.id)
+        if scraper is None:
+            return None
+        return self.summarize(scraper.result_map[queued.id])
@@ -0,0 +1,160 @@
+import os
+import json
+import random
+import threading
+from time import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from selenium.common.exceptions import (
+    InvalidSessionIdException,
+    NoSuchWindowException,
+    StaleElementReferenceException,
+    TimeoutException,
+    WebDriverException,
+)
+from urllib3.exceptions import MaxRetryError, ProtocolError
+
+__all__ = [
+    'ChallengeError',
+    'classify_error',
+    'RetryPolicy',
+    'RetryBudget',
+    'TaskQuarantine',
+]
+
+
+# raised when a page is still a challenge page after its retries
+class ChallengeError(Exception):
+    pass
+
+
+# what geckodriver answers once the browser behind a session is gone
+CRASH_MESSAGES = [
+    'invalid session id',
+    'session deleted',
+    'browsing context has been discarded',
+    'failed to decode response from marionette',
+    'tried to run command without establishing a connection',
+    'connection refused',
+]
+
+# what firefox answers when a page failed to load, e.g. Reached error page: about:neterror?e=dnsNotFound
+NETWORK_MESSAGES = [
+    'about:neterror',
+    'dnsnotfound',
+    'connectionfailure',
+    'nettimeout',
+    'netreset',
+    'netinterrupt',
+    'proxyconnectfailure',
+]
+
+
+# kind of a scrape failure: 'timeout', 'stale', 'challenge', 'crash' for a
+# browser which is gone, 'network' for a page which failed to load, or 'other'
+def classify_error(error: BaseException) -> str:
+    if isinstance(error, ChallengeError):
+        return 'challenge'
+    if isinstance(error, StaleElementReferenceException):
+        return 'stale'
+    if isinstance(error, TimeoutException):
+        return 'timeout'
+    # the driver process is unreachable
+    if isinstance(error, (InvalidSessionIdException, NoSuchWindowException, ConnectionError, MaxRetryError, ProtocolError)):
+        return 'crash'
+    if isinstance(error, WebDriverException):
+        message = (error.msg or '').lower()
+        if any(crash_message in message for crash_message in CRASH_MESSAGES):
+            return 'crash'
+        if any(network_message in message for network_message in NETWORK_MESSAGES):
+            return 'network'
+    return 'other'
+
+
+@dataclass
+class RetryPolicy:
+    # retries of one page or scroll per kind of error, 'other' errors are
+    # mostly bugs and retrying them only burns time
+    max_num_retries: Dict[str, int] = field(default_factory=lambda: {
+        'timeout': 2,
+        'stale': 3,
+        'challenge': 1,
+        'crash': 2,
+        'network': 3,
+        'other': 0,
+    })
+    # retries of one task over all its pages or scrolls
+    max_num_task_retries: int = 10
+    # seconds before the n-th retry, doubling up to max_backoff, with jitter
+    backoff: float = 2
+    max_backoff: float = 60
+
+    def delay(self, num_retries: int) -> float:
+        return min(self.backoff * 2 ** num_retries, self.max_backoff) * random.uniform(0.5, 1)
+
+
+# retries left to one task, `attempts` is a dict the caller starts empty for every page or scroll
+class RetryBudget:
+    def __init__(self, policy: RetryPolicy) -> None:
+        self.policy = policy
+        self.lock = threading.Lock()
+        self.num_retries = 0
+
+    # seconds to wait before retrying the step which raised error, None once out of retries
+    def retry(self, error: BaseException, attempts: Dict[str, int]) -> Optional[float]:
+        kind = classify_error(error)
+        num_attempts = attempts.get(kind, 0)
+        with self.lock:
+            if num_attempts >= self.policy.max_num_retries.get(kind, 0) or self.num_retries >= self.policy.max_num_task_retries:
+                return None
+            self.num_retries += 1
+        attempts[kind] = num_attempts + 1
+        return self.policy.delay(num_attempts)
+
+
+# tasks which failed in `max_num_failures` runs in a row, skipped by the scrapers until `release`
+class TaskQuarantine:
+    def __init__(self, path: str = 'checkpoints/quarantine.json', max_num_failures: int = 3) -> None:
+        assert max_num_failures > 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.max_num_failures = max_num_failures
+
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                self.entries = json.loads(file.read())
+
+    def __contains__(self, task_id: str) -> bool:
+        with self.lock:
+            entry = self.entries.get(task_id)
+            return entry is not None and entry['num_failures'] >= self.max_num_failures
+
+    def tasks(self) -> Dict[str, Dict[str, Any]]:
+        with self.lock:
+            return {task_id: dict(entry) for task_id, entry in self.entries.items()}
+
+    # counts a failed run of task_id, True if the task is in quarantine now
+    def record_failure(self, task_id: str, error: str) -> bool:
+        with self.lock:
+            entry = self.entries.setdefault(task_id, {'num_failures': 0})
+            entry['num_failures'] += 1
+            entry['error'] = error
+            entry['ts'] = time()
+            self._save()
+            return entry['num_failures'] >= self.max_num_failures
+
+    def record_success(self, task_id: str):
+        self.release(task_id)
+
+    def release(self, task_id: str):
+        with self.lock:
+            if self.entries.pop(task_id, None) is not None:
+                self._save()
+
+    def _save(self):
+        with open(f'{self.path}.tmp', 'w', encoding='utf-8') as file:
+            file.write(json.dumps(self.entries, ensure_ascii=False))
+        os.replace(f'{self.path}.tmp', self.path)
@@ -0,0 +1,56 @@
+import os
+import json
+from typing import Any, Dict, IO, Iterable, Iterator, Optional
+from dataclasses import asdict, is_dataclass
+
+__all__ = [
+    'JsonlResultWriter',
+    'read_records',
+]
+
+
+# append-only result sink, one JSON record per line, so saving costs O(new items)
+class JsonlResultWriter:
+    def __init__(self, path: str, mode: str = 'a') -> None:
+        assert mode in ['a', 'w']
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.file: Optional[IO[str]] = open(path, mode, encoding='utf-8')
+
+    def write(self, type: str, **fields: Any):
+        record = {'type': type}
+        for key, value in fields.items():
+            record[key] = asdict(value) if is_dataclass(value) else value
+        self.file.write(json.dumps(record, ensure_ascii=False))
+        self.file.write('\n')
+
+    def write_items(self, items: Iterable[Any], **fields: Any):
+        for item in items:
+            self.write('item', item=item, **fields)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self) -> 'JsonlResultWriter':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # a crash may leave the last line half written
+                break
@@ -0,0 +1,96 @@
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+__all__ = [
+    'PriceBands',
+    'Choices',
+    'ShardPlanner',
+]
+
+
+# a shard is the query params it adds to the logical search
+Shard = Dict[str, Any]
+
+
+# splits at `edges` without a price range and halves a range, down to `min_width`
+class PriceBands:
+    def __init__(self, min_key: str, max_key: str, edges: List[Optional[int]], min_width: int = 1) -> None:
+        assert len(edges) > 1
+        self.min_key = min_key
+        self.max_key = max_key
+        self.edges = edges
+        self.min_width = min_width
+
+    def split(self, shard: Shard) -> List[Shard]:
+        if self.min_key not in shard:
+            return [self._band(shard, lo, hi) for lo, hi in zip(self.edges, self.edges[1:])]
+
+        lo, hi = shard[self.min_key], shard.get(self.max_key)
+        if hi is None:
+            mid = max(lo * 2, lo + self.min_width)
+        elif hi - lo >= 2 * self.min_width:
+            mid = (lo + hi) // 2
+        else:
+            return []
+        return [self._band(shard, lo, mid), self._band(shard, mid, hi)]
+
+    def _band(self, shard: Shard, lo: int, hi: Optional[int]) -> Shard:
+        band = dict(shard)
+        band[self.min_key] = lo
+        band.pop(self.max_key, None)
+        if hi is not None:
+            band[self.max_key] = hi
+        return band
+
+
+# splits a shard into one shard per value of a facet, e.g. a condition or
+# a brand, unless the facet is set already
+class Choices:
+    def __init__(self, key: str, values: List[Any]) -> None:
+        self.key = key
+        self.values = values
+
+    def split(self, shard: Shard) -> List[Shard]:
+        if self.key in shard or len(self.values) == 0:
+            return []
+        return [{**shard, self.key: value} for value in self.values]
+
+
+# splits capped shards by the first splitter that applies, round after round
+# NOTE: shards overlap with their parent, merge results by item id
+class ShardPlanner:
+    def __init__(self, splitters: List[Any], max_num_shards: int = 256) -> None:
+        self.logger = logging.getLogger(name='ShardPlanner')
+        self.splitters = splitters
+        self.max_num_shards = max_num_shards
+
+    def split(self, shard: Shard) -> List[Shard]:
+        for splitter in self.splitters:
+            children = splitter.split(shard)
+            if len(children) > 0:
+                return children
+        return []
+
+    # returns every shard that ran, in order
+    def run(self, run_shards: Callable[[List[Shard]], List[bool]], root: Optional[Shard] = None) -> List[Shard]:
+        shards: List[Shard] = []
+        frontier = [dict(root or {})]
+        while len(frontier) > 0:
+            frontier = frontier[:self.max_num_shards - len(shards)]
+            capped = run_shards(frontier)
+            shards.extend(frontier)
+
+            next_frontier = []
+            for shard, is_capped in zip(frontier, capped):
+                if not is_capped:
+                    continue
+                children = self.split(shard)
+                if len(children) == 0:
+                    self.logger.warning(msg=f"shard {shard} is capped and cannot be split further")
+                next_frontier.extend(children)
+
+            if len(next_frontier) > 0 and len(shards) >= self.max_num_shards:
+                self.logger.warning(msg=f"stop splitting after {len(shards)} shards")
+                break
+            frontier = next_frontier
+        return shards
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+from queue import Queue, Full, Empty
+from typing import Any, AsyncIterator, Iterable, Iterator, Optional
+
+__all__ = [
+    'StreamClosed',
+    'ItemStream',
+]
+
+
+# raised in the scraper when the consumer of an ItemStream went away
+class StreamClosed(Exception):
+    pass
+
+
+# marks the end of a stream in the buffer
+_END = object()
+
+
+# bounded hand-over of saved items to a `for` or `async for` consumer,
+# the error the task failed with is raised once the items before it are taken
+class ItemStream:
+    def __init__(self, max_num_buffered: int = 256, poll_interval: float = 0.5) -> None:
+        assert max_num_buffered > 0
+        self.buffer: Queue = Queue(maxsize=max_num_buffered)
+        self.poll_interval = poll_interval
+        self.closed = threading.Event()
+        self.error: Optional[BaseException] = None
+
+    def put(self, items: Iterable[Any]):
+        for item in items:
+            self._put(item)
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.error = error
+        try:
+            self._put(_END)
+        except StreamClosed:
+            pass
+
+    def close(self):
+        self.closed.set()
+        # unblock a scraper waiting on a full buffer
+        while True:
+            try:
+                self.buffer.get_nowait()
+            except Empty:
+                break
+        # and a consumer thread still waiting for the next item
+        try:
+            self.buffer.put_nowait(_END)
+        except Full:
+            pass
+
+    def __iter__(self) -> Iterator[Any]:
+        while True:
+            item = self.buffer.get()
+            if item is _END:
+                break
+            yield item
+        if self.error is not None:
+            raise self.error
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        while True:
+            # the event loop keeps running while a thread waits for the scraper
+            item = await asyncio.to_thread(self.buffer.get)
+            if item is _END:
+                break
+            yield item
+        if self.error is not None:
+            raise self.error
+
+    def _put(self, item: Any):
+        while True:
+            if self.closed.is_set():
+                raise StreamClosed()
+            try:
+                self.buffer.put(item, timeout=self.poll_interval)
+                return
+            except Full:
+                continue
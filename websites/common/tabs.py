@@ -0,0 +1,143 @@
+import logging
+from collections import deque
+from time import monotonic, sleep
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+from typing import Any, Deque, List, Optional, Tuple
+
+from selenium.common.exceptions import WebDriverException
+
+from common.pacing import Pacer, is_challenge_page
+from common.driver_pool import DriverPool
+
+__all__ = [
+    'BackgroundTabs',
+]
+
+
+@dataclass
+class TabJob:
+    key: Any
+    url: str
+    ts: float
+
+
+# the previous document of a tab is marked stale before navigating away, so it
+# is never mistaken for the page being loaded
+STALE_CHECK_JS = "if (window.__spidersStale === true) return null;\n"
+
+
+# loads pages in up to `max_num_tabs` extra tabs while the caller keeps its own tab,
+# `extract_js` returns null until the page is ready
+class BackgroundTabs:
+    def __init__(
+        self,
+        driver,
+        extract_js: str,
+        max_num_tabs: int = 4,
+        timeout: float = 20,
+        pacer: Optional[Pacer] = None,
+        driver_pool: Optional[DriverPool] = None,
+    ) -> None:
+        assert max_num_tabs > 0
+        self.logger = logging.getLogger(name='BackgroundTabs')
+
+        self.driver = driver
+        self.extract_js = STALE_CHECK_JS + extract_js
+        self.max_num_tabs = max_num_tabs
+        self.timeout = timeout
+        self.pacer = pacer
+        self.driver_pool = driver_pool
+
+        self.home_handle = driver.current_window_handle
+        self.idle_handles: List[str] = []
+        self.jobs = {}
+        self.queue: Deque[TabJob] = deque()
+
+    def __len__(self) -> int:
+        return len(self.queue) + len(self.jobs)
+
+    def pending(self) -> List[Any]:
+        return [job.key for job in self.queue] + [job.key for job in self.jobs.values()]
+
+    def submit(self, key: Any, url: str):
+        self.queue.append(TabJob(key=key, url=url, ts=0))
+
+    # returns (key, extracted) of the pages done since the last call and
+    # starts loading queued pages in the tabs freed up
+    def poll(self) -> List[Tuple[Any, Any]]:
+        done = []
+        try:
+            for handle, job in list(self.jobs.items()):
+                self.driver.switch_to.window(handle)
+                try:
+                    extracted = self.driver.execute_script(self.extract_js)
+                except WebDriverException:
+                    # the document is being replaced
+                    extracted = None
+                elapsed = monotonic() - job.ts
+                if extracted is None and elapsed < self.timeout:
+                    continue
+
+                challenged = extracted is None and is_challenge_page(self.driver)
+                if self.pacer is not None:
+                    self.pacer.report(urlsplit(job.url).netloc, elapsed, challenged=challenged)
+                if extracted is None:
+                    self.logger.warning(msg=f"{job.url} not ready after {elapsed:.1f}s{', challenged' if challenged else ''}")
+
+                del self.jobs[handle]
+                self.idle_handles.append(handle)
+                done.append((job.key, extracted))
+
+            while self.queue and (self.idle_handles or len(self.jobs) < self.max_num_tabs):
+                self._load(self.queue.popleft())
+        finally:
+            self.driver.switch_to.window(self.home_handle)
+        return done
+
+    # waits for every submitted page
+    def drain(self, poll: float = 0.25) -> List[Tuple[Any, Any]]:
+        done = self.poll()
+        while len(self) > 0:
+            sleep(poll)
+            done.extend(self.poll())
+        return done
+
+    # moves to another driver, e.g. after the browser crashed. Pages which
+    # were loading are loaded again in the tabs of the new driver
+    def reset(self, driver):
+        self.queue.extendleft(reversed(list(self.jobs.values())))
+        self.jobs = {}
+        self.idle_handles = []
+        self.driver = driver
+        self.home_handle = driver.current_window_handle
+
+    def close(self):
+        try:
+            for handle in self.idle_handles + list(self.jobs.keys()):
+                self.driver.switch_to.window(handle)
+                self.driver.close()
+        finally:
+            self.idle_handles = []
+            self.jobs = {}
+            self.queue.clear()
+            self.driver.switch_to.window(self.home_handle)
+
+    def _load(self, job: TabJob):
+        if self.idle_handles:
+            handle = self.idle_handles.pop()
+            self.driver.switch_to.window(handle)
+            self.driver.execute_script("window.__spidersStale = true;")
+        else:
+            self.driver.switch_to.new_window('tab')
+            handle = self.driver.current_window_handle
+
+        if self.pacer is not None:
+            self.pacer.acquire(urlsplit(job.url).netloc)
+        if self.driver_pool is not None:
+            self.driver_pool.count_page(self.driver)
+
+        # unlike get(), this returns right away and the tab loads in the background
+        self.driver.execute_script("window.location.href = arguments[0];", job.url)
+        job.ts = monotonic()
+        self.jobs[handle] = job
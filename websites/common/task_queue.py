@@ -0,0 +1,257 @@
+import os
+import json
+import socket
+import sqlite3
+import logging
+import threading
+from time import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+__all__ = [
+    'QueuedTask',
+    'TaskQueue',
+    'QueueWorker',
+]
+
+
+@dataclass
+class QueuedTask:
+    site: str
+    id: str
+    payload: Dict[str, Any]
+    worker_id: str
+    num_attempts: int
+
+
+# backlog of scrape tasks shared by every node through one SQLite file, expired leases are claimed again
+# NOTE: the file system has to honour fcntl locks
+class TaskQueue:
+    def __init__(self, path: str = 'queue/tasks.db', lease: float = 120, max_num_attempts: int = 3) -> None:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.lease = lease
+        self.max_num_attempts = max_num_attempts
+
+        self.lock = threading.Lock()
+        # transactions are opened by hand, claims need BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.executescript("""
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS tasks (
+                site TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                worker_id TEXT,
+                lease_until REAL,
+                num_attempts INTEGER NOT NULL DEFAULT 0,
+                enqueue_ts REAL NOT NULL,
+                finish_ts REAL,
+                progress TEXT,
+                result TEXT,
+                error TEXT,
+                PRIMARY KEY (site, task_id)
+            );
+            CREATE INDEX IF NOT EXISTS tasks_status ON tasks (site, status, enqueue_ts);
+        """)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    # enqueues a task, False if it was enqueued before, whatever its status
+    def put(self, site: str, task_id: str, payload: Dict[str, Any]) -> bool:
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO tasks (site, task_id, payload, status, enqueue_ts) VALUES (?, ?, ?, 'pending', ?)",
+                (site, task_id, json.dumps(payload, ensure_ascii=False), time())
+            )
+            return cursor.rowcount > 0
+
+    # leases the oldest pending or expired task of site to worker_id, None if there is none
+    def claim(self, site: str, worker_id: str) -> Optional[QueuedTask]:
+        now = time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                # tasks out of attempts are given up on the way
+                self.conn.execute(
+                    "UPDATE tasks SET status = 'failed', finish_ts = ?, error = COALESCE(error, 'lease expired') "
+                    "WHERE site = ? AND status = 'leased' AND lease_until < ? AND num_attempts >= ?",
+                    (now, site, now, self.max_num_attempts)
+                )
+                row = self.conn.execute(
+                    "SELECT task_id, payload, num_attempts FROM tasks "
+                    "WHERE site = ? AND (status = 'pending' OR (status = 'leased' AND lease_until < ?)) "
+                    "ORDER BY enqueue_ts LIMIT 1",
+                    (site, now)
+                ).fetchone()
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    return None
+
+                task_id, payload, num_attempts = row
+                self.conn.execute(
+                    "UPDATE tasks SET status = 'leased', worker_id = ?, lease_until = ?, num_attempts = ? "
+                    "WHERE site = ? AND task_id = ?",
+                    (worker_id, now + self.lease, num_attempts + 1, site, task_id)
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        return QueuedTask(site=site, id=task_id, payload=json.loads(payload), worker_id=worker_id, num_attempts=num_attempts + 1)
+
+    # extends the lease of task, False if the lease was lost to another worker
+    def heartbeat(self, task: QueuedTask, progress: Optional[Dict[str, Any]] = None) -> bool:
+        return self._update_leased(
+            task,
+            "lease_until = ?, progress = COALESCE(?, progress)",
+            (time() + self.lease, json.dumps(progress) if progress is not None else None)
+        )
+
+    def complete(self, task: QueuedTask, result: Optional[Dict[str, Any]] = None) -> bool:
+        return self._update_leased(
+            task,
+            "status = 'done', lease_until = NULL, finish_ts = ?, result = ?",
+            (time(), json.dumps(result) if result is not None else None)
+        )
+
+    # puts task back in the queue, or gives up on it once out of attempts or without retry
+    def fail(self, task: QueuedTask, error: str, retry: bool = True) -> bool:
+        give_up = not retry or task.num_attempts >= self.max_num_attempts
+        return self._update_leased(
+            task,
+            "status = ?, lease_until = NULL, finish_ts = ?, error = ?",
+            ('failed' if give_up else 'pending', time() if give_up else None, error)
+        )
+
+    # number of tasks per status, a lapsed lease counts as pending
+    def stats(self, site: Optional[str] = None) -> Dict[str, int]:
+        now = time()
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT CASE WHEN status = 'leased' AND lease_until < ? THEN 'pending' ELSE status END, COUNT(*) "
+                "FROM tasks WHERE ? IS NULL OR site = ? GROUP BY 1",
+                (now, site, site)
+            ).fetchall()
+        return dict(rows)
+
+    def tasks(self, site: str, status: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT task_id, status, worker_id, num_attempts, progress, result, error FROM tasks "
+                "WHERE site = ? AND (? IS NULL OR status = ?) ORDER BY enqueue_ts",
+                (site, status, status)
+            ).fetchall()
+        return {
+            task_id: {
+                'status': status,
+                'worker_id': worker_id,
+                'num_attempts': num_attempts,
+                'progress': json.loads(progress) if progress is not None else None,
+                'result': json.loads(result) if result is not None else None,
+                'error': error,
+            }
+            for task_id, status, worker_id, num_attempts, progress, result, error in rows
+        }
+
+    # only the worker holding the lease may touch a leased task
+    def _update_leased(self, task: QueuedTask, assignments: str, params: tuple) -> bool:
+        with self.lock:
+            cursor = self.conn.execute(
+                f"UPDATE tasks SET {assignments} WHERE site = ? AND task_id = ? AND status = 'leased' AND worker_id = ?",
+                (*params, task.site, task.id, task.worker_id)
+            )
+            return cursor.rowcount > 0
+
+
+# claims and runs the tasks of one site, `num_workers` at a time, renewing leases while they run
+class QueueWorker:
+    def __init__(
+        self,
+        queue: TaskQueue,
+        site: str,
+        run_task: Callable[[QueuedTask], Optional[Dict[str, Any]]],
+        progress: Optional[Callable[[QueuedTask], Optional[Dict[str, Any]]]] = None,
+        num_workers: int = 1,
+        worker_id: Optional[str] = None,
+        heartbeat_interval: Optional[float] = None,
+        poll_interval: float = 10,
+        wait: bool = True,
+    ) -> None:
+        assert num_workers > 0
+        self.logger = logging.getLogger(name='QueueWorker')
+        self.logger.setLevel(logging.INFO)
+
+        self.queue = queue
+        self.site = site
+        self.run_task = run_task
+        self.progress = progress
+        self.num_workers = num_workers
+        # unique per process, a node runs as many workers as it likes
+        self.worker_id = worker_id if worker_id is not None else f'{socket.gethostname()}:{os.getpid()}'
+        self.heartbeat_interval = heartbeat_interval if heartbeat_interval is not None else queue.lease / 3
+        assert self.heartbeat_interval < queue.lease
+        self.poll_interval = poll_interval
+        self.wait = wait
+
+        self.stopped = threading.Event()
+
+    def run(self):
+        threads = [
+            threading.Thread(target=self._work, args=(f'{self.worker_id}/{worker_idx}',), name=f'QueueWorker-{worker_idx}')
+            for worker_idx in range(self.num_workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    # workers finish their current task, then exit
+    def stop(self):
+        self.stopped.set()
+
+    def _work(self, worker_id: str):
+        while not self.stopped.is_set():
+            task = self.queue.claim(self.site, worker_id)
+            if task is None:
+                if not self.wait or self.queue.stats(self.site).get('leased', 0) == 0:
+                    break
+                self.stopped.wait(self.poll_interval)
+                continue
+            self._run(task)
+
+    def _run(self, task: QueuedTask):
+        self.logger.info(msg=f"{task.worker_id} claimed task {task.id} (attempt {task.num_attempts})")
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(task, done), name=f'QueueHeartbeat-{task.id}', daemon=True)
+        heartbeat.start()
+        try:
+            result = self.run_task(task)
+        except Exception as e:
+            done.set()
+            heartbeat.join()
+            self.logger.exception(msg=f"task {task.id} failed on {task.worker_id}")
+            self.queue.fail(task, error=repr(e))
+            return
+
+        done.set()
+        heartbeat.join()
+        if not self.queue.complete(task, result=result):
+            self.logger.warning(msg=f"task {task.id} finished on {task.worker_id} after its lease was lost, result dropped")
+
+    def _heartbeat(self, task: QueuedTask, done: threading.Event):
+        while not done.wait(self.heartbeat_interval):
+            progress = None
+            if self.progress is not None:
+                try:
+                    progress = self.progress(task)
+                except Exception:
+                    self.logger.exception(msg=f"no progress of task {task.id}")
+            if not self.queue.heartbeat(task, progress=progress):
+                # the task keeps running, its result will be dropped
+                self.logger.warning(msg=f"lease of task {task.id} lost by {task.worker_id}")
+                return
@@ -0,0 +1,52 @@
+from typing import Any, Dict, List
+
+from models import (
+    MercariSearchItem,
+)
+
+__all__ = [
+    'parse_search_item',
+    'parse_search_items',
+]
+
+
+def _name_of(value: Any) -> str:
+    # most attributes come as {"id": ..., "name": ...}, some as plain strings
+    if isinstance(value, dict):
+        return value.get('name') or ''
+    return str(value) if value is not None else ""
+
+
+def _format_price(cents: Any) -> str:
+    if not isinstance(cents, int):
+        return str(cents) if cents is not None else ""
+    if cents % 100 == 0:
+        return f"${cents // 100:,}"
+    return f"${cents / 100:,.2f}"
+
+
+# search results carry every photo, img_urls is complete without the item page
+def parse_search_item(data: Dict[str, Any]) -> MercariSearchItem:
+    item = MercariSearchItem()
+    item.id = str(data.get('id', ''))
+    item.url = f"https://www.mercari.com/us/item/{item.id}"
+    item.status = data.get('status') or ''
+    item.price = _format_price(data.get('price'))
+    item.brand = _name_of(data.get('brand'))
+    item.condition = _name_of(data.get('itemCondition'))
+    item.category = _name_of(data.get('itemCategory')) or data.get('categoryTitle') or ''
+    item.color = _name_of(data.get('color'))
+    item.description = data.get('description') or data.get('name') or ''
+    item.decoration = (data.get('itemDecoration') or {}).get('text') or ''
+
+    for photo in data.get('photos') or []:
+        img_url = photo.get('imageUrl') or photo.get('thumbnail')
+        if img_url:
+            item.img_urls.append(img_url.split('?')[0].replace('thumb/', ''))
+
+    return item
+
+
+def parse_search_items(response: Dict[str, Any]) -> List[MercariSearchItem]:
+    search = (response.get('data') or {}).get('search') or {}
+    return [parse_search_item(data) for data in search.get('itemsList') or []]
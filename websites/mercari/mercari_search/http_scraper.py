@@ -0,0 +1,243 @@
+import os
+import sys
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+from api import parse_search_items
+from scraper import (
+    MERCARI_SORT_NEWEST,
+    DELTA_FIELDS,
+    sift_known_items,
+    save_items,
+    MercariSearchTask,
+    MercariSearchResult,
+    MercariSearchScraper,
+)
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from common.result_writer import JsonlResultWriter
+from common.downloader import ImageDownloader
+from common.item_index import ItemIndex
+from common.delta import DeltaTracker
+from common.checkpoint import CheckpointStore, MemoryCheckpointStore
+from common.pacing import Pacer
+from common.driver_pool import DriverPool
+from common.http_session import HttpSession, Blocked
+from common.log_pipeline import LogPipeline
+
+__all__ = [
+    'MercariSearchHttpScraper',
+]
+
+
+# MercariSearchTasks over the persisted search GraphQL query, blocked tasks go to MercariSearchScraper
+class MercariSearchHttpScraper:
+    def __init__(
+        self,
+        search_query_hash: str,
+        verbose: bool = True,
+        tasks: List[MercariSearchTask] = [],
+        page_size: int = 120,
+        max_num_threads: int = 4,
+        downloader: Optional[ImageDownloader] = None,
+        item_index: Optional[ItemIndex] = None,
+        checkpoint: Optional[CheckpointStore] = None,
+        pacer: Optional[Pacer] = None,
+        fallback: bool = True,
+        driver_pool: Optional[DriverPool] = None,
+        log_pipeline: Optional[LogPipeline] = None,
+    ) -> None:
+        self.log_pipeline = log_pipeline if log_pipeline is not None else LogPipeline.shared()
+        self.logger = logging.getLogger(name='MercariSearchHttpScraper')
+        self.logger.setLevel(logging.INFO)
+        self.log_pipeline.attach(self.logger, console=verbose)
+
+        self.tasks = list(tasks)
+        for task in self.tasks:
+            assert task.id is not None and len(task.id) > 0
+
+        ts = self._timestamp()
+        self.result_map = {
+            task.id: MercariSearchResult(task=task, commit_ts=ts, launch_ts=ts, finish_ts=ts, items=[])
+            for task in self.tasks
+        }
+
+        self.search_query_hash = search_query_hash
+        self.page_size = page_size
+        self.max_num_threads = max_num_threads
+        self.downloader = downloader
+        self.item_index = item_index
+        # without a store, progress is kept in memory for the browser to take over from
+        self.checkpoint = checkpoint if checkpoint is not None else MemoryCheckpointStore()
+        self.pacer = pacer if pacer is not None else Pacer()
+        # one session per origin of the tasks, see MercariSearchTask.base_url
+        self.sessions: Dict[str, HttpSession] = {}
+        self.sessions_lock = threading.Lock()
+
+        # blocked tasks go to the browser, launched only if that ever happens
+        self.fallback = fallback
+        self.driver_pool = driver_pool
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=self.max_num_threads, thread_name_prefix='MercariSearchHttpWorker') as executor:
+            list(executor.map(self._run_task, self.tasks))
+        for session in self.sessions.values():
+            session.close()
+
+    def _session(self, task: MercariSearchTask) -> HttpSession:
+        with self.sessions_lock:
+            session = self.sessions.get(task.base_url)
+            if session is None:
+                session = self.sessions[task.base_url] = HttpSession(
+                    base_url=task.base_url,
+                    pacer=self.pacer,
+                    pool_maxsize=self.max_num_threads,
+                    headers={'x-platform': 'web', 'apollo-require-preflight': 'true'},
+                )
+            return session
+
+    def _run_task(self, task: MercariSearchTask):
+        with self.log_pipeline.task(task.id):
+            try:
+                self._execute_task(task)
+            except (Blocked, requests.HTTPError) as e:
+                self.logger.warning(msg=f"task {task.id} blocked over http: {e}")
+                if self.fallback:
+                    self._fallback(task)
+            except Exception:
+                self.logger.exception(msg=f"task {task.id} failed")
+
+    def _search(self, task: MercariSearchTask, offset: int) -> dict:
+        criteria = {
+            'offset': offset,
+            'length': self.page_size,
+            'query': task.search_text,
+            **task.params,
+        }
+        if task.delta:
+            criteria['sortBy'] = MERCARI_SORT_NEWEST
+        response = self._session(task).post_json('/v1/api', {
+            'operationName': 'searchQuery',
+            'variables': {
+                'criteria': criteria,
+            },
+            'extensions': {
+                'persistedQuery': {'version': 1, 'sha256Hash': self.search_query_hash},
+            },
+        })
+        if response.get('errors'):
+            # e.g. PersistedQueryNotFound once the frontend ships a new query
+            raise Blocked(f"search query rejected: {response['errors']}")
+        return response
+
+    def _execute_task(self, task: MercariSearchTask):
+        result = self.result_map[task.id]
+        result.launch_ts = self._timestamp()
+
+        writer = JsonlResultWriter(path=f'results/{task.id}.jsonl', mode='w')
+        writer.write('task', task=task, commit_ts=result.commit_ts, launch_ts=result.launch_ts)
+
+        seen_ids = set()
+        offset = 0
+
+        tracker = None
+        if task.delta:
+            assert self.item_index is not None, "delta crawls need an item index"
+            tracker = DeltaTracker(self.item_index, 'mercari', urlsplit(task.url).query, fields=DELTA_FIELDS)
+
+        try:
+            while len(seen_ids) < task.max_num_items:
+                response = self._search(task, offset)
+                self.logger.info(msg=f"fetch search results {offset}-{offset + self.page_size} of {task.search_text}")
+
+                items = parse_search_items(response)
+                if len(items) == 0:
+                    break
+                offset += len(items)
+
+                items = [item for item in items if item.id not in seen_ids]
+                seen_ids.update(item.id for item in items)
+                deltas = []
+                if self.item_index is not None:
+                    items, deltas = sift_known_items(result, items, self.item_index, tracker)
+
+                result.add_items(items)
+                result.deltas.extend(deltas)
+                save_items(result, items, writer, deltas, item_index=self.item_index, tracker=tracker)
+
+                # same state as MercariSearchScraper's, so the browser can take over from here
+                self.checkpoint.save(task.id, {
+                    'finished': False,
+                    'num_scrolls': 0,
+                    'scroll_y': 0,
+                    'num_known_items': result.num_known_items,
+                    'seen_ids': list(seen_ids),
+                })
+                if self.downloader is not None:
+                    self.downloader.submit_items(items)
+
+                if tracker is not None and tracker.reached:
+                    self.logger.info(msg=f"task {task.id} reached the items of the run of {tracker.mark_ts or 'earlier runs'} after {len(seen_ids)} items")
+                    break
+                count = ((response.get('data') or {}).get('search') or {}).get('count')
+                if count is not None and offset >= count:
+                    break
+        finally:
+            writer.close()
+
+        if tracker is not None:
+            tracker.finish()
+        self.checkpoint.save(task.id, {'finished': True})
+        self.logger.info(msg=(
+            f"task {task.id} finished with {len(result.items)} new items and {result.num_known_items} known items skipped"
+            + (f", {len(result.deltas)} of them changed" if task.delta else "")
+        ))
+
+    def _fallback(self, task: MercariSearchTask):
+        self.logger.info(msg=f"fall back to the browser for task {task.id}")
+        # the browsers are quit once done unless the pool was given
+        with MercariSearchScraper(
+            max_num_threads=1,
+            verbose=False,
+            tasks=[task],
+            downloader=self.downloader,
+            item_index=self.item_index,
+            checkpoint=self.checkpoint,
+            pacer=self.pacer,
+            driver_pool=self.driver_pool,
+            log_pipeline=self.log_pipeline,
+        ) as scraper:
+            scraper.run(resume=True)
+        result = scraper.result_map[task.id]
+        # known items met over http before the block
+        result.known_ids |= self.result_map[task.id].known_ids
+        self.result_map[task.id] = result
+
+    def _timestamp(self):
+        return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+if __name__ == "__main__":
+    task = MercariSearchTask(
+        id='123456789',
+        keyword='T-Shirt',
+        filters=['Dress', 'Long'],
+        max_num_items=1000,
+        scrape_item_page=False
+    )
+
+    scraper = MercariSearchHttpScraper(
+        # copy it from the searchQuery request of the site, it changes with frontend releases
+        search_query_hash=os.environ['MERCARI_SEARCH_QUERY_HASH'],
+        tasks=[task],
+        verbose=True,
+        checkpoint=CheckpointStore(),
+    )
+
+    scraper.run()
@@ -1,8 +1,12 @@
+import sys
 from dataclasses import dataclass, field
-from typing import List
+from typing import ClassVar, List, Tuple
 
-@dataclass
+@dataclass(slots=True)
 class MercariSearchItem:
+    # few distinct values over many items, interned by compact()
+    categorical_fields: ClassVar[Tuple[str, ...]] = ('category', 'brand', 'condition', 'color', 'price', 'status', 'decoration')
+
     id: str = field(default="")
     url: str = field(default="")
     category: str = field(default="")
@@ -19,5 +23,13 @@ class MercariSearchItem:
     def num_imgs(self) -> int:
         return len(self.img_urls)
 
+    # share one string per distinct value of the categorical fields
+    def compact(self) -> 'MercariSearchItem':
+        for name in self.categorical_fields:
+            value = getattr(self, name)
+            if type(value) is str:
+                setattr(self, name, sys.intern(value))
+        return self
+
     def __hash__(self) -> int:
         return hash(self.id)
@@ -0,0 +1,83 @@
+import os
+import sys
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from scraper import (
+    MercariSearchTask,
+    MercariSearchScraper,
+)
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from common.task_queue import TaskQueue
+from common.queue_runner import QueueRunner
+
+__all__ = [
+    'enqueue',
+    'MercariQueueRunner',
+]
+
+
+QUEUE_SITE = 'mercari'
+
+
+# enqueues tasks, returns how many were not in the queue yet
+def enqueue(queue: TaskQueue, tasks: List[MercariSearchTask]) -> int:
+    return sum(queue.put(QUEUE_SITE, task.id, asdict(task)) for task in tasks)
+
+
+# runs the MercariSearchTasks of a TaskQueue, one browser per task
+class MercariQueueRunner(QueueRunner):
+    def __init__(
+        self,
+        queue: TaskQueue,
+        num_workers: int = 4,
+        worker_id: Optional[str] = None,
+        wait: bool = True,
+        headless: bool = False,
+        verbose: bool = True,
+        **scraper_kwargs,
+    ) -> None:
+        super().__init__(
+            queue,
+            site=QUEUE_SITE,
+            num_workers=num_workers,
+            num_drivers=num_workers,
+            bidi=scraper_kwargs.get('capture', False),
+            worker_id=worker_id,
+            wait=wait,
+            headless=headless,
+            verbose=verbose,
+            **scraper_kwargs
+        )
+
+    def create_scraper(self, payload: Dict[str, Any]) -> Tuple[MercariSearchTask, MercariSearchScraper]:
+        task = MercariSearchTask(**payload)
+        scraper = MercariSearchScraper(
+            max_num_threads=1,
+            verbose=self.verbose,
+            tasks=[task],
+            **self.scraper_kwargs
+        )
+        return task, scraper
+
+
+if __name__ == "__main__":
+    # every node opens the same queue file
+    queue = TaskQueue(path='queue/tasks.db', lease=120)
+
+    # enqueue from any node, tasks already in the queue are skipped
+    enqueue(queue, [
+        MercariSearchTask(id='t-shirt', keyword='T-Shirt', max_num_items=1000, scrape_item_page=False),
+        MercariSearchTask(id='hoodie', keyword='Hoodie', max_num_items=1000, scrape_item_page=False),
+        MercariSearchTask(id='sneakers', keyword='Sneakers', max_num_items=1000, scrape_item_page=False),
+    ])
+
+    runner = MercariQueueRunner(
+        queue=queue,
+        num_workers=4,
+        verbose=True,
+        headless=False,
+    )
+
+    runner.run()
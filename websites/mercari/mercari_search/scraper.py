@@ -1,22 +1,44 @@
 import os
 import sys
-import json
 import random
 import logging
-from typing import Optional, List, Tuple, Set
-from time import sleep
+import threading
+from queue import Queue
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, List, Tuple, Set
+from time import sleep, monotonic
 from datetime import datetime
-from dataclasses import dataclass, field, asdict
+from urllib.parse import urlencode, urlsplit
+from dataclasses import dataclass, field
 
-from selenium import webdriver
-from selenium.webdriver.remote.webelement import WebElement
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import (
+    ElementClickInterceptedException,
+    ElementNotInteractableException,
+    StaleElementReferenceException,
+    TimeoutException,
+)
 
 from models import (
     MercariSearchItem,
 )
+from api import parse_search_items
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from common.result_writer import JsonlResultWriter, read_records
+from common.downloader import ImageDownloader
+from common.item_index import ItemIndex
+from common.delta import DeltaTracker
+from common.checkpoint import CheckpointStore
+from common.pacing import Pacer, wait_until, wait_network_idle, is_challenge_page
+from common.driver_pool import DriverPool, browser_rss
+from common.network_capture import NetworkCapture, CapturedResponse, start_capture
+from common.tabs import BackgroundTabs
+from common.metrics import Metrics
+from common.streaming import ItemStream, StreamClosed
+from common.recovery import ChallengeError, RetryBudget, RetryPolicy, TaskQuarantine, classify_error
+from common.log_pipeline import LogPipeline, event
 
 __all__ = [
     'MercariSearchTask',
@@ -25,6 +47,126 @@ __all__ = [
 ]
 
 
+MERCARI_DOMAIN = 'www.mercari.com'
+# the GraphQL endpoint the search page fetches its items from while scrolling
+SEARCH_API_PATTERN = r'/v1/api'
+# the sortBy of the "Newest" order of the search page
+MERCARI_SORT_NEWEST = 2
+# fields of known items whose changes delta crawls record
+DELTA_FIELDS = ('price', 'status')
+
+
+# A MutationObserver queues new cards and a seen-id set lives in the page, so the
+# cost of a call depends on the newly rendered cards only, not on the grid size.
+CURSOR_JS = """
+const selector = 'div[id][data-itemprice][data-itemstatus]';
+let cursor = window.__spidersMercariCursor;
+if (cursor === undefined) {
+    cursor = window.__spidersMercariCursor = { seen: new Set(), pending: [] };
+    const enqueue = (node) => {
+        if (node.nodeType !== Node.ELEMENT_NODE) return;
+        if (node.matches(selector)) cursor.pending.push(node);
+        node.querySelectorAll(selector).forEach((div) => cursor.pending.push(div));
+    };
+    enqueue(document.body);
+    new MutationObserver((mutations) => {
+        mutations.forEach((mutation) => mutation.addedNodes.forEach(enqueue));
+    }).observe(document.body, { childList: true, subtree: true });
+}
+"""
+
+
+# Returns the item cards added to the grid since the last call, in one round trip.
+# Cards which are not fully rendered yet are kept for the next call.
+COLLECT_NEW_ITEMS_JS = CURSOR_JS + """
+const pending = cursor.pending;
+cursor.pending = [];
+const items = [];
+for (const div of pending) {
+    if (!div.isConnected || cursor.seen.has(div.id)) continue;
+    const a = div.querySelector('a[data-testid=ProductThumbWrapper]');
+    const price = div.querySelector('p[data-testid=ProductThumbItemPrice]');
+    if (a === null || price === null) {
+        cursor.pending.push(div);
+        continue;
+    }
+    cursor.seen.add(div.id);
+
+    const metas = {};
+    a.querySelectorAll('meta[itemprop]').forEach((meta) => {
+        metas[meta.getAttribute('itemprop')] = meta.getAttribute('content');
+    });
+    const decoration = a.querySelector('span[data-testid=ItemDecorationRectangle]');
+    const img = div.querySelector('div[class^=Product__CDNImageWrapper] > img');
+    items.push({
+        id: div.id,
+        status: div.getAttribute('data-itemstatus'),
+        href: a.href,
+        metas: metas,
+        decoration: decoration === null ? '' : decoration.innerText,
+        price: price.innerText,
+        img_src: img === null ? null : img.src,
+    });
+}
+return items;
+"""
+
+
+# true once cards were added to the grid since the last COLLECT_NEW_ITEMS_JS or MARK_SEEN_JS
+WAIT_NEW_ITEMS_JS = """
+const cursor = window.__spidersMercariCursor;
+if (cursor === undefined) {
+    return document.querySelector('div[id][data-itemprice][data-itemstatus]') !== null;
+}
+return cursor.pending.some((div) => !cursor.seen.has(div.id));
+"""
+
+
+# Marks the cards of the item ids of arguments[0] as extracted, for the items read from
+# captured responses, so SCROLL_JS prunes them and their cards are not waited for again
+MARK_SEEN_JS = CURSOR_JS + """
+arguments[0].forEach((id) => cursor.seen.add(id));
+cursor.pending = cursor.pending.filter((div) => div.isConnected && !cursor.seen.has(div.id));
+"""
+
+
+# Scrolls by arguments[0] pixels. With arguments[1], first empties all but the last
+# arguments[1] cards already extracted, so the DOM, layout and memory of the page stop
+# growing with the number of scrolls. Emptied cards keep their size, the grid doesn't
+# move. Returns the number of cards emptied and where the scroll started from.
+SCROLL_JS = """
+const selector = 'div[id][data-itemprice][data-itemstatus]:not([data-spiders-pruned])';
+const cursor = window.__spidersMercariCursor;
+let num_pruned = 0;
+if (arguments[1] !== null) {
+    const cards = Array.from(document.querySelectorAll(selector)).slice(0, -arguments[1])
+        .filter((div) => cursor === undefined || cursor.seen.has(div.id));
+    // all the reads before the writes, one layout for the whole batch
+    const sizes = cards.map((div) => [div.offsetWidth, div.offsetHeight]);
+    cards.forEach((div, idx) => {
+        div.style.width = sizes[idx][0] + 'px';
+        div.style.height = sizes[idx][1] + 'px';
+        div.setAttribute('data-spiders-pruned', '');
+        div.replaceChildren();
+    });
+    num_pruned = cards.length;
+}
+const scroll_y = window.scrollY;
+window.scrollTo({ top: scroll_y + arguments[0], left: 0, behavior: 'smooth' });
+return [num_pruned, scroll_y];
+"""
+
+
+# urls of every photo of an item page, null until the photos are rendered
+ITEM_PAGE_IMG_URLS_JS = """
+if (document.querySelector('div[data-testid=ItemDetailColPhotos]') === null) return null;
+return Array.from(
+    document.querySelectorAll('div[class^=PhotoIndicators__ImageWrapper] > img'),
+    (img) => img.src.split('?')[0]
+);
+"""
+
+
 @dataclass
 class MercariSearchTask:
     id: str = field(default=None)
@@ -32,6 +174,13 @@ class MercariSearchTask:
     filters: List[str] = field(default_factory=list)
     max_num_items: int = field(default=1000)
     scrape_item_page: bool = False
+    # search params as the site spells them, e.g. {'minPrice': 1000, 'itemConditions': 1}
+    params: Dict[str, Any] = field(default_factory=dict)
+    # another origin serving the same pages, e.g. a local stand-in
+    base_url: str = field(default=f"https://{MERCARI_DOMAIN}")
+    # newest first, stops at the items earlier runs indexed and records the
+    # price and status changes of the known items it went through, needs an item index
+    delta: bool = False
 
     @property
     def search_text(self) -> str:
@@ -42,7 +191,10 @@ class MercariSearchTask:
 
     @property
     def url(self) -> str:
-        return f"https://www.mercari.com/search/?keyword={self.search_text}"
+        params = {'keyword': self.search_text, **self.params}
+        if self.delta:
+            params['sortBy'] = MERCARI_SORT_NEWEST
+        return f"{self.base_url}/search/?{urlencode(params, doseq=True)}"
 
 
 @dataclass
@@ -52,6 +204,85 @@ class MercariSearchResult:
     launch_ts: str = field(default="")
     finish_ts: str = field(default="")
     items: List[MercariSearchItem] = field(default_factory=list)
+    # items skipped because an earlier run already scraped them
+    num_known_items: int = field(default=0)
+    # their ids, from this run only, they are not saved with the results
+    known_ids: Set[str] = field(default_factory=set)
+    # items handed to an iter_items consumer instead of being kept in items
+    num_released_items: int = field(default=0)
+    # kept up to date by add_items
+    num_imgs: int = field(default=0)
+    # changes of known items seen by a delta crawl, {'id', 'changes': {field: [old, new]}}
+    deltas: List[Dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def num_items(self) -> int:
+        return len(self.items) + self.num_released_items
+
+    # with keep=False, items are only counted, see iter_items
+    def add_items(self, items: List[MercariSearchItem], keep: bool = True):
+        for item in items:
+            self.num_imgs += item.num_imgs
+        if not keep:
+            self.num_released_items += len(items)
+            return
+        for item in items:
+            item.compact()
+        self.items.extend(items)
+
+    @classmethod
+    def load(cls, path: str) -> 'MercariSearchResult':
+        result = cls()
+        for record in read_records(path):
+            if record['type'] == 'task':
+                result.task = MercariSearchTask(**record['task'])
+                result.commit_ts = record['commit_ts']
+                result.launch_ts = record['launch_ts']
+            elif record['type'] == 'item':
+                result.add_items([MercariSearchItem(**record['item'])])
+            elif record['type'] == 'delta':
+                result.deltas.append({key: value for key, value in record.items() if key != 'type'})
+            elif record['type'] == 'progress':
+                result.finish_ts = record['finish_ts']
+                result.num_known_items = record.get('num_known_items', 0)
+        return result
+
+
+# shared by the browser and the HTTP scrapers: counts the indexed items of a batch into result and
+# records them in the index, returns the other items and the delta records of the changed indexed ones
+def sift_known_items(
+    result: MercariSearchResult,
+    items: List[MercariSearchItem],
+    item_index: ItemIndex,
+    tracker: Optional[DeltaTracker] = None,
+) -> Tuple[List[MercariSearchItem], List[Dict[str, Any]]]:
+    known_ids = item_index.known('mercari', [item.id for item in items])
+    result.num_known_items += len(known_ids)
+    result.known_ids.update(known_ids)
+    deltas = tracker.observe(items, known_ids) if tracker is not None else []
+    known_items = [item for item in items if item.id in known_ids]
+    item_index.touch('mercari', list(known_ids), states=tracker.states(known_items) if tracker is not None else None)
+    return [item for item in items if item.id not in known_ids], deltas
+
+
+# appends the changes of known items and the new items, read back with MercariSearchResult.load,
+# the new items go to the index once saved
+def save_items(
+    result: MercariSearchResult,
+    items: List[MercariSearchItem],
+    writer: JsonlResultWriter,
+    deltas: List[Dict[str, Any]] = [],
+    item_index: Optional[ItemIndex] = None,
+    tracker: Optional[DeltaTracker] = None,
+):
+    result.finish_ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    for delta in deltas:
+        writer.write('delta', **delta)
+    writer.write_items(items)
+    writer.write('progress', finish_ts=result.finish_ts, num_items=result.num_items, num_known_items=result.num_known_items)
+    writer.flush()
+    if item_index is not None:
+        item_index.touch('mercari', [item.id for item in items], states=tracker.states(items) if tracker is not None else None)
 
 
 class MercariSearchScraper:
@@ -62,154 +293,569 @@ class MercariSearchScraper:
         browser: str = 'firefox',
         verbose: bool = True,
         headless: bool = False,
-        tasks: List[MercariSearchTask] = []
+        tasks: List[MercariSearchTask] = [],
+        downloader: Optional[ImageDownloader] = None,
+        item_index: Optional[ItemIndex] = None,
+        checkpoint: Optional[CheckpointStore] = None,
+        checkpoint_interval: int = 5,
+        max_num_idle_scrolls: int = 3,
+        pacer: Optional[Pacer] = None,
+        driver_pool: Optional[DriverPool] = None,
+        lean: bool = True,
+        capture: bool = False,
+        max_num_item_tabs: int = 4,
+        metrics: Optional[Metrics] = None,
+        max_num_rendered_cards: Optional[int] = 240,
+        rss_interval: Optional[int] = 10,
+        retry_policy: Optional[RetryPolicy] = None,
+        quarantine: Optional[TaskQuarantine] = None,
+        log_pipeline: Optional[LogPipeline] = None,
     ) -> None:
         assert browser in ['firefox', 'chrome']
         if browser == 'chrome':
             raise RuntimeError("chrome is for losers, please use firefox")
 
-        os.makedirs('logs', exist_ok=True)
+        assert max_num_threads > 0 and max_num_tasks > 0
+        assert max_num_rendered_cards is None or max_num_rendered_cards > 0
+
+        # records are written off the worker threads, to logs/{task.id}.log per task
+        self.log_pipeline = log_pipeline if log_pipeline is not None else LogPipeline.shared()
         self.logger = logging.getLogger(name='MercariSearchScraper')
         self.logger.setLevel(logging.INFO)
-        self.log_formatter = logging.Formatter(fmt="[%(levelname)s] %(asctime)s | %(message)s", datefmt='%Y-%m-%d %H:%M:%S')
-
-        if verbose:
-            handler = logging.StreamHandler(sys.stderr)
-            handler.setFormatter(self.log_formatter)
-            self.logger.addHandler(handler)
-
-        # TODO: does nothing, no multithread support for now
+        self.log_pipeline.attach(self.logger, console=verbose)
+
+        # images of scraped items are handed over to the downloader as they come
+        self.downloader = downloader
+        # items indexed by earlier runs are skipped
+        self.item_index = item_index
+        # task progress is saved every checkpoint_interval scrolls, see run(resume=True)
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = checkpoint_interval
+        # the end of the results is reached once that many scrolls in a row bring no new item
+        self.max_num_idle_scrolls = max_num_idle_scrolls
+        # requests of all the workers are paced by one per-domain budget instead of fixed sleeps
+        self.pacer = pacer if pacer is not None else Pacer()
+        # build items from the search responses the page fetches itself instead of the DOM, read
+        # over WebDriver BiDi (Firefox 143+, older browsers fall back to the DOM), they list every
+        # photo so item pages are not visited
+        self.capture = capture
+        # item pages of a task are loaded in up to max_num_item_tabs tabs next to the search page
+        self.max_num_item_tabs = max_num_item_tabs
+        # time per phase and counters, saved to metrics/ after every task
+        self.metrics = metrics if metrics is not None else Metrics(name='mercari_search')
+        # extracted cards beyond the last max_num_rendered_cards are emptied while scrolling,
+        # None keeps every card rendered
+        self.max_num_rendered_cards = max_num_rendered_cards
+        # browser memory is logged and set as the browser_rss_bytes gauge every rss_interval scrolls
+        self.rss_interval = rss_interval
+        # a failed scroll is retried as the policy allows for the kind of error, after reloading
+        # the search page where it was, on a fresh browser if the browser crashed
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        # tasks which keep failing run after run are skipped
+        self.quarantine = quarantine
+
+        # each worker thread owns one browser and pulls tasks from a bounded queue
         self.max_num_threads = max_num_threads
         self.max_num_tasks = max_num_tasks
+        self.task_queue: Queue[Optional[MercariSearchTask]] = Queue(maxsize=max_num_tasks)
+        self.result_lock = threading.Lock()
+        self.worker_local = threading.local()
+
+        self.tasks: List[MercariSearchTask] = []
+        self.result_map = {}
+        # tasks which raised, they are neither finished nor checkpointed as such
+        self.failed_task_ids: Set[str] = set()
+        # tasks run by iter_items, their items go to the consumer instead of result_map
+        self.streams: Dict[str, ItemStream] = {}
+        # delta crawls running
+        self.deltas: Dict[str, DeltaTracker] = {}
+        for task in tasks:
+            self.commit_task(task)
+
+        # one browser per worker by default
+        self.owns_driver_pool = driver_pool is None
+        if driver_pool is None:
+            driver_pool = DriverPool(max_num_drivers=max_num_threads, headless=headless, lean=lean, bidi=capture)
+        self.driver_pool = driver_pool
 
-        self.tasks = tasks
-        for task in self.tasks:
-            # TODO: gen task uuid by {keyword+commit_ts}?
-            assert task.id is not None and len(task.id) > 0
+    @property
+    def num_tasks(self) -> int:
+        return len(self.tasks)
 
+    @property
+    def webdriver(self):
+        # the browser of the current worker thread
+        return self.worker_local.webdriver
+
+    def commit_task(self, task: MercariSearchTask):
+        # TODO: gen task uuid by {keyword+commit_ts}?
+        assert task.id is not None and len(task.id) > 0
         ts = self._timestamp()
-        self.result_map = dict(zip(
-            [task.id for task in tasks],
-            [MercariSearchResult(
+        with self.result_lock:
+            self.tasks.append(task)
+            self.result_map[task.id] = MercariSearchResult(
                 task=task,
                 commit_ts=ts,
                 launch_ts=ts,
                 finish_ts=ts,
                 items=[]
-            ) for task in tasks]
-        ))
+            )
 
-        if headless:
-            os.environ['MOZ_HEADLESS'] = '1'
-        self.webdriver = webdriver.Firefox()
+    # with resume, tasks continue from their last checkpoint and finished tasks are skipped
+    def run(self, resume: bool = False):
+        num_workers = min(self.max_num_threads, self.num_tasks)
+        workers = [
+            threading.Thread(target=self._work, args=(resume,), name=f'MercariSearchWorker-{worker_idx}')
+            for worker_idx in range(num_workers)
+        ]
+        for worker in workers:
+            worker.start()
+
+        # blocks whenever max_num_tasks tasks are pending
+        for task in self.tasks:
+            self.task_queue.put(task)
+        for _ in workers:
+            self.task_queue.put(None)
 
-    @property
-    def num_tasks(self) -> int:
-        return len(self.tasks)
+        for worker in workers:
+            worker.join()
 
-    def commit_task(self, task: MercariSearchTask):
-        # ts = self._timestamp()
-        # task.id = f"{task.keyword}_{ts}"
-        self.tasks.append(task)
+    # quits the browsers of the pool the scraper launched, once no task runs anymore
+    def close(self):
+        if self.owns_driver_pool:
+            self.driver_pool.close()
 
-    def run(self):
-        for task_idx, task in enumerate(self.tasks):
-            handler = logging.FileHandler(filename=f'logs/{task.id}.log', mode='a')
-            handler.setFormatter(self.log_formatter)
-            self.logger.addHandler(handler)
-            self._execute_task(task)
-            self.logger.removeHandler(handler)
+    def __enter__(self) -> 'MercariSearchScraper':
+        return self
 
-    def _execute_task(self, task: MercariSearchTask):
-        self.result_map[task.id].launch_ts = self._timestamp()
-        item_set = set()
+    def __exit__(self, *exc):
+        self.close()
 
-        self.webdriver.get(task.url)
-        self.logger.info(msg=f"goto web page {task.url}")
+    # yields the new items of task as they are saved, breaking out stops the task
+    def iter_items(self, task: MercariSearchTask, resume: bool = False, max_num_buffered: int = 256) -> Iterator[MercariSearchItem]:
+        stream = self._open_stream(task, resume, max_num_buffered)
+        try:
+            yield from stream
+        finally:
+            stream.close()
 
+    async def aiter_items(self, task: MercariSearchTask, resume: bool = False, max_num_buffered: int = 256) -> AsyncIterator[MercariSearchItem]:
+        stream = self._open_stream(task, resume, max_num_buffered)
+        try:
+            async for item in stream:
+                yield item
+        finally:
+            stream.close()
+
+    def _open_stream(self, task: MercariSearchTask, resume: bool, max_num_buffered: int) -> ItemStream:
+        if task.id not in self.result_map:
+            self.commit_task(task)
+        assert task.id not in self.streams, f"task {task.id} is already streamed"
+        stream = ItemStream(max_num_buffered=max_num_buffered)
+        self.streams[task.id] = stream
+        threading.Thread(target=self._stream_task, args=(task, resume, stream), name=f'MercariSearchStream-{task.id}', daemon=True).start()
+        return stream
+
+    def _stream_task(self, task: MercariSearchTask, resume: bool, stream: ItemStream):
+        error = None
+        try:
+            self._run_in_browser(task, resume=resume)
+            if task.id in self.failed_task_ids:
+                error = RuntimeError(f"task {task.id} failed, see logs/{task.id}.log")
+        finally:
+            del self.streams[task.id]
+            stream.finish(error)
+
+    def _work(self, resume: bool = False):
         while True:
+            task = self.task_queue.get()
+            if task is None:
+                break
+            try:
+                self._run_in_browser(task, resume=resume)
+            finally:
+                self.task_queue.task_done()
+
+    def _run_in_browser(self, task: MercariSearchTask, resume: bool = False):
+        self.failed_task_ids.discard(task.id)
+        # no browser is taken from the pool for a task which won't run
+        if self.quarantine is not None and task.id in self.quarantine:
+            self.failed_task_ids.add(task.id)
+            self.logger.warning(msg=f"task {task.id} is in quarantine, skipped")
+            return
+
+        self.worker_local.capture = None
+        self.worker_local.webdriver = None
+        try:
+            self._attach(self.driver_pool.acquire())
+            self._run_task(task, resume=resume)
+        except Exception:
+            self.failed_task_ids.add(task.id)
+            self.logger.exception(msg=f"no browser for task {task.id}")
+        finally:
+            self._detach(broken=getattr(self.worker_local, 'broken', False))
+
+    # the browser of the current worker thread, with its network capture
+    def _attach(self, driver):
+        self.worker_local.webdriver = driver
+        self.worker_local.broken = False
+        self.metrics.watch(driver)
+        if self.capture:
+            self.worker_local.capture = start_capture(driver, SEARCH_API_PATTERN, self.logger)
+
+    def _detach(self, broken: bool = False):
+        if self.worker_local.capture is not None:
+            self.worker_local.capture.stop()
+            self.worker_local.capture = None
+        if self.worker_local.webdriver is not None:
+            self.driver_pool.release(self.worker_local.webdriver, broken=broken)
+            self.worker_local.webdriver = None
+
+    # the crashed browser is quit and a new one takes its place
+    def _respawn(self):
+        self.metrics.count('crashes')
+        self._detach(broken=True)
+        self._attach(self.driver_pool.acquire())
+
+    def _run_task(self, task: MercariSearchTask, resume: bool = False):
+        with self.log_pipeline.task(task.id):
+            try:
+                with self.metrics.task(task.id):
+                    self._execute_task(task, resume=resume)
+            except StreamClosed:
+                self.logger.info(msg=f"task {task.id} stopped, its items are no longer consumed")
+            except Exception:
+                self.failed_task_ids.add(task.id)
+                self.logger.exception(msg=f"task {task.id} failed")
+            finally:
+                self.metrics.save()
+
+        if self.quarantine is None:
+            return
+        if task.id not in self.failed_task_ids:
+            self.quarantine.record_success(task.id)
+        elif self.quarantine.record_failure(task.id, error=f"see logs/{task.id}.log"):
+            self.logger.warning(msg=f"task {task.id} failed {self.quarantine.max_num_failures} runs in a row, quarantined")
+
+    def _execute_task(self, task: MercariSearchTask, resume: bool = False):
+        state = None
+        if resume and self.checkpoint is not None and os.path.exists(f'results/{task.id}.jsonl'):
+            state = self.checkpoint.load(task.id)
+
+        if state is not None and state['finished']:
+            with self.result_lock:
+                self.result_map[task.id] = MercariSearchResult.load(f'results/{task.id}.jsonl')
+            self.logger.info(msg=f"task {task.id} already finished, skipped")
+            return
+
+        result = self.result_map[task.id]
+        num_scrolls = 0
+        scroll_y = 0
+
+        if state is None:
+            result.launch_ts = self._timestamp()
+            seen_ids: Set[str] = set()
+
+            writer = JsonlResultWriter(path=f'results/{task.id}.jsonl', mode='w')
+            writer.write('task', task=task, commit_ts=result.commit_ts, launch_ts=result.launch_ts)
+
+            self._goto(task.url)
+            self.logger.info(msg=f"goto web page {task.url}")
+        else:
+            writer = self._restore(task, state)
+            seen_ids = set(state['seen_ids']) | {item.id for item in result.items}
+            num_scrolls = state['num_scrolls']
+            scroll_y = state['scroll_y']
+
+            self._goto(task.url)
+            self.logger.info(msg=f"resume task {task.id} with {len(seen_ids)} items seen, goto web page {task.url}")
             self._wait_search_page_content()
             self._agree_privacy_settings()
+            with self.metrics.time('scrolling'):
+                self._restore_scroll(state['scroll_y'])
+
+        # item pages load in background tabs while the grid keeps scrolling,
+        # their items are saved once the page is done
+        tabs = None
+        if task.scrape_item_page:
+            tabs = BackgroundTabs(
+                self.webdriver,
+                ITEM_PAGE_IMG_URLS_JS,
+                max_num_tabs=self.max_num_item_tabs,
+                pacer=self.pacer,
+                driver_pool=self.driver_pool
+            )
 
-            self._sleep(4, 6)
+        if task.delta:
+            assert self.item_index is not None, "delta crawls need an item index"
+            self.deltas[task.id] = DeltaTracker(
+                self.item_index, 'mercari', urlsplit(task.url).query, fields=DELTA_FIELDS, record_mark=state is None
+            )
+        try:
+            self._scrape_search_page(task, result, seen_ids, num_scrolls, scroll_y, writer, tabs)
+            if tabs is not None:
+                self._commit_items(result, self._collect_item_pages(tabs, wait=True), writer)
+        finally:
+            if tabs is not None:
+                tabs.close()
+            writer.close()
+            tracker = self.deltas.pop(task.id, None)
+
+        if tracker is not None:
+            tracker.finish()
+            if tracker.reached:
+                self.logger.info(msg=f"task {task.id} reached the items of the run of {tracker.mark_ts or 'earlier runs'} after {len(seen_ids)} items")
+        if self.checkpoint is not None:
+            self.checkpoint.save(task.id, {'finished': True})
+        self.logger.info(msg=(
+            f"task {task.id} finished with {result.num_items} new items and {result.num_known_items} known items skipped"
+            + (f", {len(result.deltas)} of them changed" if task.delta else "")
+        ))
 
-            item_divs = self.webdriver.find_elements(By.CSS_SELECTOR, "div[id][data-itemprice][data-itemstatus]")
+    def _scrape_search_page(
+        self,
+        task: MercariSearchTask,
+        result: MercariSearchResult,
+        seen_ids: Set[str],
+        num_scrolls: int,
+        scroll_y: float,
+        writer: JsonlResultWriter,
+        tabs: Optional[BackgroundTabs]
+    ):
+        budget = RetryBudget(self.retry_policy)
+        attempts: Dict[str, int] = {}
+        # (error, delay) of the failed scroll to recover from, a failed recovery is retried too
+        recovery: Optional[Tuple[Exception, float]] = None
+        num_idle_scrolls = 0
+        while True:
+            try:
+                if recovery is not None:
+                    self._recover(task, recovery[0], recovery[1], scroll_y, tabs)
+                    recovery = None
+                done, num_idle_scrolls = self._scrape_next_batch(task, result, seen_ids, num_idle_scrolls, writer, tabs)
+                if done:
+                    break
+
+                # scrolling makes the page fetch the next batch of items
+                with self.metrics.time('pacing'):
+                    self.pacer.acquire(MERCARI_DOMAIN)
+                self.worker_local.nav_ts = monotonic()
+                with self.metrics.time('scrolling'):
+                    num_pruned, scroll_y = self._scroll(offset=[800, 1200], max_num_rendered_cards=self.max_num_rendered_cards)
+            except StreamClosed:
+                raise
+            except Exception as e:
+                delay = budget.retry(e, attempts)
+                if delay is None:
+                    # a crashed browser is quit once the task gives up
+                    if classify_error(e) == 'crash':
+                        self.metrics.count('crashes')
+                        self.worker_local.broken = True
+                    raise
+                recovery = (e, delay)
+                continue
 
-            items = self._do_scrape_items(item_set, item_divs, task.scrape_item_page)
-            self.logger.info(msg=f"scrape new items: {[item.url for item in items]}")
+            attempts = {}
+            self.metrics.count('pruned_cards', num_pruned)
+            num_scrolls += 1
+            if self.rss_interval is not None and num_scrolls % self.rss_interval == 0:
+                self._report_rss(num_scrolls, len(seen_ids))
+
+            if self.checkpoint is not None and num_scrolls % self.checkpoint_interval == 0:
+                self.checkpoint.save(task.id, {
+                    'finished': False,
+                    'num_scrolls': num_scrolls,
+                    'scroll_y': scroll_y,
+                    'num_known_items': result.num_known_items,
+                    # items still waiting for their item page are scraped again after a resume
+                    'seen_ids': list(seen_ids - {item.id for item in (tabs.pending() if tabs is not None else [])}),
+                })
+
+    # waits for the next batch of cards and commits its items, returns whether the task is
+    # done and the number of scrolls in a row which brought nothing
+    def _scrape_next_batch(
+        self,
+        task: MercariSearchTask,
+        result: MercariSearchResult,
+        seen_ids: Set[str],
+        num_idle_scrolls: int,
+        writer: JsonlResultWriter,
+        tabs: Optional[BackgroundTabs]
+    ) -> Tuple[bool, int]:
+        self._wait_search_page_content()
+        with self.metrics.time('popups'):
+            self._agree_privacy_settings()
+        responses = self._wait_new_items()
+
+        # batches rendered by the server never show up as responses
+        items_captured = len(responses) > 0
+        self.metrics.count('captured_batches' if items_captured else 'rendered_batches')
+        with self.metrics.time('extraction'):
+            if items_captured:
+                items = self._do_scrape_items_from_capture(responses, seen_ids)
+            else:
+                items = self._do_scrape_items(seen_ids)
+        seen_ids.update(item.id for item in items)
+        batch_ids = [item.id for item in items]
+        if items_captured:
+            with self.metrics.time('extraction'):
+                self.webdriver.execute_script(MARK_SEEN_JS, batch_ids)
+        tracker = self.deltas.get(task.id)
+
+        # skip items scraped by earlier runs before visiting their item pages
+        if self.item_index is not None:
+            num_items = len(items)
+            items, deltas = sift_known_items(result, items, self.item_index, tracker)
+            self.metrics.count('known_items', num_items - len(items))
+            if len(deltas) > 0:
+                self._commit_deltas(result, deltas, writer)
+
+        if tabs is not None:
+            if not items_captured:
+                with self.metrics.time('item_pages'):
+                    for item in items:
+                        tabs.submit(item, item.url)
+                items = []
+            items += self._collect_item_pages(tabs)
+
+        self._commit_items(result, items, writer)
+
+        if len(seen_ids) >= task.max_num_items:
+            return True, num_idle_scrolls
+        if tracker is not None and tracker.reached:
+            return True, num_idle_scrolls
+        num_idle_scrolls = num_idle_scrolls + 1 if len(batch_ids) == 0 else 0
+        if num_idle_scrolls >= self.max_num_idle_scrolls:
+            self.logger.info(msg=f"no more results after {len(seen_ids)} items")
+            return True, num_idle_scrolls
+        return False, num_idle_scrolls
+
+    # reloads the search page and scrolls back to where the failed scroll started,
+    # on a new browser if the browser crashed. Cards seen before are skipped by id.
+    def _recover(self, task: MercariSearchTask, error: Exception, delay: float, scroll_y: float, tabs: Optional[BackgroundTabs]):
+        kind = classify_error(error)
+        self.metrics.count('retries')
+        self.logger.warning(msg=f"retry task {task.id} at scroll y {scroll_y:.0f} in {delay:.1f}s, {kind}: {error!r}")
+        with self.metrics.time('backoff'):
+            sleep(delay)
+
+        if kind == 'crash':
+            self._respawn()
+            if tabs is not None:
+                tabs.reset(self.webdriver)
+        # a stale card only needs another look at the page
+        if kind == 'stale':
+            return
+
+        self._goto(task.url)
+        self._wait_search_page_content()
+        self._agree_privacy_settings()
+        with self.metrics.time('scrolling'):
+            self._restore_scroll(scroll_y)
+
+    # items go to the results, the index and the downloader only once they are complete
+    def _commit_items(self, result: MercariSearchResult, items: List[MercariSearchItem], writer: JsonlResultWriter):
+        self.logger.info(msg=f"scrape {len(items)} new items")
+        if self.logger.isEnabledFor(logging.DEBUG):
+            for item in items:
+                self.logger.debug(msg=f"new item {item.url}", extra=event('item', id=item.id, url=item.url))
+        self.metrics.count('items', len(items))
+        self.metrics.count('images', sum(item.num_imgs for item in items))
+
+        stream = self.streams.get(result.task.id)
+        with self.result_lock:
+            result.add_items(items, keep=stream is None)
+        with self.metrics.time('save'):
+            save_items(result, items, writer, item_index=self.item_index, tracker=self.deltas.get(result.task.id))
+        if self.downloader is not None:
+            self.downloader.submit_items(items)
+        # saved first, so the consumer only ever sees items which survive a crash
+        if stream is not None:
+            stream.put(items)
+
+    # changes of known items, saved right away
+    def _commit_deltas(self, result: MercariSearchResult, deltas: List[Dict[str, Any]], writer: JsonlResultWriter):
+        self.metrics.count('changed_items', len(deltas))
+        with self.result_lock:
+            result.deltas.extend(deltas)
+        with self.metrics.time('save'):
+            save_items(result, [], writer, deltas)
+
+    # the grid thumbnail stays when an item page did not load in time
+    def _collect_item_pages(self, tabs: BackgroundTabs, wait: bool = False) -> List[MercariSearchItem]:
+        items: List[MercariSearchItem] = []
+        with self.metrics.time('item_pages'):
+            for item, img_urls in (tabs.drain() if wait else tabs.poll()):
+                if img_urls is None:
+                    self.metrics.count('timeouts')
+                elif len(img_urls) > 0:
+                    item.img_urls = img_urls
+                items.append(item)
+        return items
 
-            item_set.update(items)
-            self.result_map[task.id].items = list(item_set)
-            self.save(result=self.result_map[task.id])
-            self._sleep(2, 4)
+    # load the results saved so far, including the items saved after the checkpoint
+    def _restore(self, task: MercariSearchTask, state: dict) -> JsonlResultWriter:
+        loaded = MercariSearchResult.load(f'results/{task.id}.jsonl')
 
-            if len(item_set) >= task.max_num_items:
-                break
+        result = self.result_map[task.id]
+        with self.result_lock:
+            result.commit_ts = loaded.commit_ts
+            result.launch_ts = loaded.launch_ts
+            result.num_known_items = state['num_known_items']
+            result.items = loaded.items
+            result.num_imgs = loaded.num_imgs
+            result.deltas = loaded.deltas
 
-            self._scroll(offset=[800, 1200])
+        return JsonlResultWriter(path=f'results/{task.id}.jsonl', mode='a')
 
-        self.webdriver.quit()
-        self.logger.info(msg=f"task {task.id} finished with {len(self.result_map[task.id].items)} items scraped")
-        self.logger.info(msg=f"{self.webdriver} exited gracefully")
+    # scroll back to where the checkpoint was taken, the grid renders lazily on the way
+    def _restore_scroll(self, scroll_y: float):
+        last_y = -1
+        while True:
+            y = self.webdriver.execute_script("window.scrollBy(0, 2000); return window.scrollY;")
+            if y >= scroll_y or y == last_y:
+                break
+            last_y = y
+            wait_network_idle(self.webdriver, idle=0.3, timeout=3)
 
+    # a timeout is raised to the scroll retry, the browser is left alone
     def _wait_search_page_content(self):
-        try:
-            WebDriverWait(driver=self.webdriver, timeout=8).until(
-                EC.presence_of_element_located((
-                    By.CSS_SELECTOR,
-                    "div[data-testid=Search-Items]"
-                ))
-            )
-        except:
-            self.webdriver.quit()
-
-    def _wait_item_page_content(self):
-        try:
-            WebDriverWait(driver=self.webdriver, timeout=8).until(
-                EC.presence_of_element_located((
-                    By.CSS_SELECTOR,
-                    "div[data-testid=ItemDetailColPhotos]"
-                ))
-            )
-        except:
-            self.webdriver.quit()
-
+        with self.metrics.time('wait_content'):
+            try:
+                WebDriverWait(driver=self.webdriver, timeout=8).until(
+                    EC.presence_of_element_located((
+                        By.CSS_SELECTOR,
+                        "div[data-testid=Search-Items]"
+                    ))
+                )
+            except TimeoutException:
+                self.metrics.count('timeouts')
+                raise
+
+    # the banner comes and goes, a button which can't be clicked is not worth failing the task
     def _agree_privacy_settings(self):
-        try:
-            btn = self.webdriver.find_element(
-                By.CSS_SELECTOR,
-                "button[id=truste-consent-button]"
-            )
-            if btn is not None:
-                self._sleep(1, 3)
+        for btn in self.webdriver.find_elements(By.CSS_SELECTOR, "button[id=truste-consent-button]"):
+            self._sleep(1, 3)
+            try:
                 btn.click()
-        except:
-            pass
+            except (ElementClickInterceptedException, ElementNotInteractableException, StaleElementReferenceException) as e:
+                self.logger.warning(msg=f"failed to click the privacy settings button: {e.msg}")
 
-    def _do_scrape_items(
-        self,
-        item_set: Set[MercariSearchItem],
-        item_divs: List[WebElement],
-        scrape_item_page: bool = False
-    ) -> List[MercariSearchItem]:
+    def _do_scrape_items(self, seen_ids: Set[str]) -> List[MercariSearchItem]:
         items: List[MercariSearchItem] = []
 
-        for item_div in item_divs:
+        # only the cards rendered since the last scroll
+        for item_data in self.webdriver.execute_script(COLLECT_NEW_ITEMS_JS):
             item = MercariSearchItem()
 
-            item.id = item_div.get_attribute('id')
-            if item in item_set:
+            item.id = item_data['id']
+            if item.id in seen_ids:
                 continue
 
-            item.status = item_div.get_attribute('data-itemstatus')
-
-            item_a = item_div.find_element(By.CSS_SELECTOR, "a[data-testid=ProductThumbWrapper]")
-            item.url = item_a.get_attribute('href').split('?')[0].removesuffix('/')
+            item.status = item_data['status']
+            item.url = item_data['href'].split('?')[0].removesuffix('/')
 
-            item_metas = item_a.find_elements(By.CSS_SELECTOR, "meta")
-            for item_meta in item_metas:
-                prop = item_meta.get_attribute('itemprop')
-                content = item_meta.get_attribute('content')
+            for prop, content in item_data['metas'].items():
                 if prop == 'category' and content is not None:
                     item.category = content
                 elif prop == 'brand' and content is not None:
@@ -221,65 +867,130 @@ class MercariSearchScraper:
                 elif prop == 'color' and content is not None:
                     item.color  = content
 
-            try:
-                item_decor_span = item_a.find_element(By.CSS_SELECTOR, "span[data-testid=ItemDecorationRectangle]")
-                item.decoration = item_decor_span.text
-            except:
-                pass
+            item.decoration = item_data['decoration']
+            item.price = item_data['price']
 
-            item_price_p = item_div.find_element(By.CSS_SELECTOR, "p[data-testid=ProductThumbItemPrice]")
-            item.price = item_price_p.text
-
-            if not scrape_item_page:
-                item_img = item_div.find_element(By.CSS_SELECTOR, "div[class^=Product__CDNImageWrapper] > img")
-                item.img_urls = [item_img.get_attribute('src').split('?')[0].replace('thumb/', '')]
+            # the thumbnail, replaced by the photos of the item page if it gets scraped
+            if item_data['img_src'] is not None:
+                item.img_urls = [item_data['img_src'].split('?')[0].replace('thumb/', '')]
 
             items.append(item)
 
-        if scrape_item_page:
-            for item in items:
-                item.img_urls = self._do_scrape_item_page(item.url)
-                self._wait_search_page_content()
-
         return items
 
-    # NOTE: Only scrape images from item page for now
-    def _do_scrape_item_page(self, item_url: str):
-        self.webdriver.get(item_url)
-        self.logger.info(msg=f"goto web page {item_url}")
-
-        self._wait_item_page_content()
-        item_imgs = self.webdriver.find_elements(
-            By.CSS_SELECTOR,
-            "div[class^=PhotoIndicators__ImageWrapper] > img"
-        )
-        item_img_urls = [img.get_attribute('src').split('?')[0] for img in item_imgs]
-        self._sleep(2, 3)
-
-        # FIXME: sometimes the search page jumps to bottom after going back
-        self.webdriver.back()
-        self.logger.info(msg=f"goback from {item_url}")
-
-        return item_img_urls
+    def _do_scrape_items_from_capture(
+        self,
+        responses: List[CapturedResponse],
+        seen_ids: Set[str]
+    ) -> List[MercariSearchItem]:
+        items: List[MercariSearchItem] = []
+        item_ids: Set[str] = set()
+        for response in responses:
+            for item in parse_search_items(response.body):
+                if item.id not in seen_ids and item.id not in item_ids:
+                    item_ids.add(item.id)
+                    items.append(item)
+        return items
 
-    def _scroll(self, offset: Tuple[float, float]):
-        self.webdriver.execute_script(
-            f"window.scrollTo({{ top: window.scrollY + {random.uniform(offset[0], offset[1])}, left: 0, behavior: 'smooth' }});"
-        )
+    def _goto(self, url: str):
+        with self.metrics.time('pacing'):
+            self.pacer.acquire(MERCARI_DOMAIN)
+        self.worker_local.nav_ts = monotonic()
+        self.driver_pool.count_page(self.webdriver)
+        with self.metrics.time('navigation'):
+            self.webdriver.get(url)
+        # the first batch of a loaded page is rendered by the server, it never shows up as a response
+        self.worker_local.page_loaded = True
+
+    # wait for new cards instead of sleeping a fixed time, and tell the pacer how
+    # the site is doing. A challenge page is retried after the backoff.
+    # In capture mode, returns the search responses which brought the new cards.
+    def _wait_new_items(self, max_num_retries: int = 3) -> List[CapturedResponse]:
+        responses: List[CapturedResponse] = []
+        for _ in range(max_num_retries):
+            with self.metrics.time('wait_items'):
+                capture: Optional[NetworkCapture] = self.worker_local.capture
+                page_loaded = getattr(self.worker_local, 'page_loaded', False)
+                self.worker_local.page_loaded = False
+                if capture is not None and not page_loaded:
+                    ready, responses = self._wait_search_responses(capture, timeout=15)
+                else:
+                    ready = wait_until(self.webdriver, WAIT_NEW_ITEMS_JS, timeout=15)
+                if ready:
+                    wait_network_idle(self.webdriver, idle=0.5, timeout=5)
+                    # a first batch the page fetched by itself is captured all the same
+                    if capture is not None and page_loaded:
+                        responses = self._search_responses(capture.drain())
+                else:
+                    self.metrics.count('timeouts')
+                challenged = not ready and is_challenge_page(self.webdriver)
+            self.pacer.report(MERCARI_DOMAIN, monotonic() - self.worker_local.nav_ts, challenged=challenged)
+            if not challenged:
+                return responses
+
+            self.metrics.count('challenges')
+            self.logger.warning(msg=f"challenge page at {self.webdriver.current_url}, retry after backoff")
+            with self.metrics.time('pacing'):
+                self.pacer.acquire(MERCARI_DOMAIN)
+            self.worker_local.nav_ts = monotonic()
+            with self.metrics.time('navigation'):
+                self.webdriver.refresh()
+            self.worker_local.page_loaded = True
+        raise ChallengeError(f"still challenged at {self.webdriver.current_url} after {max_num_retries} tries")
+
+    # waits for a search response and for new cards at once, returns whether new items came
+    # and the responses which brought them. Cards without a response within max_response_delay
+    # are left to the DOM.
+    def _wait_search_responses(
+        self,
+        capture: NetworkCapture,
+        timeout: float,
+        max_response_delay: float = 1,
+        poll: float = 0.25
+    ) -> Tuple[bool, List[CapturedResponse]]:
+        deadline = monotonic() + timeout
+        rendered_ts = None
+        while True:
+            responses = self._search_responses(capture.wait(timeout=poll))
+            if len(responses) > 0:
+                return True, responses
+            now = monotonic()
+            if rendered_ts is None and self.webdriver.execute_script(WAIT_NEW_ITEMS_JS):
+                rendered_ts = now
+            if rendered_ts is not None and now - rendered_ts >= max_response_delay:
+                self.metrics.count('uncaptured_batches')
+                return True, []
+            if now >= deadline:
+                return rendered_ts is not None, []
+
+    # other queries of the page go to the same endpoint, skip them
+    @staticmethod
+    def _search_responses(responses: List[CapturedResponse]) -> List[CapturedResponse]:
+        return [
+            response for response in responses
+            if response.status == 200 and isinstance(response.body, dict)
+            and ((response.body.get('data') or {}).get('search') or {}).get('itemsList') is not None
+        ]
+
+    # returns the number of cards emptied on the way and where the scroll started, see SCROLL_JS
+    def _scroll(self, offset: Tuple[float, float], max_num_rendered_cards: Optional[int] = None) -> Tuple[int, float]:
+        num_pruned, scroll_y = self.webdriver.execute_script(SCROLL_JS, random.uniform(offset[0], offset[1]), max_num_rendered_cards)
+        return num_pruned, scroll_y
+
+    # no WebDriver round trip, read from /proc
+    def _report_rss(self, num_scrolls: int, num_items: int):
+        rss = browser_rss(self.webdriver)
+        if rss is None:
+            return
+        self.metrics.gauge('browser_rss_bytes', rss)
+        self.logger.info(msg=f"browser rss {rss / 1024 ** 2:.1f} MiB after {num_scrolls} scrolls and {num_items} items")
 
     def _timestamp(self):
         return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
     def _sleep(self, t1: float, t2: float):
-        sleep(random.uniform(t1, t2))
-
-    def save(self, result: MercariSearchResult):
-        result.finish_ts = self._timestamp()
-        os.makedirs('results', exist_ok=True)
-        with open(f'results/{result.task.id}.json', 'w') as file:
-            file.write(json.dumps(
-                asdict(result)
-            , ensure_ascii=False, indent=4))
+        with self.metrics.time('sleep'):
+            sleep(random.uniform(t1, t2))
 
 
 if __name__ == "__main__":
@@ -291,11 +1002,12 @@ if __name__ == "__main__":
         scrape_item_page=False
     )
 
-    scraper = MercariSearchScraper(
+    with MercariSearchScraper(
+        max_num_threads=4,
+        max_num_tasks=16,
         tasks=[task],
         browser='firefox',
         verbose=True,
         headless=False
-    )
-
-    scraper.run()
+    ) as scraper:
+        scraper.run()
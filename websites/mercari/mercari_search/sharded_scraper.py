@@ -0,0 +1,160 @@
+import os
+import sys
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from models import (
+    MercariSearchItem,
+)
+from scraper import (
+    MercariSearchTask,
+    MercariSearchResult,
+    MercariSearchScraper,
+)
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from common.result_writer import JsonlResultWriter
+from common.driver_pool import DriverPool
+from common.log_pipeline import LogPipeline
+from common.metrics import Metrics
+from common.sharding import ShardPlanner, PriceBands, Choices
+
+__all__ = [
+    'MercariShardedScraper',
+]
+
+
+# in cents, like the minPrice/maxPrice params of the site
+MERCARI_PRICE_EDGES = [0, 1000, 2500, 5000, 10000, 25000, None]
+MERCARI_ITEM_CONDITIONS = [1, 2, 3, 4, 5]
+
+
+# runs one MercariSearchTask as shards over price bands, conditions, categories, colors and sort orders
+class MercariShardedScraper:
+    def __init__(
+        self,
+        task: MercariSearchTask,
+        cap: int = 1000,
+        max_num_shards: int = 256,
+        category_ids: List[Any] = [],
+        color_ids: List[Any] = [],
+        sort_orders: List[Any] = [],
+        splitters: Optional[List[Any]] = None,
+        max_num_threads: int = 4,
+        headless: bool = False,
+        verbose: bool = True,
+        **scraper_kwargs,
+    ) -> None:
+        assert task.id is not None and len(task.id) > 0
+
+        self.log_pipeline = scraper_kwargs.setdefault('log_pipeline', LogPipeline.shared())
+        self.logger = logging.getLogger(name='MercariShardedScraper')
+        self.logger.setLevel(logging.INFO)
+        self.log_pipeline.attach(self.logger, console=verbose)
+
+        if splitters is None:
+            splitters = [
+                PriceBands('minPrice', 'maxPrice', MERCARI_PRICE_EDGES, min_width=100),
+                Choices('itemConditions', MERCARI_ITEM_CONDITIONS),
+                Choices('categoryIds', category_ids),
+                Choices('colorIds', color_ids),
+                Choices('sortBy', sort_orders),
+            ]
+        self.planner = ShardPlanner(splitters, max_num_shards=max_num_shards)
+
+        self.task = task
+        self.cap = cap
+        self.verbose = verbose
+        self.max_num_threads = max_num_threads
+        self.scraper_kwargs = scraper_kwargs
+        # one snapshot for every round
+        self.scraper_kwargs.setdefault('metrics', Metrics(name='mercari_search'))
+
+        ts = self._timestamp()
+        self.result = MercariSearchResult(task=task, commit_ts=ts, launch_ts=ts, finish_ts=ts, items=[])
+        self.item_map: Dict[str, MercariSearchItem] = {}
+        self.num_shards = 0
+
+        self.owns_driver_pool = 'driver_pool' not in scraper_kwargs
+        if self.owns_driver_pool:
+            self.scraper_kwargs['driver_pool'] = DriverPool(max_num_drivers=max_num_threads, headless=headless, bidi=scraper_kwargs.get('capture', False))
+
+    def run(self) -> MercariSearchResult:
+        self.result.launch_ts = self._timestamp()
+        try:
+            shards = self.planner.run(self._run_shards, root=self.task.params)
+        finally:
+            if self.owns_driver_pool:
+                self.scraper_kwargs['driver_pool'].close()
+
+        self.result.add_items(list(self.item_map.values()))
+        self.result.finish_ts = self._timestamp()
+        with JsonlResultWriter(path=f'results/{self.task.id}.jsonl', mode='w') as writer:
+            writer.write('task', task=self.task, commit_ts=self.result.commit_ts, launch_ts=self.result.launch_ts)
+            writer.write_items(self.result.items)
+            writer.write('progress', finish_ts=self.result.finish_ts, num_items=len(self.result.items), num_known_items=self.result.num_known_items)
+
+        self.logger.info(msg=f"task {self.task.id} finished with {len(self.result.items)} unique items over {len(shards)} shards")
+        return self.result
+
+    def _run_shards(self, shards: List[Dict[str, Any]]) -> List[bool]:
+        tasks = []
+        for shard in shards:
+            tasks.append(MercariSearchTask(
+                id=f'{self.task.id}.{self.num_shards}',
+                keyword=self.task.keyword,
+                filters=self.task.filters,
+                max_num_items=self.cap,
+                scrape_item_page=self.task.scrape_item_page,
+                params=shard,
+                base_url=self.task.base_url,
+            ))
+            self.num_shards += 1
+
+        self.logger.info(msg=f"run {len(tasks)} shards of task {self.task.id}: {shards}")
+        scraper = MercariSearchScraper(
+            max_num_threads=self.max_num_threads,
+            verbose=self.verbose,
+            tasks=tasks,
+            **self.scraper_kwargs
+        )
+        scraper.run()
+
+        capped = []
+        for task in tasks:
+            result = scraper.result_map[task.id]
+            for item in result.items:
+                self.item_map.setdefault(item.id, item)
+            # by id like the items, shards overlap
+            self.result.known_ids.update(result.known_ids)
+            capped.append(len(result.items) + result.num_known_items >= self.cap)
+
+        self.result.num_known_items = len(self.result.known_ids - self.item_map.keys())
+
+        # enough unique items, stop splitting
+        if len(self.item_map) >= self.task.max_num_items:
+            return [False] * len(tasks)
+        return capped
+
+    def _timestamp(self):
+        return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+if __name__ == "__main__":
+    task = MercariSearchTask(
+        id='123456789',
+        keyword='T-Shirt',
+        filters=['Dress', 'Long'],
+        max_num_items=20000,
+        scrape_item_page=False
+    )
+
+    scraper = MercariShardedScraper(
+        task=task,
+        cap=1000,
+        verbose=True,
+        headless=False,
+    )
+
+    scraper.run()
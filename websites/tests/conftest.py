@@ -0,0 +1,41 @@
+import os
+import sys
+import importlib
+
+import pytest
+
+WEBSITES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(WEBSITES_DIR)
+sys.path.append(os.path.join(WEBSITES_DIR, 'benchmarks'))
+
+# module names both sites use, the sites import them without a package
+SITE_MODULES = ['models', 'api', 'scraper', 'http_scraper', 'sharded_scraper', 'queue_runner']
+
+
+# imports the modules of one site, keeping them apart from the twins of the other site
+def import_site(site: str, *names: str):
+    site_dir = os.path.join(WEBSITES_DIR, site, f'{site}_search')
+    for name in SITE_MODULES:
+        sys.modules.pop(name, None)
+    sys.path.insert(0, site_dir)
+    try:
+        return [importlib.import_module(name) for name in names]
+    finally:
+        sys.path.remove(site_dir)
+        for name in SITE_MODULES:
+            sys.modules.pop(name, None)
+
+
+# the scrapers write results, logs and checkpoints relative to the working directory
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def server():
+    from server import FixtureServer
+
+    with FixtureServer(num_items=300) as server:
+        yield server
@@ -0,0 +1,216 @@
+import random
+import threading
+from time import sleep
+from urllib.parse import urlsplit, parse_qs
+
+from selenium.common.exceptions import NoSuchElementException
+
+
+# serves the vinted catalog pages of the stand-in server as page sources, slower for some pages
+# so they come back out of order
+class FakeVintedDriver:
+    def __init__(self, server, failing_pages=()) -> None:
+        self.server = server
+        self.failing_pages = failing_pages
+        self.current_url = ''
+        self.page_source = ''
+
+    def execute(self, driver_command, params=None):
+        return {'value': None}
+
+    def get(self, url):
+        self.current_url = url
+        params = {key: values[-1] for key, values in parse_qs(urlsplit(url).query).items()}
+        sleep(random.uniform(0, 0.05))
+        if int(params.get('page', 1)) in self.failing_pages:
+            raise RuntimeError(f"page {params['page']} failed")
+        self.page_source = self.server.vinted_catalog_page(params)
+
+    def find_element(self, by, selector):
+        if 'site-content' in selector:
+            return object()
+        raise NoSuchElementException()
+
+    def find_elements(self, by, selector):
+        return []
+
+    def execute_script(self, script, *args):
+        return True
+
+
+# counts the browsers in use, like a DriverPool would hold them
+class FakeVintedPool:
+    def __init__(self, server, failing_pages=()) -> None:
+        self.server = server
+        self.failing_pages = failing_pages
+        self.lock = threading.Lock()
+        self.num_in_use = 0
+        self.max_num_in_use = 0
+
+    def acquire(self):
+        with self.lock:
+            self.num_in_use += 1
+            self.max_num_in_use = max(self.max_num_in_use, self.num_in_use)
+        return FakeVintedDriver(self.server, self.failing_pages)
+
+    def release(self, driver, broken=False):
+        with self.lock:
+            self.num_in_use -= 1
+
+    def count_page(self, driver):
+        pass
+
+
+# the card grid of the mercari search page, driven by the scripts of the mercari scraper: every
+# scroll renders the next batch, whose middle card only gets its content one collect later, and
+# pruned cards are emptied like SCROLL_JS does, so a card pruned before it was collected is lost.
+# Item pages load in other tabs, the grid scripts only ever run in the first tab
+class FakeMercariDriver:
+    def __init__(self, server) -> None:
+        self.server = server
+        self.current_url = ''
+        self.max_num_rendered = 0
+        self.num_pruned = 0
+        self.tab_urls = {'tab-0': ''}
+        self.current_window_handle = 'tab-0'
+        self.switch_to = FakeSwitchTo(self)
+
+    def execute(self, driver_command, params=None):
+        return {'value': None}
+
+    def get(self, url):
+        assert self.current_window_handle == 'tab-0'
+        self.current_url = url
+        self.cards = []
+        self.pending = []
+        self.seen = set()
+        self.scroll_y = 0
+        self._render_next_batch()
+
+    def refresh(self):
+        self.get(self.current_url)
+
+    def close(self):
+        del self.tab_urls[self.current_window_handle]
+
+    def find_element(self, by, selector):
+        if 'Search-Items' in selector:
+            return object()
+        raise NoSuchElementException()
+
+    def find_elements(self, by, selector):
+        return []
+
+    def execute_script(self, script, *args):
+        if self.current_window_handle != 'tab-0':
+            return self._execute_in_tab(script, *args)
+        if 'return items;' in script:
+            return self._collect()
+        if 'cursor.pending.some' in script:
+            return any(card['id'] not in self.seen for card in self.pending)
+        if 'data-spiders-pruned' in script:
+            return self._scroll(*args)
+        if 'arguments[0].forEach' in script:
+            self.seen.update(args[0])
+            return None
+        if 'window.scrollBy' in script:
+            self.scroll_y += 2000
+            return self.scroll_y
+        # the network is idle and there is no challenge page
+        return '__spidersNetwork' in script
+
+    def _execute_in_tab(self, script, *args):
+        if 'window.location.href' in script:
+            self.tab_urls[self.current_window_handle] = args[0]
+            return None
+        if 'ItemDetailColPhotos' in script:
+            item_id = self.tab_urls[self.current_window_handle].rstrip('/').split('/')[-1]
+            item = self.server.mercari_item(int(item_id.lstrip('m')) - 50000000000)
+            return [photo['imageUrl'] for photo in item['photos']]
+        return None
+
+    def _render_next_batch(self):
+        batch = self.server.mercari_items(len(self.cards), self.server.mercari_batch_size)
+        for idx, item in enumerate(batch):
+            card = {'id': item['id'], 'item': item, 'pruned': False, 'late': idx == len(batch) // 2}
+            self.cards.append(card)
+            self.pending.append(card)
+        self.max_num_rendered = max(self.max_num_rendered, sum(not card['pruned'] for card in self.cards))
+
+    def _collect(self):
+        pending, self.pending = self.pending, []
+        items = []
+        for card in pending:
+            if card['id'] in self.seen:
+                continue
+            if card['pruned'] or card['late']:
+                card['late'] = False
+                self.pending.append(card)
+                continue
+            self.seen.add(card['id'])
+            item = card['item']
+            items.append({
+                'id': item['id'],
+                'status': item['status'],
+                'href': f"{self.server.url}/us/item/{item['id']}/",
+                'metas': {'brand': item['brand']['name'], 'itemCondition': item['itemCondition']['name']},
+                'decoration': '',
+                'price': f"${item['price'] / 100}",
+                'img_src': f"{item['photos'][0]['thumbnail']}?w=200",
+            })
+        return items
+
+    def _scroll(self, offset, max_num_rendered_cards):
+        num_pruned = 0
+        if max_num_rendered_cards is not None:
+            cards = [card for card in self.cards if not card['pruned']][:-max_num_rendered_cards]
+            for card in cards:
+                if card['id'] in self.seen:
+                    card['pruned'] = True
+                    num_pruned += 1
+        self.num_pruned += num_pruned
+        scroll_y = self.scroll_y
+        self.scroll_y += offset
+        self._render_next_batch()
+        return [num_pruned, scroll_y]
+
+
+class FakeSwitchTo:
+    def __init__(self, driver) -> None:
+        self.driver = driver
+        self.num_tabs = 1
+
+    def window(self, handle):
+        assert handle in self.driver.tab_urls
+        self.driver.current_window_handle = handle
+
+    def new_window(self, type_hint):
+        handle = f'tab-{self.num_tabs}'
+        self.num_tabs += 1
+        self.driver.tab_urls[handle] = ''
+        self.driver.current_window_handle = handle
+
+
+# a new browser per task, kept for the test to look at
+class FakeMercariPool:
+    def __init__(self, server) -> None:
+        self.server = server
+        self.lock = threading.Lock()
+        self.drivers = []
+        self.num_in_use = 0
+        self.max_num_in_use = 0
+
+    def acquire(self):
+        driver = FakeMercariDriver(self.server)
+        with self.lock:
+            self.drivers.append(driver)
+            self.num_in_use += 1
+            self.max_num_in_use = max(self.max_num_in_use, self.num_in_use)
+        return driver
+
+    def release(self, driver, broken=False):
+        with self.lock:
+            self.num_in_use -= 1
+
+    def count_page(self, driver):
+        pass
@@ -0,0 +1,78 @@
+import os
+import sys
+import json
+import subprocess
+
+import requests
+
+from bench import compare
+from conftest import WEBSITES_DIR, import_site
+
+[vinted_scraper] = import_site('vinted', 'scraper')
+
+
+def test_catalog_cards_parse_like_vinted_ones(server):
+    scraper = vinted_scraper.VintedSearchScraper(verbose=False)
+    items = scraper._do_scrape_items_from_source(server.vinted_catalog_page({'search_text': 'shirt', 'page': '2'}))
+
+    assert len(items) == server.vinted_per_page
+    for idx, item in enumerate(items, start=server.vinted_per_page):
+        expected = server.vinted_item(idx)
+        assert item.id == expected['id']
+        assert item.url == expected['url']
+        assert item.description == expected['title']
+        assert item.brand == expected['brand_title']
+        assert item.size == expected['size_title']
+        assert item.price == f"${expected['price']['amount']}"
+        assert item.img_urls == [expected['photos'][0]['url']]
+
+
+def test_catalog_json_pages_through_the_catalog(server):
+    pages = [
+        requests.get(f'{server.url}/api/v2/catalog/items', params={'page': page_idx, 'per_page': 96}).json()
+        for page_idx in range(1, 5)
+    ]
+    ids = [item['id'] for page in pages for item in page['items']]
+    assert ids == [server.vinted_item(idx)['id'] for idx in range(server.num_items)]
+    assert pages[0]['pagination']['total_pages'] == 4
+
+
+def test_mercari_search_json_pages_by_offset(server):
+    response = requests.post(f'{server.url}/v1/api', json={'variables': {'criteria': {'offset': 290, 'length': 30}}}).json()
+    search = response['data']['search']
+    assert [item['id'] for item in search['itemsList']] == [server.mercari_item(idx)['id'] for idx in range(290, 300)]
+    assert search['count'] == server.num_items
+
+
+def test_images_honour_range_requests(server):
+    url = f'{server.url}/img/v4000000000-0.jpg'
+    assert requests.get(url).content == server.image
+
+    response = requests.get(url, headers={'Range': 'bytes=100-'})
+    assert response.status_code == 206
+    assert response.content == server.image[100:]
+    assert requests.get(url, headers={'Range': f'bytes={len(server.image)}-'}).status_code == 416
+    assert server.num_range_requests == 2
+
+
+def test_http_scenarios_report(workdir):
+    output = workdir / 'report.json'
+    subprocess.run([
+        sys.executable, os.path.join(WEBSITES_DIR, 'benchmarks', 'bench.py'),
+        'vinted-http', 'mercari-http',
+        '--num-items', '200',
+        '--output', str(output),
+    ], check=True, capture_output=True)
+
+    with open(output) as file:
+        report = json.load(file)
+    assert [entry['scenario'] for entry in report] == ['vinted-http', 'mercari-http']
+    for entry in report:
+        assert entry['num_items'] == 200
+        assert entry['items_per_sec'] > 0
+        # no browser involved
+        assert entry['num_round_trips'] == 0
+
+    assert compare(report, report, tolerance=0.1)
+    slower = [dict(entry, items_per_sec=entry['items_per_sec'] / 2) for entry in report]
+    assert not compare(report, slower, tolerance=0.1)
@@ -0,0 +1,118 @@
+from common.checkpoint import CheckpointStore, MemoryCheckpointStore
+from common.item_index import ItemIndex
+from common.pacing import Pacer
+from common.result_writer import JsonlResultWriter
+from conftest import import_site
+from fakes import FakeVintedPool
+
+vinted_scraper, = import_site('vinted', 'scraper')
+mercari_scraper, mercari_http_scraper = import_site('mercari', 'scraper', 'http_scraper')
+
+
+# a crash right after a page was saved, before its checkpoint
+class CrashingCheckpointStore(CheckpointStore):
+    def __init__(self, crash_page_idx: int) -> None:
+        super().__init__()
+        self.crash_page_idx = crash_page_idx
+
+    def save(self, task_id, state):
+        if state.get('page_idx') == self.crash_page_idx:
+            self.crash_page_idx = None
+            raise OSError("disk went away")
+        super().save(task_id, state)
+
+
+def run_vinted(server, monkeypatch, checkpoint, resume=False, failing_pages=(), **kwargs):
+    monkeypatch.setattr(vinted_scraper, 'wait_network_idle', lambda *args, **kwargs: True)
+    monkeypatch.setattr(vinted_scraper.VintedSearchScraper, '_pretend_to_scroll', lambda *args, **kwargs: None)
+    task = vinted_scraper.VintedSearchScrapeTask(
+        id='resumed', search_text='shirt', max_num_items=1000, max_num_pages=10, scrape_item_page=False, base_url=server.url
+    )
+    scraper = vinted_scraper.VintedSearchScraper(
+        verbose=False,
+        tasks=[task],
+        driver_pool=FakeVintedPool(server, failing_pages),
+        pacer=Pacer(rate=1e6, burst=1e6, min_interval=0, jitter=0),
+        checkpoint=checkpoint,
+        max_num_sessions=1,
+        **kwargs
+    )
+    scraper.run(resume=resume)
+    return scraper
+
+
+def test_checkpoint_store_round_trip(workdir):
+    for store in [CheckpointStore(root=str(workdir / 'checkpoints')), MemoryCheckpointStore()]:
+        assert store.load('a') is None
+        state = {'finished': False, 'seen_ids': ['1', '2']}
+        store.save('a', state)
+        state['seen_ids'].append('3')
+        assert store.load('a') == {'finished': False, 'seen_ids': ['1', '2']}
+        store.clear('a')
+        assert store.load('a') is None
+
+
+def test_interrupted_vinted_task_resumes_without_duplicates(server, monkeypatch):
+    checkpoint = CheckpointStore()
+    first = run_vinted(server, monkeypatch, checkpoint, failing_pages={3})
+    assert first.failed_task_ids == {'resumed'}
+    assert checkpoint.load('resumed')['page_idx'] == 2
+
+    second = run_vinted(server, monkeypatch, checkpoint, resume=True)
+    assert second.failed_task_ids == set()
+    item_ids = [server.vinted_item(idx)['id'] for idx in range(server.num_items)]
+    assert [item.id for item in second.result_map['resumed'].items] == item_ids
+    loaded = vinted_scraper.VintedSearchScrapeResult.load('results/resumed.jsonl')
+    assert [item.id for item in loaded.items] == item_ids
+    assert [page.page_idx for page in loaded.pages] == [1, 2, 3, 4, 5]
+
+    # a finished task is skipped and loaded from its results
+    third = run_vinted(server, monkeypatch, checkpoint, resume=True, failing_pages={1, 2, 3, 4, 5})
+    assert [item.id for item in third.result_map['resumed'].items] == item_ids
+
+
+def test_page_saved_but_not_checkpointed_is_scraped_again(server, monkeypatch, workdir):
+    index = ItemIndex(path=str(workdir / 'index.db'))
+    first = run_vinted(server, monkeypatch, CrashingCheckpointStore(crash_page_idx=3), item_index=index)
+    assert first.failed_task_ids == {'resumed'}
+
+    second = run_vinted(server, monkeypatch, CheckpointStore(), resume=True, item_index=index)
+    item_ids = [server.vinted_item(idx)['id'] for idx in range(server.num_items)]
+    loaded = vinted_scraper.VintedSearchScrapeResult.load('results/resumed.jsonl')
+    assert [item.id for item in loaded.items] == item_ids
+    assert loaded.num_known_items == 0
+    assert second.result_map['resumed'].num_items == server.num_items
+
+
+def test_mercari_results_round_trip(server, workdir):
+    index = ItemIndex(path=str(workdir / 'index.db'))
+    task = mercari_scraper.MercariSearchTask(id='m', keyword='T-Shirt', max_num_items=1000, base_url=server.url, delta=True)
+    for _ in range(2):
+        scraper = mercari_http_scraper.MercariSearchHttpScraper(
+            'hash', verbose=False, tasks=[task], page_size=100, item_index=index,
+            pacer=Pacer(rate=1e6, burst=1e6, min_interval=0, jitter=0), fallback=False
+        )
+        scraper.run()
+        result = scraper.result_map['m']
+        loaded = mercari_scraper.MercariSearchResult.load('results/m.jsonl')
+
+        assert loaded.task == task
+        assert (loaded.commit_ts, loaded.launch_ts, loaded.finish_ts) == (result.commit_ts, result.launch_ts, result.finish_ts)
+        assert loaded.items == result.items
+        assert loaded.num_imgs == result.num_imgs
+        assert loaded.num_known_items == result.num_known_items
+        assert loaded.deltas == result.deltas
+
+
+def test_torn_last_line_is_ignored(workdir):
+    result = mercari_scraper.MercariSearchResult(task=mercari_scraper.MercariSearchTask(id='torn', keyword='T-Shirt'))
+    items = [mercari_scraper.MercariSearchItem(id=str(idx), img_urls=[f'https://img/{idx}.jpg']) for idx in range(3)]
+    with JsonlResultWriter(path='results/torn.jsonl', mode='w') as writer:
+        writer.write('task', task=result.task, commit_ts='', launch_ts='')
+        mercari_scraper.save_items(result, items, writer)
+    with open('results/torn.jsonl', 'a') as file:
+        file.write('{"type": "item", "item": {"id": "3"')
+
+    loaded = mercari_scraper.MercariSearchResult.load('results/torn.jsonl')
+    assert [item.id for item in loaded.items] == ['0', '1', '2']
+    assert loaded.num_imgs == 3
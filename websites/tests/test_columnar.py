@@ -0,0 +1,71 @@
+import sys
+
+import pytest
+
+from common.columnar import ColumnarItems
+from common.result_writer import JsonlResultWriter
+from conftest import import_site
+
+vinted_models, = import_site('vinted', 'models')
+VintedSearchItem = vinted_models.VintedSearchItem
+
+
+def make_items(num_items: int):
+    return [
+        VintedSearchItem(
+            id=str(idx),
+            url=f'https://www.vinted.com/items/{idx}',
+            title=f'shirt {idx}',
+            brand=['Zara', 'H&M', 'Nike'][idx % 3],
+            price=f'${idx % 7}.00',
+            size='M',
+            img_urls=[f'https://images/{idx}/{photo_idx}.jpg' for photo_idx in range(idx % 4)],
+        )
+        for idx in range(num_items)
+    ]
+
+
+def test_round_trip():
+    items = make_items(50)
+    columnar = ColumnarItems.from_items(VintedSearchItem, items)
+
+    assert len(columnar) == 50
+    assert list(columnar) == items
+    assert columnar[-1] == items[-1]
+    assert columnar.column('img_urls') == [item.img_urls for item in items]
+    with pytest.raises(IndexError):
+        columnar[50]
+
+    # categorical fields keep each distinct value once
+    assert columnar.categorical_names == set(VintedSearchItem.categorical_fields)
+    assert columnar.dictionaries['brand'] == ['Zara', 'H&M', 'Nike']
+    assert len(columnar.dictionaries['price']) == 7
+    assert list(columnar.columns['brand']) == [idx % 3 for idx in range(50)]
+
+
+def test_from_jsonl(workdir):
+    items = make_items(10)
+    with JsonlResultWriter(path='results/items.jsonl', mode='w') as writer:
+        writer.write('task', task={'id': 'items'})
+        writer.write('page', page_idx=1)
+        writer.write_items(items)
+    assert list(ColumnarItems.from_jsonl(VintedSearchItem, 'results/items.jsonl')) == items
+
+
+def test_to_arrow(workdir):
+    pa = pytest.importorskip('pyarrow')
+    items = make_items(20)
+    table = ColumnarItems.from_items(VintedSearchItem, items).to_arrow()
+
+    assert table.num_rows == 20
+    assert table.column_names == ColumnarItems(VintedSearchItem).names
+    assert pa.types.is_dictionary(table.schema.field('brand').type)
+    assert table.column('brand').to_pylist() == [item.brand for item in items]
+    assert table.column('img_urls').to_pylist() == [item.img_urls for item in items]
+    assert table.column('id').to_pylist() == [item.id for item in items]
+
+
+def test_to_arrow_without_pyarrow(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)
+    with pytest.raises(ImportError, match='pip install pyarrow'):
+        ColumnarItems.from_items(VintedSearchItem, make_items(1)).to_arrow()
@@ -0,0 +1,72 @@
+import io
+import os
+import json
+import tarfile
+
+from PIL import Image
+
+from common.dataset import DatasetBuilder
+from common.downloader import image_path
+from conftest import import_site
+
+vinted_models, = import_site('vinted', 'models')
+VintedSearchItem = vinted_models.VintedSearchItem
+
+
+def save_image(url: str, size, images_root: str = 'images'):
+    path = image_path(images_root, url)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.new('RGB', size, color=(200, 30, 30)).save(path, format='JPEG')
+    return path
+
+
+def make_item(item_id: str, img_urls):
+    return VintedSearchItem(id=item_id, url=f'https://www.vinted.com/items/{item_id}', title=f'shirt {item_id}', img_urls=img_urls)
+
+
+def test_builds_tar_shards_in_order(workdir):
+    for idx in range(5):
+        save_image(f'https://images/{idx}.jpg', size=(300, 200))
+    save_image('https://images/small.jpg', size=(16, 16))
+    path = image_path('images', 'https://images/broken.jpg')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(b'not an image')
+
+    items = [
+        make_item('1', ['https://images/0.jpg', 'https://images/1.jpg', 'https://images/missing.jpg']),
+        make_item('2', ['https://images/small.jpg', 'https://images/2.jpg', 'https://images/broken.jpg']),
+        # the same image again
+        make_item('3', ['https://images/3.jpg', 'https://images/0.jpg', 'https://images/4.jpg']),
+    ]
+    with DatasetBuilder(root='dataset', max_size=64, max_num_processes=1, max_num_samples_per_shard=2) as builder:
+        builder.add_items(items, site='vinted')
+
+    assert (builder.num_missing, builder.num_invalid, builder.num_duplicates) == (1, 2, 1)
+    assert sorted(os.listdir('dataset')) == ['manifest.json', 'shard-000000.tar', 'shard-000001.tar', 'shard-000002.tar']
+    with open('dataset/manifest.json', encoding='utf-8') as file:
+        manifest = json.load(file)
+    assert manifest['num_shards'] == 3
+    assert manifest['num_samples'] == 5
+    assert [shard['num_samples'] for shard in manifest['shards']] == [2, 2, 1]
+
+    samples = []
+    for shard in manifest['shards']:
+        with tarfile.open(os.path.join('dataset', shard['name'])) as tar:
+            names = tar.getnames()
+            assert names == [name for key in names[::2] for name in [key, key.replace('.jpg', '.json')]]
+            for name in names[::2]:
+                sample = json.loads(tar.extractfile(name.replace('.jpg', '.json')).read())
+                with Image.open(io.BytesIO(tar.extractfile(name).read())) as image:
+                    assert image.format == 'JPEG'
+                    assert max(image.size) <= 64
+                    assert image.size == (sample['width'], sample['height'])
+                samples.append((name, sample['img_url'], sample['item']['id']))
+
+    assert samples == [
+        ('vinted_1_0.jpg', 'https://images/0.jpg', '1'),
+        ('vinted_1_1.jpg', 'https://images/1.jpg', '1'),
+        ('vinted_2_1.jpg', 'https://images/2.jpg', '2'),
+        ('vinted_3_0.jpg', 'https://images/3.jpg', '3'),
+        ('vinted_3_2.jpg', 'https://images/4.jpg', '3'),
+    ]
@@ -0,0 +1,78 @@
+import os
+
+from common.downloader import ImageDownloader
+
+
+def test_downloads_every_image_once(server, workdir):
+    item = server.vinted_item(0)
+    urls = [photo['url'] for photo in item['photos']]
+    with ImageDownloader(root=str(workdir / 'images'), max_num_threads=2) as downloader:
+        for url in urls + urls:
+            downloader.submit(url)
+
+    assert downloader.num_downloaded == len(urls)
+    for url in urls:
+        with open(downloader.path_of(url), 'rb') as file:
+            assert file.read() == server.image
+    assert server.num_range_requests == 0
+
+
+def test_resumes_interrupted_downloads(server, workdir):
+    url = f'{server.url}/img/v4000000001-0.jpg'
+    downloader = ImageDownloader(root=str(workdir / 'images'), max_num_threads=1)
+    path = downloader.path_of(url)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path}.part', 'wb') as file:
+        file.write(server.image[:len(server.image) // 2])
+
+    with downloader:
+        downloader.submit(url)
+
+    assert downloader.num_downloaded == 1
+    assert server.num_range_requests == 1
+    with open(path, 'rb') as file:
+        assert file.read() == server.image
+    assert not os.path.exists(f'{path}.part')
+
+
+def test_complete_part_files_are_kept(server, workdir):
+    url = f'{server.url}/img/v4000000002-0.jpg'
+    downloader = ImageDownloader(root=str(workdir / 'images'), max_num_threads=1)
+    path = downloader.path_of(url)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path}.part', 'wb') as file:
+        file.write(server.image)
+
+    with downloader:
+        downloader.submit(url)
+
+    # the server answers 416 past the end of the image
+    assert downloader.num_downloaded == 1
+    with open(path, 'rb') as file:
+        assert file.read() == server.image
+
+
+def test_skips_downloaded_images_and_gives_up_on_missing_ones(server, workdir):
+    url = f'{server.url}/img/v4000000003-0.jpg'
+    with ImageDownloader(root=str(workdir / 'images')) as downloader:
+        downloader.submit(url)
+    with ImageDownloader(root=str(workdir / 'images')) as downloader:
+        downloader.submit(url)
+        downloader.submit(f'{server.url}/missing.jpg')
+
+    assert downloader.num_skipped == 1
+    assert downloader.num_downloaded == 0
+    assert downloader.num_failed == 1
+
+
+def test_forgets_urls_once_downloaded(server, workdir):
+    urls = [photo['url'] for photo in server.vinted_item(4)['photos']]
+    with ImageDownloader(root=str(workdir / 'images'), max_num_threads=2) as downloader:
+        for url in urls:
+            downloader.submit(url)
+    assert downloader.in_flight == set()
+
+    # the images on disk keep them from being downloaded again
+    with downloader:
+        downloader.submit(urls[0])
+    assert (downloader.num_downloaded, downloader.num_skipped) == (len(urls), 1)
@@ -0,0 +1,142 @@
+import json
+
+from common.http_session import Blocked
+from common.item_index import ItemIndex
+from common.pacing import Pacer
+from server import FixtureServer
+from conftest import import_site
+from fakes import FakeVintedPool
+
+vinted_scraper, vinted_http_scraper = import_site('vinted', 'scraper', 'http_scraper')
+mercari_scraper, mercari_http_scraper = import_site('mercari', 'scraper', 'http_scraper')
+
+
+# no politeness budget, the server is local
+def fast_pacer() -> Pacer:
+    return Pacer(rate=1e6, burst=1e6, min_interval=0, jitter=0)
+
+
+def read_records(path):
+    with open(path) as file:
+        return [json.loads(line) for line in file]
+
+
+def vinted_task(server, task_id, **kwargs):
+    return vinted_scraper.VintedSearchScrapeTask(
+        id=task_id,
+        search_text='shirt',
+        max_num_items=1000,
+        max_num_pages=10,
+        scrape_item_page=False,
+        base_url=server.url,
+        **kwargs
+    )
+
+
+def mercari_task(server, task_id, **kwargs):
+    return mercari_scraper.MercariSearchTask(id=task_id, keyword='T-Shirt', max_num_items=1000, base_url=server.url, **kwargs)
+
+
+def test_vinted_pages_are_saved_in_catalog_order(server):
+    task = vinted_task(server, 'v')
+    scraper = vinted_http_scraper.VintedSearchHttpScraper(verbose=False, tasks=[task], pacer=fast_pacer(), fallback=False)
+    scraper.run()
+
+    result = scraper.result_map['v']
+    assert [page.page_idx for page in result.pages] == [1, 2, 3, 4]
+    assert [item.id for item in result.items] == [server.vinted_item(idx)['id'] for idx in range(server.num_items)]
+
+    loaded = vinted_scraper.VintedSearchScrapeResult.load('results/v.jsonl')
+    assert [item.id for item in loaded.items] == [item.id for item in result.items]
+
+
+def test_mercari_batches_are_saved_in_search_order(server):
+    task = mercari_task(server, 'm')
+    scraper = mercari_http_scraper.MercariSearchHttpScraper('hash', verbose=False, tasks=[task], page_size=50, pacer=fast_pacer(), fallback=False)
+    scraper.run()
+
+    result = scraper.result_map['m']
+    assert [item.id for item in result.items] == [server.mercari_item(idx)['id'] for idx in range(server.num_items)]
+    assert all(len(item.img_urls) == server.num_photos for item in result.items)
+
+
+def test_tasks_go_to_their_own_origin(server):
+    with FixtureServer(num_items=50) as other:
+        tasks = [vinted_task(server, 'a'), vinted_task(other, 'b')]
+        scraper = vinted_http_scraper.VintedSearchHttpScraper(verbose=False, tasks=tasks, pacer=fast_pacer(), fallback=False)
+        scraper.run()
+
+    assert scraper.result_map['a'].num_items == server.num_items
+    assert scraper.result_map['b'].num_items == 50
+    assert sorted(scraper.sessions) == sorted([server.url, other.url])
+
+
+def test_known_items_are_skipped(server, workdir):
+    index = ItemIndex(path=str(workdir / 'index.db'))
+    for task_id in ['first', 'second']:
+        scraper = vinted_http_scraper.VintedSearchHttpScraper(
+            verbose=False, tasks=[vinted_task(server, task_id)], item_index=index, pacer=fast_pacer(), fallback=False
+        )
+        scraper.run()
+
+    assert scraper.result_map['second'].num_items == 0
+    assert scraper.result_map['second'].num_known_items == server.num_items
+
+
+def test_delta_crawls_stop_at_known_items_and_record_changes(server, workdir):
+    index = ItemIndex(path=str(workdir / 'index.db'))
+    first = mercari_http_scraper.MercariSearchHttpScraper(
+        'hash', verbose=False, tasks=[mercari_task(server, 'first', delta=True)], page_size=30, item_index=index, pacer=fast_pacer(), fallback=False
+    )
+    first.run()
+    assert first.result_map['first'].num_items == server.num_items
+
+    # the newest items got cheaper since
+    mercari_item = server.mercari_item
+    server.mercari_item = lambda idx: dict(mercari_item(idx), price=1)
+    second = mercari_http_scraper.MercariSearchHttpScraper(
+        'hash', verbose=False, tasks=[mercari_task(server, 'second', delta=True)], page_size=30, item_index=index, pacer=fast_pacer(), fallback=False
+    )
+    second.run()
+
+    result = second.result_map['second']
+    assert result.num_items == 0
+    assert result.num_known_items == 30
+    assert len(result.deltas) == 30
+    old_price, new_price = result.deltas[0]['changes']['price']
+    assert old_price != new_price
+    assert [record['type'] for record in read_records('results/second.jsonl')].count('delta') == 30
+
+
+def test_vinted_fallback_keeps_the_items_fetched_over_http(server, workdir, monkeypatch):
+    monkeypatch.setattr(vinted_scraper, 'wait_network_idle', lambda *args, **kwargs: True)
+    monkeypatch.setattr(vinted_scraper.VintedSearchScraper, '_pretend_to_scroll', lambda *args, **kwargs: None)
+    index = ItemIndex(path=str(workdir / 'index.db'))
+    task = vinted_task(server, 'fallback')
+    scraper = vinted_http_scraper.VintedSearchHttpScraper(
+        verbose=False,
+        tasks=[task],
+        per_page=server.vinted_per_page,
+        item_index=index,
+        pacer=fast_pacer(),
+        driver_pool=FakeVintedPool(server),
+    )
+
+    # blocked from the third page on, the browser takes over from there
+    session = scraper._session(task)
+    get_json = session.get_json
+
+    def blocked_get_json(path, params=None):
+        if params['page'] >= 3:
+            raise Blocked("blocked")
+        return get_json(path, params=params)
+
+    monkeypatch.setattr(session, 'get_json', blocked_get_json)
+    scraper.run()
+
+    item_ids = [server.vinted_item(idx)['id'] for idx in range(server.num_items)]
+    result = scraper.result_map['fallback']
+    assert [item.id for item in result.items] == item_ids
+    assert result.num_known_items == 0
+    loaded = vinted_scraper.VintedSearchScrapeResult.load('results/fallback.jsonl')
+    assert [item.id for item in loaded.items] == item_ids
@@ -0,0 +1,99 @@
+import io
+import random
+
+from PIL import Image
+
+from common.image_store import BKTree, ImageStore, dhash, hamming_distance
+
+
+# a smooth random pattern, so downscaled or re-encoded copies keep their dhash
+def pattern(seed: int, size: int = 128) -> Image.Image:
+    rng = random.Random(seed)
+    small = Image.new('RGB', (8, 8))
+    small.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(64)])
+    return small.resize((size, size), Image.Resampling.BICUBIC)
+
+
+def encode(image: Image.Image, format: str = 'JPEG', **kwargs) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **kwargs)
+    return buffer.getvalue()
+
+
+def test_bk_tree_finds_every_value_within_distance():
+    rng = random.Random(0)
+    values = [rng.getrandbits(64) for _ in range(500)]
+    # a few near copies of the first value
+    values += [values[0] ^ (1 << bit) for bit in range(3)] + [values[0] ^ 0b111]
+    tree = BKTree()
+    for idx, value in enumerate(values):
+        tree.add(value, idx)
+    assert len(tree) == len(values)
+
+    for query in [values[0], rng.getrandbits(64)]:
+        for max_distance in [0, 1, 3, 20]:
+            expected = sorted(
+                (hamming_distance(query, value), idx) for idx, value in enumerate(values)
+                if hamming_distance(query, value) <= max_distance
+            )
+            matches = tree.search(query, max_distance)
+            assert sorted(matches) == expected
+            assert [distance for distance, _ in matches] == sorted(distance for distance, _ in matches)
+
+    assert BKTree().search(values[0], 64) == []
+
+
+def test_dhash_of_near_duplicates_is_close():
+    image = pattern(1)
+    original = dhash(encode(image))
+    assert original is not None
+    assert hamming_distance(original, dhash(encode(image, quality=40))) <= 4
+    assert hamming_distance(original, dhash(encode(image.resize((64, 64)), format='PNG'))) <= 4
+    assert hamming_distance(original, dhash(encode(pattern(2)))) > 4
+    assert dhash(b'not an image') is None
+
+
+def test_near_duplicates_are_stored_once(workdir):
+    store = ImageStore(root=str(workdir / 'images'), max_distance=4)
+    image = pattern(1)
+    digest = store.put('https://a/1.jpg', encode(image))
+    # the same photo relisted, re-encoded smaller
+    assert store.put('https://b/1.jpg', encode(image.resize((96, 96)), quality=60)) == digest
+    # byte for byte the same
+    assert store.put('https://c/1.jpg', encode(image)) == digest
+    other = store.put('https://a/2.jpg', encode(pattern(2)))
+    assert other != digest
+
+    assert len(store) == 2
+    assert store.path_of('https://b/1.jpg') == store.path_of('https://a/1.jpg')
+    assert store.digest_of('https://a/2.jpg') == other
+    assert 'https://d/1.jpg' not in store
+    with open(store.path_of('https://a/1.jpg'), 'rb') as file:
+        assert file.read() == encode(image)
+
+
+def test_threshold_zero_keeps_near_duplicates_apart(workdir):
+    store = ImageStore(root=str(workdir / 'images'), max_distance=0)
+    image = pattern(3)
+    first = store.put('https://a/1.jpg', encode(image))
+    # a visibly different crop of the same photo
+    second = store.put('https://a/2.jpg', encode(image.crop((0, 0, 64, 128)).resize((128, 128))))
+    assert first != second
+    assert len(store) == 2
+
+
+def test_index_and_tree_persist_across_reopen(workdir):
+    root = str(workdir / 'images')
+    store = ImageStore(root=root)
+    image = pattern(4)
+    digest = store.put('https://a/1.jpg', encode(image))
+    store.put('https://a/2.jpg', b'not an image', ext='.bin')
+    store.close()
+
+    store = ImageStore(root=root)
+    assert len(store) == 2
+    assert len(store.tree) == 1
+    assert store.digest_of('https://a/1.jpg') == digest
+    # matched against the tree rebuilt from index.db
+    assert store.put('https://b/1.jpg', encode(image, quality=50)) == digest
+    assert len(store) == 2
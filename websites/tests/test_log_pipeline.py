@@ -0,0 +1,50 @@
+import json
+import logging
+import threading
+
+from common.log_pipeline import LogPipeline, event
+
+
+def test_routes_records_to_the_file_of_their_task(workdir):
+    pipeline = LogPipeline(sample_rates={})
+    logger = logging.getLogger('test_log_pipeline.tasks')
+    pipeline.attach(logger)
+    logger.setLevel(logging.INFO)
+
+    def work(task_id):
+        with pipeline.task(task_id):
+            for idx in range(50):
+                logger.info(msg=f"{task_id} {idx}", extra=event('step', idx=idx))
+
+    threads = [threading.Thread(target=work, args=(f't{idx}',)) for idx in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    logger.info(msg="no task")
+    pipeline.close()
+
+    for idx in range(4):
+        with open(workdir / 'logs' / f't{idx}.log') as file:
+            entries = [json.loads(line) for line in file]
+        assert [entry['idx'] for entry in entries] == list(range(50))
+        assert all(entry['task_id'] == f't{idx}' and entry['event'] == 'step' for entry in entries)
+    with open(workdir / 'logs' / 'spiders.log') as file:
+        assert [json.loads(line)['msg'] for line in file] == ["no task"]
+
+
+def test_full_queue_drops_only_records_below_warning(capsys):
+    pipeline = LogPipeline(max_queue_size=1, max_enqueue_wait=0.01)
+    # nothing takes records off the queue anymore
+    pipeline.listener.stop()
+    logger = logging.getLogger('test_log_pipeline.full')
+    pipeline.attach(logger)
+    logger.setLevel(logging.INFO)
+
+    for idx in range(3):
+        logger.info(msg=f"info {idx}")
+    logger.warning(msg="kept")
+
+    assert pipeline.num_dropped == 2
+    assert pipeline.num_overflowed == 1
+    assert json.loads(capsys.readouterr().err)['msg'] == "kept"
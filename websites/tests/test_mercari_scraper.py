@@ -0,0 +1,102 @@
+import pytest
+
+from common.pacing import Pacer
+from common.recovery import TaskQuarantine
+from conftest import import_site
+from fakes import FakeMercariPool
+
+mercari_scraper, = import_site('mercari', 'scraper')
+
+
+@pytest.fixture(autouse=True)
+def fake_waits(monkeypatch):
+    # the fake page is ready right away, a wait is one look at it
+    monkeypatch.setattr(mercari_scraper, 'wait_until', lambda driver, script, *args, **kwargs: driver.execute_script(script, *args))
+    monkeypatch.setattr(mercari_scraper, 'wait_network_idle', lambda *args, **kwargs: True)
+
+
+# ids in the order the fake grid hands them out: the middle card of a batch comes with the next collect
+def expected_ids(server):
+    item_ids = []
+    for offset in range(0, server.num_items, server.mercari_batch_size):
+        batch = [item['id'] for item in server.mercari_items(offset, server.mercari_batch_size)]
+        late_id = batch.pop(len(batch) // 2)
+        item_ids += batch + [late_id]
+    return item_ids
+
+
+def make_scraper(server, tasks, **kwargs):
+    return mercari_scraper.MercariSearchScraper(
+        tasks=tasks,
+        verbose=False,
+        driver_pool=FakeMercariPool(server),
+        pacer=Pacer(rate=1e6, burst=1e6, min_interval=0, jitter=0),
+        max_num_idle_scrolls=1,
+        rss_interval=None,
+        **kwargs,
+    )
+
+
+def make_task(server, task_id, **kwargs):
+    return mercari_scraper.MercariSearchTask(id=task_id, keyword=task_id, max_num_items=1000, base_url=server.url, **kwargs)
+
+
+@pytest.mark.parametrize('max_num_rendered_cards', [None, 1, 10])
+def test_workers_collect_every_item_in_order(server, max_num_rendered_cards):
+    tasks = [make_task(server, task_id) for task_id in ['shirt', 'dress', 'coat']]
+    scraper = make_scraper(server, tasks, max_num_threads=2, max_num_rendered_cards=max_num_rendered_cards)
+    scraper.run()
+
+    assert scraper.failed_task_ids == set()
+    for task in tasks:
+        result = scraper.result_map[task.id]
+        assert [item.id for item in result.items] == expected_ids(server)
+        assert result.items[0].url == f'{server.url}/us/item/{result.items[0].id}'
+        loaded = mercari_scraper.MercariSearchResult.load(f'results/{task.id}.jsonl')
+        assert [item.id for item in loaded.items] == expected_ids(server)
+
+    assert scraper.driver_pool.max_num_in_use <= 2
+    drivers = scraper.driver_pool.drivers
+    if max_num_rendered_cards is None:
+        assert all(driver.num_pruned == 0 for driver in drivers)
+        assert max(driver.max_num_rendered for driver in drivers) == server.num_items
+    else:
+        # the unpruned cards are the last ones kept plus the batch the scroll brought
+        assert sum(driver.num_pruned for driver in drivers) > 0
+        assert max(driver.max_num_rendered for driver in drivers) <= max_num_rendered_cards + server.mercari_batch_size + 1
+
+
+def test_item_pages_load_in_background_tabs(server):
+    task = make_task(server, 'shirt', scrape_item_page=True)
+    scraper = make_scraper(server, [task], max_num_item_tabs=server.mercari_batch_size)
+    scraper.run()
+
+    result = scraper.result_map[task.id]
+    assert sorted(item.id for item in result.items) == sorted(expected_ids(server))
+    for item in result.items:
+        assert item.img_urls == [photo['imageUrl'] for photo in server.mercari_item(int(item.id[1:]) - 50000000000)['photos']]
+    # the tabs are closed and the grid tab is left
+    driver, = scraper.driver_pool.drivers
+    assert list(driver.tab_urls) == ['tab-0']
+
+
+def test_quarantined_task_takes_no_browser(server):
+    quarantine = TaskQuarantine(max_num_failures=1)
+    quarantine.record_failure('shirt', error='broken')
+    tasks = [make_task(server, task_id) for task_id in ['shirt', 'dress']]
+    scraper = make_scraper(server, tasks, quarantine=quarantine)
+    scraper.run()
+
+    assert scraper.failed_task_ids == {'shirt'}
+    assert len(scraper.driver_pool.drivers) == 1
+    assert scraper.result_map['dress'].num_items == server.num_items
+
+
+def test_items_are_read_from_the_dom_without_capture(server):
+    # the fake browser has no bidi connection, network capture can't start
+    task = make_task(server, 'shirt')
+    scraper = make_scraper(server, [task], capture=True)
+    scraper.run()
+
+    assert scraper.failed_task_ids == set()
+    assert [item.id for item in scraper.result_map[task.id].items] == expected_ids(server)
@@ -0,0 +1,115 @@
+import json
+import base64
+import threading
+
+import pytest
+import trio
+from trio_websocket import serve_websocket, ConnectionClosed
+
+from common.network_capture import NetworkCapture, start_capture
+
+SEARCH_BODY = {'items': [{'id': 'm1'}, {'id': 'm2'}]}
+
+
+# answers the bidi commands of NetworkCapture like firefox does and sends a search
+# response, an unrelated one and a non-json one once subscribed. Without collectors, it
+# answers like a Firefox older than 143
+class FakeBidiBrowser:
+    def __init__(self, collectors: bool = True) -> None:
+        self.collectors = collectors
+        self.methods = []
+        self.url = None
+        self.trio_token = None
+        self.started = threading.Event()
+        self.thread = threading.Thread(target=trio.run, args=(self._serve,), daemon=True)
+
+    def __enter__(self) -> 'FakeBidiBrowser':
+        self.thread.start()
+        self.started.wait(timeout=5)
+        return self
+
+    def __exit__(self, *exc):
+        self.trio_token.run_sync_soon(self.cancel_scope.cancel)
+        self.thread.join(timeout=5)
+
+    @property
+    def capabilities(self):
+        return {'webSocketUrl': self.url}
+
+    async def _serve(self):
+        with trio.CancelScope() as self.cancel_scope:
+            async with trio.open_nursery() as nursery:
+                server = await nursery.start(serve_websocket, self._handle, '127.0.0.1', 0, None)
+                self.url = f'ws://127.0.0.1:{server.port}/session'
+                self.trio_token = trio.lowlevel.current_trio_token()
+                self.started.set()
+
+    async def _handle(self, request):
+        websocket = await request.accept()
+        try:
+            while True:
+                message = json.loads(await websocket.get_message())
+                self.methods.append(message['method'])
+                if message['method'] == 'network.addDataCollector' and not self.collectors:
+                    await websocket.send_message(json.dumps({
+                        'type': 'error', 'id': message['id'], 'error': 'unknown command', 'message': message['method'],
+                    }))
+                    continue
+                await websocket.send_message(json.dumps({'type': 'success', 'id': message['id'], 'result': self._result(message)}))
+                if message['method'] == 'session.subscribe':
+                    for request_id, url, mime_type in [
+                        ('r1', 'https://example.com/static/app.json', 'application/json'),
+                        ('r2', 'https://api.example.com/v2/entities:search', 'text/html'),
+                        ('r3', 'https://api.example.com/v2/entities:search', 'application/json'),
+                    ]:
+                        await websocket.send_message(json.dumps({'type': 'event', 'method': 'network.responseCompleted', 'params': {
+                            'request': {'request': request_id},
+                            'response': {'url': url, 'status': 200, 'mimeType': mime_type},
+                        }}))
+        except ConnectionClosed:
+            pass
+
+    def _result(self, message):
+        if message['method'] == 'network.addDataCollector':
+            return {'collector': 'c1'}
+        if message['method'] == 'session.subscribe':
+            return {'subscription': 's1'}
+        if message['method'] == 'network.getData':
+            assert message['params'] == {'dataType': 'response', 'collector': 'c1', 'request': 'r3', 'disown': True}
+            return {'bytes': {'type': 'base64', 'value': base64.b64encode(json.dumps(SEARCH_BODY).encode()).decode()}}
+        return {}
+
+
+def test_captures_matching_json_responses():
+    with FakeBidiBrowser() as browser:
+        with NetworkCapture(browser, r'entities:search') as capture:
+            responses = capture.wait(timeout=5)
+        assert [(response.status, response.body) for response in responses] == [(200, SEARCH_BODY)]
+        assert capture.error is None
+
+    # the collector and the subscription are removed on stop
+    assert browser.methods == [
+        'network.addDataCollector',
+        'session.subscribe',
+        'network.getData',
+        'session.unsubscribe',
+        'network.removeDataCollector',
+    ]
+
+
+def test_refuses_a_browser_without_bidi():
+    class Driver:
+        capabilities = {}
+
+    capture = NetworkCapture(Driver(), r'entities:search', timeout=5)
+    with pytest.raises(RuntimeError, match='bidi'):
+        capture.start()
+
+
+def test_browser_without_collectors_is_not_captured():
+    with FakeBidiBrowser(collectors=False) as browser:
+        assert start_capture(browser, r'entities:search') is None
+        assert browser.methods == ['network.addDataCollector']
+        # the browser is not asked again
+        assert start_capture(browser, r'entities:search') is None
+        assert browser.methods == ['network.addDataCollector']
@@ -0,0 +1,56 @@
+import pytest
+from selenium.common.exceptions import InvalidSessionIdException, WebDriverException
+
+from common.recovery import RetryBudget, RetryPolicy, classify_error
+from conftest import import_site
+
+[vinted_scraper] = import_site('vinted', 'scraper')
+
+
+def test_classifies_firefox_error_pages_as_network_errors():
+    error = WebDriverException('Reached error page: about:neterror?e=dnsNotFound&u=https%3A//www.vinted.com/')
+    assert classify_error(error) == 'network'
+    assert classify_error(InvalidSessionIdException('invalid session id')) == 'crash'
+    assert classify_error(WebDriverException('something else')) == 'other'
+
+
+def test_network_errors_are_retried():
+    budget = RetryBudget(RetryPolicy(backoff=0))
+    error = WebDriverException('Reached error page: about:neterror?e=netTimeout')
+    attempts = {}
+    assert [budget.retry(error, attempts) for _ in range(4)] == [0, 0, 0, None]
+
+
+class FakeDriver:
+    def execute(self, driver_command, params=None):
+        return {'value': None}
+
+
+class FakePool:
+    def __init__(self) -> None:
+        self.released = []
+
+    def acquire(self):
+        return FakeDriver()
+
+    def release(self, driver, broken=False):
+        self.released.append(broken)
+
+
+def test_crashed_browser_is_released_broken_on_the_last_attempt(monkeypatch):
+    pool = FakePool()
+    scraper = vinted_scraper.VintedSearchScraper(
+        verbose=False,
+        driver_pool=pool,
+        max_num_page_retries=1,
+        retry_policy=RetryPolicy(backoff=0),
+    )
+
+    def crash(task, page_idx):
+        raise InvalidSessionIdException('invalid session id')
+
+    monkeypatch.setattr(scraper, '_do_scrape_page', crash)
+    task = vinted_scraper.VintedSearchScrapeTask(id='t', search_text='shirt', max_num_items=10, max_num_pages=1, scrape_item_page=False)
+    with pytest.raises(InvalidSessionIdException):
+        scraper._scrape_page(task, 1, RetryBudget(scraper.retry_policy))
+    assert pool.released == [True, True]
@@ -0,0 +1,92 @@
+import json
+
+from common.pacing import Pacer
+from common.sharding import ShardPlanner, PriceBands, Choices
+from conftest import import_site
+from fakes import FakeVintedPool
+
+vinted_scraper, vinted_sharded_scraper = import_site('vinted', 'scraper', 'sharded_scraper')
+
+# one item per price from 0 to 999, ten of them per price from 100 to 109
+PRICES = list(range(1000)) + [price for price in range(100, 110) for _ in range(9)]
+
+
+def num_results(shard):
+    return sum(
+        1 for price in PRICES
+        if shard.get('price_from', 0) <= price < (shard['price_to'] if 'price_to' in shard else float('inf'))
+        and shard.get('order', 'a') == 'a'
+    )
+
+
+def test_capped_bands_are_split_until_under_the_cap():
+    cap = 60
+    rounds = []
+
+    def run_shards(shards):
+        rounds.append(shards)
+        return [num_results(shard) >= cap for shard in shards]
+
+    planner = ShardPlanner([PriceBands('price_from', 'price_to', [0, 100, 500, None], min_width=1)])
+    shards = planner.run(run_shards)
+
+    assert rounds[0] == [{}]
+    assert rounds[1] == [
+        {'price_from': 0, 'price_to': 100},
+        {'price_from': 100, 'price_to': 500},
+        {'price_from': 500},
+    ]
+    assert shards == [shard for shards in rounds for shard in shards]
+
+    # the shards which were not split cover every price once, each under the cap
+    leaves = [shard for shard in shards if num_results(shard) < cap]
+    assert sum(num_results(shard) for shard in leaves) == len(PRICES)
+    assert all(num_results(shard) < cap for shard in leaves)
+    # the open top band is split at twice its lower bound
+    assert {'price_from': 500, 'price_to': 1000} in shards
+    assert {'price_from': 1000} in shards
+
+
+def test_band_too_narrow_to_split_moves_on_to_the_next_splitter():
+    bands = PriceBands('price_from', 'price_to', [0, 10], min_width=5)
+    assert bands.split({'price_from': 0, 'price_to': 10}) == [{'price_from': 0, 'price_to': 5}, {'price_from': 5, 'price_to': 10}]
+    assert bands.split({'price_from': 0, 'price_to': 5}) == []
+
+    planner = ShardPlanner([bands, Choices('order', ['a', 'b'])])
+    assert planner.split({'price_from': 0, 'price_to': 5}) == [
+        {'price_from': 0, 'price_to': 5, 'order': 'a'},
+        {'price_from': 0, 'price_to': 5, 'order': 'b'},
+    ]
+    assert planner.split({'price_from': 0, 'price_to': 5, 'order': 'a'}) == []
+
+
+def test_planner_stops_at_max_num_shards():
+    planner = ShardPlanner([PriceBands('price_from', 'price_to', [0, 1000], min_width=1)], max_num_shards=5)
+    shards = planner.run(lambda shards: [True] * len(shards))
+    assert len(shards) == 5
+
+
+def test_sharded_rounds_share_the_browsers_and_the_metrics(server, monkeypatch):
+    monkeypatch.setattr(vinted_scraper, 'wait_network_idle', lambda *args, **kwargs: True)
+    monkeypatch.setattr(vinted_scraper.VintedSearchScraper, '_pretend_to_scroll', lambda *args, **kwargs: None)
+    pool = FakeVintedPool(server)
+    task = vinted_scraper.VintedSearchScrapeTask(
+        id='sharded', search_text='shirt', max_num_items=10000, max_num_pages=10, scrape_item_page=False, base_url=server.url
+    )
+    scraper = vinted_sharded_scraper.VintedShardedScraper(
+        task,
+        cap=100,
+        max_num_shards=7,
+        max_num_sessions=3,
+        verbose=False,
+        driver_pool=pool,
+        pacer=Pacer(rate=1e6, burst=1e6, min_interval=0, jitter=0),
+    )
+    result = scraper.run()
+
+    # the stand-in server ignores the filters, every shard sees the same two pages
+    assert result.num_items == 2 * server.vinted_per_page
+    assert pool.max_num_in_use <= 3
+    # a root shard, then the six price bands, two pages each
+    with open('metrics/vinted_search.json') as file:
+        assert json.load(file)['counters']['pages'] == 14
@@ -0,0 +1,118 @@
+import asyncio
+import threading
+from time import sleep, monotonic
+
+import pytest
+
+from common.checkpoint import CheckpointStore
+from common.pacing import Pacer
+from common.streaming import ItemStream, StreamClosed
+from conftest import import_site
+from fakes import FakeVintedPool
+
+vinted_scraper, = import_site('vinted', 'scraper')
+
+
+def produce(stream, items, produced):
+    try:
+        for item in items:
+            stream.put([item])
+            produced.append(item)
+        stream.finish()
+    except StreamClosed:
+        produced.append('closed')
+
+
+def test_producer_waits_for_a_slow_consumer():
+    stream = ItemStream(max_num_buffered=3, poll_interval=0.05)
+    produced = []
+    thread = threading.Thread(target=produce, args=(stream, range(20), produced))
+    thread.start()
+    sleep(0.2)
+    assert len(produced) == 3
+
+    consumed = []
+    for item in stream:
+        consumed.append(item)
+        assert len(produced) <= len(consumed) + 4
+    thread.join()
+    assert consumed == list(range(20))
+
+
+def test_consumer_closing_early_stops_the_producer():
+    stream = ItemStream(max_num_buffered=2, poll_interval=0.05)
+    produced = []
+    thread = threading.Thread(target=produce, args=(stream, range(100), produced))
+    thread.start()
+    for item in stream:
+        if item == 4:
+            break
+    stream.close()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert produced[-1] == 'closed'
+    assert len(produced) < 10
+
+
+def test_error_is_raised_after_the_items_before_it():
+    stream = ItemStream()
+    stream.put([1, 2])
+    stream.finish(RuntimeError('task failed'))
+    consumed = []
+    with pytest.raises(RuntimeError, match='task failed'):
+        for item in stream:
+            consumed.append(item)
+    assert consumed == [1, 2]
+
+
+def test_async_consumer():
+    stream = ItemStream(max_num_buffered=2, poll_interval=0.05)
+    produced = []
+    thread = threading.Thread(target=produce, args=(stream, range(10), produced))
+    thread.start()
+
+    async def consume():
+        return [item async for item in stream]
+
+    assert asyncio.run(consume()) == list(range(10))
+    thread.join()
+
+
+def make_scraper(server, monkeypatch):
+    monkeypatch.setattr(vinted_scraper, 'wait_network_idle', lambda *args, **kwargs: True)
+    monkeypatch.setattr(vinted_scraper.VintedSearchScraper, '_pretend_to_scroll', lambda *args, **kwargs: None)
+    return vinted_scraper.VintedSearchScraper(
+        verbose=False,
+        driver_pool=FakeVintedPool(server),
+        pacer=Pacer(rate=1e6, burst=1e6, min_interval=0, jitter=0),
+        checkpoint=CheckpointStore(),
+        max_num_sessions=1,
+    )
+
+
+def test_breaking_out_of_iter_items_stops_the_task_and_resume_continues(server, monkeypatch):
+    task = vinted_scraper.VintedSearchScrapeTask(
+        id='streamed', search_text='shirt', max_num_items=1000, max_num_pages=10, scrape_item_page=False, base_url=server.url
+    )
+    item_ids = [server.vinted_item(idx)['id'] for idx in range(server.num_items)]
+    scraper = make_scraper(server, monkeypatch)
+
+    consumed = []
+    for item in scraper.iter_items(task, max_num_buffered=5):
+        consumed.append(item.id)
+        if len(consumed) == 10:
+            break
+    assert consumed == item_ids[:10]
+
+    deadline = monotonic() + 5
+    while 'streamed' in scraper.streams and monotonic() < deadline:
+        sleep(0.05)
+    assert 'streamed' not in scraper.streams
+    # the first page was saved before its items were handed over, the task stopped there
+    assert CheckpointStore().load('streamed')['page_idx'] == 1
+    assert scraper.result_map['streamed'].pages[0].items == []
+
+    rest = [item.id for item in scraper.iter_items(task, resume=True)]
+    assert rest == item_ids[server.vinted_per_page:]
+    loaded = vinted_scraper.VintedSearchScrapeResult.load('results/streamed.jsonl')
+    assert [item.id for item in loaded.items] == item_ids
@@ -0,0 +1,111 @@
+from time import sleep
+
+from common.pacing import Pacer
+from common.task_queue import TaskQueue, QueueWorker
+from conftest import import_site
+from fakes import FakeVintedPool
+
+vinted_scraper, vinted_queue_runner = import_site('vinted', 'scraper', 'queue_runner')
+
+
+def test_claim_leases_the_oldest_task_once(workdir):
+    queue = TaskQueue(path=str(workdir / 'tasks.db'))
+    assert queue.put('vinted', 'a', {'n': 1})
+    assert queue.put('vinted', 'b', {'n': 2})
+    assert not queue.put('vinted', 'a', {'n': 3})
+
+    task = queue.claim('vinted', 'w1')
+    assert (task.id, task.payload, task.num_attempts) == ('a', {'n': 1}, 1)
+    assert queue.claim('vinted', 'w2').id == 'b'
+    assert queue.claim('vinted', 'w3') is None
+    assert queue.claim('mercari', 'w3') is None
+    assert queue.stats('vinted') == {'leased': 2}
+
+
+def test_expired_lease_is_claimed_by_another_worker(workdir):
+    queue = TaskQueue(path=str(workdir / 'tasks.db'), lease=0.2)
+    queue.put('vinted', 'a', {})
+    first = queue.claim('vinted', 'w1')
+    assert queue.heartbeat(first, progress={'num_items': 10})
+    assert queue.claim('vinted', 'w2') is None
+
+    sleep(0.3)
+    assert queue.stats('vinted') == {'pending': 1}
+    second = queue.claim('vinted', 'w2')
+    assert (second.id, second.num_attempts) == ('a', 2)
+
+    # the first worker lost its lease and can't touch the task anymore
+    assert not queue.heartbeat(first)
+    assert not queue.complete(first, result={'num_items': 10})
+    assert queue.complete(second, result={'num_items': 20})
+    task = queue.tasks('vinted')['a']
+    assert (task['status'], task['worker_id'], task['result'], task['progress']) == ('done', 'w2', {'num_items': 20}, {'num_items': 10})
+    assert queue.claim('vinted', 'w3') is None
+
+
+def test_failed_task_is_given_up_after_max_num_attempts(workdir):
+    queue = TaskQueue(path=str(workdir / 'tasks.db'), max_num_attempts=2)
+    queue.put('vinted', 'a', {})
+    assert queue.fail(queue.claim('vinted', 'w1'), error='first')
+    assert queue.stats('vinted') == {'pending': 1}
+    assert queue.fail(queue.claim('vinted', 'w1'), error='second')
+    assert queue.claim('vinted', 'w1') is None
+    task = queue.tasks('vinted')['a']
+    assert (task['status'], task['num_attempts'], task['error']) == ('failed', 2, 'second')
+
+
+def test_expired_lease_out_of_attempts_is_given_up(workdir):
+    queue = TaskQueue(path=str(workdir / 'tasks.db'), lease=0.1, max_num_attempts=1)
+    queue.put('vinted', 'a', {})
+    queue.claim('vinted', 'w1')
+    sleep(0.2)
+    assert queue.claim('vinted', 'w2') is None
+    assert queue.tasks('vinted')['a']['status'] == 'failed'
+
+
+def test_worker_runs_every_task_and_fails_the_broken_ones(workdir):
+    queue = TaskQueue(path=str(workdir / 'tasks.db'), max_num_attempts=2)
+    for task_id in ['a', 'b', 'c']:
+        queue.put('vinted', task_id, {'fail': task_id == 'b'})
+
+    def run_task(task):
+        if task.payload['fail']:
+            raise RuntimeError('broken')
+        return {'ok': task.id}
+
+    QueueWorker(queue, site='vinted', run_task=run_task, num_workers=2, wait=False).run()
+
+    tasks = queue.tasks('vinted')
+    assert {task_id: task['status'] for task_id, task in tasks.items()} == {'a': 'done', 'b': 'failed', 'c': 'done'}
+    assert tasks['b']['num_attempts'] == 2
+    assert tasks['a']['result'] == {'ok': 'a'}
+
+
+def test_queue_runner_scrapes_the_queued_tasks(server, workdir, monkeypatch):
+    monkeypatch.setattr(vinted_scraper, 'wait_network_idle', lambda *args, **kwargs: True)
+    monkeypatch.setattr(vinted_scraper.VintedSearchScraper, '_pretend_to_scroll', lambda *args, **kwargs: None)
+    queue = TaskQueue(path=str(workdir / 'tasks.db'))
+    tasks = [
+        vinted_scraper.VintedSearchScrapeTask(
+            id=task_id, search_text=task_id, max_num_items=1000, max_num_pages=10, scrape_item_page=False, base_url=server.url
+        )
+        for task_id in ['shirt', 'dress']
+    ]
+    assert vinted_queue_runner.enqueue(queue, tasks) == 2
+
+    runner = vinted_queue_runner.VintedQueueRunner(
+        queue,
+        num_workers=2,
+        wait=False,
+        verbose=False,
+        driver_pool=FakeVintedPool(server),
+        pacer=Pacer(rate=1e6, burst=1e6, min_interval=0, jitter=0),
+    )
+    runner.run()
+
+    for task_id, task in queue.tasks('vinted').items():
+        assert task['status'] == 'done'
+        assert task['result']['num_pages'] == 5
+        assert task['result']['num_items'] == server.num_items
+        loaded = vinted_scraper.VintedSearchScrapeResult.load(f'results/{task_id}.jsonl')
+        assert loaded.num_items == server.num_items
@@ -0,0 +1,64 @@
+from common.checkpoint import CheckpointStore
+from common.pacing import Pacer
+from conftest import import_site
+from fakes import FakeVintedPool
+
+[vinted_scraper] = import_site('vinted', 'scraper')
+
+
+def make_scraper(server, monkeypatch, failing_pages=(), **kwargs):
+    monkeypatch.setattr(vinted_scraper, 'wait_network_idle', lambda *args, **kwargs: True)
+    task = vinted_scraper.VintedSearchScrapeTask(
+        id='pages', search_text='shirt', max_num_items=1000, max_num_pages=10, scrape_item_page=False, base_url=server.url
+    )
+    scraper = vinted_scraper.VintedSearchScraper(
+        verbose=False,
+        tasks=[task],
+        driver_pool=FakeVintedPool(server, failing_pages),
+        pacer=Pacer(rate=1e6, burst=1e6, min_interval=0, jitter=0),
+        max_num_sessions=3,
+        **kwargs
+    )
+    monkeypatch.setattr(scraper, '_pretend_to_scroll', lambda *args, **kwargs: None)
+    return scraper
+
+
+def test_pages_fetched_side_by_side_are_saved_in_order(server, monkeypatch):
+    scraper = make_scraper(server, monkeypatch)
+    scraper.run()
+
+    result = scraper.result_map['pages']
+    # 300 items fill 4 pages, the empty 5th ends the task and later pages are dropped
+    assert [page.page_idx for page in result.pages] == [1, 2, 3, 4, 5]
+    assert [item.id for item in result.items] == [server.vinted_item(idx)['id'] for idx in range(server.num_items)]
+    loaded = vinted_scraper.VintedSearchScrapeResult.load('results/pages.jsonl')
+    assert [page.page_idx for page in loaded.pages] == [1, 2, 3, 4, 5]
+
+
+def test_failed_page_past_the_end_is_dropped(server, monkeypatch):
+    checkpoint = CheckpointStore()
+    scraper = make_scraper(server, monkeypatch, failing_pages={6}, checkpoint=checkpoint)
+    scraper.run()
+
+    assert scraper.failed_task_ids == set()
+    assert [page.page_idx for page in scraper.result_map['pages'].pages] == [1, 2, 3, 4, 5]
+    assert checkpoint.load('pages') == {'finished': True}
+
+
+def test_failed_page_stops_the_task(server, monkeypatch):
+    checkpoint = CheckpointStore()
+    scraper = make_scraper(server, monkeypatch, failing_pages={3}, checkpoint=checkpoint)
+    scraper.run()
+
+    assert scraper.failed_task_ids == {'pages'}
+    assert [page.page_idx for page in scraper.result_map['pages'].pages] == [1, 2]
+    assert not checkpoint.load('pages')['finished']
+
+
+def test_pages_are_read_from_the_dom_without_capture(server, monkeypatch):
+    # the fake browsers have no bidi connection, network capture can't start
+    scraper = make_scraper(server, monkeypatch, extract_mode='capture')
+    scraper.run()
+
+    assert scraper.failed_task_ids == set()
+    assert [item.id for item in scraper.result_map['pages'].items] == [server.vinted_item(idx)['id'] for idx in range(server.num_items)]
@@ -0,0 +1,46 @@
+from typing import Any, Dict, List
+
+from models import (
+    VintedSearchItem,
+)
+
+__all__ = [
+    'parse_catalog_item',
+    'parse_catalog_items',
+]
+
+
+def _format_price(price: Any) -> str:
+    # newer responses nest the amount, older ones have a plain string
+    if isinstance(price, dict):
+        amount = price.get('amount', '')
+        currency = price.get('currency_code', '')
+        return f"{amount} {currency}".strip()
+    return str(price) if price is not None else ""
+
+
+# brand is the card title, size and condition the subtitle, the listing title the description
+def parse_catalog_item(data: Dict[str, Any]) -> VintedSearchItem:
+    item = VintedSearchItem()
+    item.id = str(data.get('id', ''))
+    item.url = (data.get('url') or '').split('?')[0]
+    item.owner = (data.get('user') or {}).get('login', '')
+    item.description = data.get('title') or ''
+    item.brand = data.get('brand_title') or ''
+    item.size = data.get('size_title') or ''
+    item.price = _format_price(data.get('price'))
+    item.title = item.brand
+    item.subtitle = ' · '.join(part for part in [item.size, data.get('status') or ''] if part)
+
+    # full size photos when the response has them, otherwise the cover photo only
+    photos = data.get('photos') or [data.get('photo') or {}]
+    for photo in photos:
+        img_url = photo.get('full_size_url') or photo.get('url')
+        if img_url:
+            item.img_urls.append(img_url)
+
+    return item
+
+
+def parse_catalog_items(response: Dict[str, Any]) -> List[VintedSearchItem]:
+    return [parse_catalog_item(data) for data in response.get('items') or []]
@@ -0,0 +1,206 @@
+import os
+import sys
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+from models import (
+    VintedSearchPage,
+)
+from api import parse_catalog_items
+from scraper import (
+    DELTA_FIELDS,
+    commit_page,
+    VintedSearchScrapeTask,
+    VintedSearchScrapeResult,
+    VintedSearchScraper,
+)
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from common.result_writer import JsonlResultWriter
+from common.downloader import ImageDownloader
+from common.item_index import ItemIndex
+from common.delta import DeltaTracker
+from common.checkpoint import CheckpointStore, MemoryCheckpointStore
+from common.pacing import Pacer
+from common.driver_pool import DriverPool
+from common.http_session import HttpSession, Blocked
+from common.log_pipeline import LogPipeline
+
+__all__ = [
+    'VintedSearchHttpScraper',
+]
+
+
+# VintedSearchScrapeTasks over the catalog JSON endpoint, blocked tasks go to VintedSearchScraper
+class VintedSearchHttpScraper:
+    def __init__(
+        self,
+        verbose: bool = True,
+        tasks: List[VintedSearchScrapeTask] = [],
+        per_page: int = 96,
+        max_num_threads: int = 4,
+        downloader: Optional[ImageDownloader] = None,
+        item_index: Optional[ItemIndex] = None,
+        checkpoint: Optional[CheckpointStore] = None,
+        pacer: Optional[Pacer] = None,
+        fallback: bool = True,
+        driver_pool: Optional[DriverPool] = None,
+        log_pipeline: Optional[LogPipeline] = None,
+    ) -> None:
+        # records are written off the worker threads, to logs/{task.id}.log per task
+        self.log_pipeline = log_pipeline if log_pipeline is not None else LogPipeline.shared()
+        self.logger = logging.getLogger(name='VintedSearchHttpScraper')
+        self.logger.setLevel(logging.INFO)
+        self.log_pipeline.attach(self.logger, console=verbose)
+
+        self.tasks = list(tasks)
+        for task in self.tasks:
+            assert task.id is not None and len(task.id) > 0
+
+        ts = self._timestamp()
+        self.result_map = {
+            task.id: VintedSearchScrapeResult(task=task, commit_ts=ts, launch_ts=ts, finish_ts=ts, pages=[])
+            for task in self.tasks
+        }
+
+        self.per_page = per_page
+        self.max_num_threads = max_num_threads
+        self.downloader = downloader
+        self.item_index = item_index
+        # without a store, progress is kept in memory for the browser to take over from
+        self.checkpoint = checkpoint if checkpoint is not None else MemoryCheckpointStore()
+        self.pacer = pacer if pacer is not None else Pacer()
+        # one session per origin of the tasks, see VintedSearchScrapeTask.base_url
+        self.sessions: Dict[str, HttpSession] = {}
+        self.sessions_lock = threading.Lock()
+
+        # blocked tasks go to the browser, launched only if that ever happens
+        self.fallback = fallback
+        self.driver_pool = driver_pool
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=self.max_num_threads, thread_name_prefix='VintedSearchHttpWorker') as executor:
+            list(executor.map(self._run_task, self.tasks))
+        for session in self.sessions.values():
+            session.close()
+
+    def _session(self, task: VintedSearchScrapeTask) -> HttpSession:
+        with self.sessions_lock:
+            session = self.sessions.get(task.base_url)
+            if session is None:
+                session = self.sessions[task.base_url] = HttpSession(base_url=task.base_url, pacer=self.pacer, pool_maxsize=self.max_num_threads)
+            return session
+
+    def _run_task(self, task: VintedSearchScrapeTask):
+        with self.log_pipeline.task(task.id):
+            try:
+                self._execute_task(task)
+            except (Blocked, requests.HTTPError) as e:
+                self.logger.warning(msg=f"task {task.id} blocked over http: {e}")
+                if self.fallback:
+                    self._fallback(task)
+            except Exception:
+                self.logger.exception(msg=f"task {task.id} failed")
+
+    def _execute_task(self, task: VintedSearchScrapeTask):
+        result = self.result_map[task.id]
+        result.launch_ts = self._timestamp()
+
+        writer = JsonlResultWriter(path=f'results/{task.id}.jsonl', mode='w')
+        writer.write('task', task=task, commit_ts=result.commit_ts, launch_ts=result.launch_ts)
+
+        num_items_scraped = 0
+        seen_ids = set()
+        page_idx = 0
+        session = self._session(task)
+
+        tracker = None
+        if task.delta:
+            assert self.item_index is not None, "delta crawls need an item index"
+            tracker = DeltaTracker(self.item_index, 'vinted', urlsplit(task.url).query, fields=DELTA_FIELDS)
+
+        try:
+            while page_idx < task.max_num_pages and num_items_scraped < task.max_num_items:
+                page_idx += 1
+                response = session.get_json('/api/v2/catalog/items', params={
+                    **task.params,
+                    'page': page_idx,
+                    'per_page': self.per_page,
+                })
+                self.logger.info(msg=f"fetch catalog page {page_idx} of {task.search_text}")
+
+                items = parse_catalog_items(response)
+                if len(items) == 0:
+                    break
+                num_items_scraped += len(items)
+
+                # same state as VintedSearchScraper's, so the browser can take over from here
+                page = VintedSearchPage(page_idx=page_idx, items=items)
+                commit_page(
+                    result, page, seen_ids, num_items_scraped, writer,
+                    item_index=self.item_index, tracker=tracker, checkpoint=self.checkpoint, downloader=self.downloader
+                )
+
+                if tracker is not None and tracker.reached:
+                    self.logger.info(msg=f"task {task.id} reached the items of the run of {tracker.mark_ts or 'earlier runs'} on page {page_idx}")
+                    break
+                total_pages = (response.get('pagination') or {}).get('total_pages')
+                if total_pages is not None and page_idx >= total_pages:
+                    break
+        finally:
+            writer.close()
+
+        if tracker is not None:
+            tracker.finish()
+        self.checkpoint.save(task.id, {'finished': True})
+        self.logger.info(msg=(
+            f"task {task.id} finished with {result.num_pages} pages and {result.num_items} new items, "
+            f"{result.num_known_items} known items skipped"
+            + (f", {len(result.deltas)} of them changed" if task.delta else "")
+        ))
+
+    def _fallback(self, task: VintedSearchScrapeTask):
+        self.logger.info(msg=f"fall back to the browser for task {task.id}")
+        # the browsers are quit once done unless the pool was given
+        with VintedSearchScraper(
+            verbose=False,
+            tasks=[task],
+            downloader=self.downloader,
+            item_index=self.item_index,
+            checkpoint=self.checkpoint,
+            pacer=self.pacer,
+            driver_pool=self.driver_pool,
+            log_pipeline=self.log_pipeline,
+        ) as scraper:
+            scraper.run(resume=True)
+        result = scraper.result_map[task.id]
+        # known items met over http before the block
+        result.known_ids |= self.result_map[task.id].known_ids
+        self.result_map[task.id] = result
+
+    def _timestamp(self):
+        return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+if __name__ == "__main__":
+    task = VintedSearchScrapeTask(
+        id='123456789',
+        search_text='earring',
+        max_num_items=1000,
+        max_num_pages=3,
+        scrape_item_page=False,
+    )
+
+    scraper = VintedSearchHttpScraper(
+        tasks=[task],
+        verbose=True,
+        checkpoint=CheckpointStore(),
+    )
+
+    scraper.run()
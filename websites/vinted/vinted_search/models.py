@@ -1,13 +1,19 @@
+import sys
 from dataclasses import dataclass, field
-from typing import List
+from itertools import chain
+from typing import ClassVar, Iterator, List, Sequence, Tuple
 
 __all__ = [
     'VintedSearchItem',
     'VintedSearchPage',
+    'PagedItems',
 ]
 
-@dataclass
+@dataclass(slots=True)
 class VintedSearchItem:
+    # few distinct values over many items, interned by compact()
+    categorical_fields: ClassVar[Tuple[str, ...]] = ('brand', 'size', 'price', 'subtitle')
+
     id: str = field(default="")
     url: str = field(default="")
     owner: str = field(default="")
@@ -23,8 +29,16 @@ class VintedSearchItem:
     def num_imgs(self) -> int:
         return len(self.img_urls)
 
+    # share one string per distinct value of the categorical fields
+    def compact(self) -> 'VintedSearchItem':
+        for name in self.categorical_fields:
+            value = getattr(self, name)
+            if type(value) is str:
+                setattr(self, name, sys.intern(value))
+        return self
+
 
-@dataclass
+@dataclass(slots=True)
 class VintedSearchPage:
     page_idx: int = field(default=-1)
     items: List[VintedSearchItem] = field(default_factory=list)
@@ -32,3 +46,26 @@ class VintedSearchPage:
     @property
     def num_items(self) -> int:
         return len(self.items)
+
+
+# read-only view of the items of a list of pages, in order, without copying them
+class PagedItems(Sequence):
+    def __init__(self, pages: List[VintedSearchPage]) -> None:
+        self.pages = pages
+
+    def __len__(self) -> int:
+        return sum(len(page.items) for page in self.pages)
+
+    def __iter__(self) -> Iterator[VintedSearchItem]:
+        return chain.from_iterable(page.items for page in self.pages)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return list(self)[idx]
+        if idx < 0:
+            idx += len(self)
+        for page in self.pages:
+            if 0 <= idx < len(page.items):
+                return page.items[idx]
+            idx -= len(page.items)
+        raise IndexError('item index out of range')
@@ -0,0 +1,90 @@
+import os
+import sys
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from scraper import (
+    VintedSearchScrapeTask,
+    VintedSearchScrapeResult,
+    VintedSearchScraper,
+)
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from common.task_queue import TaskQueue
+from common.queue_runner import QueueRunner
+
+__all__ = [
+    'enqueue',
+    'VintedQueueRunner',
+]
+
+
+QUEUE_SITE = 'vinted'
+
+
+# enqueues tasks, returns how many were not in the queue yet
+def enqueue(queue: TaskQueue, tasks: List[VintedSearchScrapeTask]) -> int:
+    return sum(queue.put(QUEUE_SITE, task.id, asdict(task)) for task in tasks)
+
+
+# runs the VintedSearchScrapeTasks of a TaskQueue, the pages of each task on max_num_sessions browsers
+class VintedQueueRunner(QueueRunner):
+    def __init__(
+        self,
+        queue: TaskQueue,
+        num_workers: int = 1,
+        max_num_sessions: int = 2,
+        worker_id: Optional[str] = None,
+        wait: bool = True,
+        headless: bool = False,
+        verbose: bool = True,
+        **scraper_kwargs,
+    ) -> None:
+        self.max_num_sessions = max_num_sessions
+        super().__init__(
+            queue,
+            site=QUEUE_SITE,
+            num_workers=num_workers,
+            num_drivers=num_workers * max_num_sessions,
+            bidi=scraper_kwargs.get('extract_mode') == 'capture',
+            worker_id=worker_id,
+            wait=wait,
+            headless=headless,
+            verbose=verbose,
+            **scraper_kwargs
+        )
+
+    def create_scraper(self, payload: Dict[str, Any]) -> Tuple[VintedSearchScrapeTask, VintedSearchScraper]:
+        task = VintedSearchScrapeTask(**payload)
+        scraper = VintedSearchScraper(
+            verbose=self.verbose,
+            tasks=[task],
+            max_num_sessions=self.max_num_sessions,
+            **self.scraper_kwargs
+        )
+        return task, scraper
+
+    def summarize(self, result: VintedSearchScrapeResult) -> Dict[str, Any]:
+        return {'num_pages': result.num_pages, **super().summarize(result)}
+
+
+if __name__ == "__main__":
+    # every node opens the same queue file
+    queue = TaskQueue(path='queue/tasks.db', lease=120)
+
+    # enqueue from any node, tasks already in the queue are skipped
+    enqueue(queue, [
+        VintedSearchScrapeTask(id='earring', search_text='earring', max_num_items=1000, max_num_pages=10, scrape_item_page=False),
+        VintedSearchScrapeTask(id='necklace', search_text='necklace', max_num_items=1000, max_num_pages=10, scrape_item_page=False),
+        VintedSearchScrapeTask(id='bracelet', search_text='bracelet', max_num_items=1000, max_num_pages=10, scrape_item_page=False),
+    ])
+
+    runner = VintedQueueRunner(
+        queue=queue,
+        num_workers=1,
+        max_num_sessions=2,
+        verbose=True,
+        headless=False,
+    )
+
+    runner.run()
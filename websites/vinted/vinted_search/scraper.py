@@ -1,23 +1,48 @@
 import os
 import sys
-import json
 import random
 import logging
-from typing import Optional, List, Tuple
-from time import sleep
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, List, Set
+from time import sleep, monotonic
+from urllib.parse import urlsplit, urlencode
 from datetime import datetime
-from dataclasses import dataclass, asdict, field
+from dataclasses import dataclass, field
 
 from selenium import webdriver
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
-
+from selenium.common.exceptions import (
+    ElementClickInterceptedException,
+    ElementNotInteractableException,
+    NoSuchElementException,
+    StaleElementReferenceException,
+    TimeoutException,
+)
+from bs4 import BeautifulSoup
 
 from models import (
     VintedSearchItem,
     VintedSearchPage,
+    PagedItems,
 )
+from api import parse_catalog_items
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from common.result_writer import JsonlResultWriter, read_records
+from common.downloader import ImageDownloader
+from common.item_index import ItemIndex
+from common.delta import DeltaTracker
+from common.checkpoint import CheckpointStore
+from common.pacing import Pacer, wait_until, wait_network_idle, is_challenge_page
+from common.driver_pool import DriverPool
+from common.network_capture import NetworkCapture, start_capture
+from common.metrics import Metrics
+from common.streaming import ItemStream, StreamClosed
+from common.recovery import ChallengeError, RetryBudget, RetryPolicy, TaskQuarantine, classify_error
+from common.log_pipeline import LogPipeline, event
 
 
 __all__ = [
@@ -27,6 +52,13 @@ __all__ = [
 ]
 
 
+# the endpoint the catalog page fetches its items from when paginating
+CATALOG_API_PATTERN = r'/api/v2/catalog/items'
+
+# fields of known items whose changes delta crawls record
+DELTA_FIELDS = ('price',)
+
+
 @dataclass
 class VintedSearchScrapeTask:
     id: str
@@ -34,10 +66,31 @@ class VintedSearchScrapeTask:
     max_num_items: int
     max_num_pages: int
     scrape_item_page: bool
+    # e.g. 'newest_first', 'price_low_to_high', empty for relevance
+    order: str = field(default="")
+    # catalog query params as the site spells them, e.g. {'brand_ids[]': ['53'], 'price_to': '20'}
+    filters: Dict[str, Any] = field(default_factory=dict)
+    # another origin serving the same pages, e.g. a local stand-in
+    base_url: str = field(default="https://www.vinted.com")
+    # newest first, stops at the items earlier runs indexed and records the
+    # price changes of the known items it went through, needs an item index
+    delta: bool = field(default=False)
+
+    @property
+    def params(self) -> Dict[str, Any]:
+        params = {'search_text': self.search_text}
+        order = 'newest_first' if self.delta else self.order
+        if order:
+            params['order'] = order
+        params.update(self.filters)
+        return params
 
     @property
     def url(self) -> str:
-        return f"https://www.vinted.com/catalog?search_text={self.search_text}"
+        return f"{self.base_url}/catalog?{urlencode(self.params, doseq=True)}"
+
+    def page_url(self, page_idx: int) -> str:
+        return f"{self.url}&page={page_idx}"
 
 
 @dataclass
@@ -47,13 +100,20 @@ class VintedSearchScrapeResult:
     launch_ts: str = field(default="")
     finish_ts: str = field(default="")
     pages: List[VintedSearchPage] = field(default_factory=list)
+    # items skipped because an earlier run already scraped them
+    num_known_items: int = field(default=0)
+    # their ids, from this run only, they are not saved with the results
+    known_ids: Set[str] = field(default_factory=set)
+    # items handed to an iter_items consumer instead of being kept in pages
+    num_released_items: int = field(default=0)
+    # kept up to date by add_page
+    num_imgs: int = field(default=0)
+    # changes of known items seen by a delta crawl, {'page_idx', 'id', 'changes': {field: [old, new]}}
+    deltas: List[Dict[str, Any]] = field(default_factory=list)
 
     @property
-    def items(self) -> List[VintedSearchItem]:
-        lll = []
-        for page in self.pages:
-            lll.extend(page.items)
-        return lll
+    def items(self) -> PagedItems:
+        return PagedItems(self.pages)
 
     @property
     def num_pages(self) -> int:
@@ -61,12 +121,95 @@ class VintedSearchScrapeResult:
 
     @property
     def num_items(self) -> int:
-        return sum([page.num_items for page in self.pages])
-
-    @property
-    def num_imgs(self) -> int:
-        return sum([item.num_imgs for item in self.items])
-
+        return sum([page.num_items for page in self.pages]) + self.num_released_items
+
+    def add_page(self, page: VintedSearchPage):
+        for item in page.items:
+            item.compact()
+            self.num_imgs += item.num_imgs
+        self.pages.append(page)
+
+    @classmethod
+    def load(cls, path: str) -> 'VintedSearchScrapeResult':
+        result = cls(task=None)
+        page = None
+        for record in read_records(path):
+            if record['type'] == 'task':
+                result.task = VintedSearchScrapeTask(**record['task'])
+                result.commit_ts = record['commit_ts']
+                result.launch_ts = record['launch_ts']
+            elif record['type'] == 'page':
+                if page is not None:
+                    result.add_page(page)
+                page = VintedSearchPage(page_idx=record['page_idx'])
+            elif record['type'] == 'item':
+                page.items.append(VintedSearchItem(**record['item']))
+            elif record['type'] == 'delta':
+                result.deltas.append({key: value for key, value in record.items() if key != 'type'})
+            elif record['type'] == 'progress':
+                result.finish_ts = record['finish_ts']
+                result.num_known_items = record.get('num_known_items', 0)
+        if page is not None:
+            result.add_page(page)
+        return result
+
+
+# appends a page and the changes of its known items, read back with VintedSearchScrapeResult.load
+def save_page(result: VintedSearchScrapeResult, page: VintedSearchPage, writer: JsonlResultWriter, deltas: List[Dict[str, Any]] = []):
+    result.finish_ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    writer.write('page', page_idx=page.page_idx)
+    writer.write_items(page.items)
+    for delta in deltas:
+        writer.write('delta', **delta)
+    writer.write('progress', finish_ts=result.finish_ts, num_pages=result.num_pages, num_items=result.num_items, num_known_items=result.num_known_items)
+    writer.flush()
+
+
+# shared by the browser and the HTTP scrapers: drops the items of page seen earlier in the task
+# and the indexed ones, saves the page, then its checkpoint and the index in that order.
+# Returns the delta records of the changed indexed items
+def commit_page(
+    result: VintedSearchScrapeResult,
+    page: VintedSearchPage,
+    seen_ids: Set[str],
+    num_items_scraped: int,
+    writer: JsonlResultWriter,
+    item_index: Optional[ItemIndex] = None,
+    tracker: Optional[DeltaTracker] = None,
+    checkpoint: Optional[CheckpointStore] = None,
+    downloader: Optional[ImageDownloader] = None,
+) -> List[Dict[str, Any]]:
+    # promoted items show up on several pages
+    page.items = [item for item in page.items if item.id not in seen_ids]
+    seen_ids.update(item.id for item in page.items)
+    batch_ids = [item.id for item in page.items]
+    states = tracker.states(page.items) if tracker is not None else None
+    deltas = []
+
+    if item_index is not None:
+        known_ids = item_index.known('vinted', batch_ids)
+        result.num_known_items += len(known_ids)
+        result.known_ids.update(known_ids)
+        if tracker is not None:
+            deltas = [{'page_idx': page.page_idx, **delta} for delta in tracker.observe(page.items, known_ids)]
+        page.items = [item for item in page.items if item.id not in known_ids]
+
+    result.add_page(page)
+    result.deltas.extend(deltas)
+    save_page(result, page, writer, deltas)
+    if checkpoint is not None:
+        checkpoint.save(result.task.id, {
+            'finished': False,
+            'page_idx': page.page_idx,
+            'num_items_scraped': num_items_scraped,
+            'num_known_items': result.num_known_items,
+            'seen_ids': list(seen_ids),
+        })
+    if item_index is not None:
+        item_index.touch('vinted', batch_ids, states=states)
+    if downloader is not None:
+        downloader.submit_items(page.items)
+    return deltas
 
 
 class VintedSearchScraper:
@@ -76,26 +219,73 @@ class VintedSearchScraper:
         verbose: bool = True,
         headless: bool = False,
         tasks: List[VintedSearchScrapeTask] = [],
+        extract_mode: str = 'soup',
+        downloader: Optional[ImageDownloader] = None,
+        item_index: Optional[ItemIndex] = None,
+        checkpoint: Optional[CheckpointStore] = None,
+        pacer: Optional[Pacer] = None,
+        driver_pool: Optional[DriverPool] = None,
+        lean: bool = True,
+        max_num_sessions: int = 1,
+        max_num_page_retries: int = 2,
+        metrics: Optional[Metrics] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        quarantine: Optional[TaskQuarantine] = None,
+        log_pipeline: Optional[LogPipeline] = None,
     ) -> None:
         assert browser in ['firefox', 'chrome']
         if browser == 'chrome':
             raise RuntimeError("chrome is for losers, please use firefox")
 
-        os.makedirs('logs', exist_ok=True)
+        # 'soup': grab page_source once and parse it offline
+        # 'webdriver': query every element through the driver, several round trips per item
+        # 'capture': build items from the catalog API responses the page fetches itself, read over
+        #            WebDriver BiDi (Firefox 143+), pages rendered by the server and browsers which
+        #            can't capture are parsed like 'soup'
+        assert extract_mode in ['soup', 'webdriver', 'capture']
+        self.extract_mode = extract_mode
+
+        # images of scraped items are handed over to the downloader as they come
+        self.downloader = downloader
+        # items indexed by earlier runs are skipped
+        self.item_index = item_index
+        # task progress is saved after every page, see run(resume=True)
+        self.checkpoint = checkpoint
+        # requests to vinted are paced by a per-domain budget instead of fixed sleeps,
+        # share one pacer between scrapers to share the budget
+        self.pacer = pacer if pacer is not None else Pacer()
+
+        # pages are addressed by url and fetched by up to max_num_sessions browsers at once,
+        # a failed page is retried alone, up to max_num_page_retries times as retry_policy allows
+        # for the kind of error, on a fresh browser if its browser crashed
+        assert max_num_sessions > 0
+        self.max_num_sessions = max_num_sessions
+        self.max_num_page_retries = max_num_page_retries
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        # tasks which keep failing run after run are skipped
+        self.quarantine = quarantine
+        self.worker_local = threading.local()
+        # time per phase and counters, saved to metrics/ after every task
+        self.metrics = metrics if metrics is not None else Metrics(name='vinted_search')
+
+        # records are written off the scraping threads, to logs/{task.id}.log per task
+        self.log_pipeline = log_pipeline if log_pipeline is not None else LogPipeline.shared()
         self.logger = logging.getLogger(name='VintedSearchScraper')
         self.logger.setLevel(logging.INFO)
-        self.log_formatter = logging.Formatter(fmt="[%(levelname)s] %(asctime)s | %(message)s", datefmt='%Y-%m-%d %H:%M:%S')
-
-        if verbose:
-            handler = logging.StreamHandler(sys.stderr)
-            handler.setFormatter(self.log_formatter)
-            self.logger.addHandler(handler)
+        self.log_pipeline.attach(self.logger, console=verbose)
 
         self.tasks = tasks
         for task in self.tasks:
             # TODO: gen task uuid by {keyword+commit_ts}?
             assert task.id is not None and len(task.id) > 0
 
+        # tasks which failed or stopped on a failed page, run again with resume to continue them
+        self.failed_task_ids: Set[str] = set()
+        # tasks run by iter_items, their items go to the consumer instead of result_map
+        self.streams: Dict[str, ItemStream] = {}
+        # delta crawls running
+        self.deltas: Dict[str, DeltaTracker] = {}
+
         ts = self._timestamp()
         self.result_map = dict(zip(
             [task.id for task in tasks],
@@ -105,69 +295,371 @@ class VintedSearchScraper:
                 launch_ts=ts,
                 finish_ts=ts,
                 pages=[]
-            )]
+            ) for task in tasks]
         ))
 
-        if headless:
-            os.environ['MOZ_HEADLESS'] = '1'
-        self.webdriver = webdriver.Firefox()
+        # browsers are launched lazily and stay warm across tasks and pages
+        self.owns_driver_pool = driver_pool is None
+        if driver_pool is None:
+            driver_pool = DriverPool(max_num_drivers=max_num_sessions, headless=headless, lean=lean, bidi=extract_mode == 'capture')
+        self.driver_pool = driver_pool
 
-    # execute task sequentially
-    def run(self):
-        for task_idx, task in enumerate(self.tasks):
-            handler = logging.FileHandler(filename=f'logs/{task.id}.log', mode='a')
-            handler.setFormatter(self.log_formatter)
-            self.logger.addHandler(handler)
-            self._execute_task(task)
-            self.logger.removeHandler(handler)
+    @property
+    def webdriver(self) -> Optional[webdriver.Firefox]:
+        # the browser of the current page worker
+        return getattr(self.worker_local, 'webdriver', None)
 
-    def _execute_task(self, task: VintedSearchScrapeTask):
-        self.result_map[task.id].launch_ts = self._timestamp()
+    @property
+    def capture(self) -> Optional[NetworkCapture]:
+        return getattr(self.worker_local, 'capture', None)
+
+    # execute up to max_num_parallel_tasks tasks at a time, the pages of a task in parallel,
+    # all of them over the browsers of the pool
+    # with resume, tasks continue from their last checkpoint and finished tasks are skipped
+    def run(self, resume: bool = False, max_num_parallel_tasks: int = 1):
+        if max_num_parallel_tasks == 1:
+            for task in self.tasks:
+                self._run_task(task, resume=resume)
+            return
+        with ThreadPoolExecutor(max_workers=max_num_parallel_tasks, thread_name_prefix='VintedTaskWorker') as executor:
+            list(executor.map(lambda task: self._run_task(task, resume=resume), self.tasks))
+
+    # quits the browsers of the pool the scraper launched, once no task runs anymore
+    def close(self):
+        if self.owns_driver_pool:
+            self.driver_pool.close()
+
+    def __enter__(self) -> 'VintedSearchScraper':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # yields the new items of task page by page as they are saved, breaking out stops the task
+    def iter_items(self, task: VintedSearchScrapeTask, resume: bool = False, max_num_buffered: int = 256) -> Iterator[VintedSearchItem]:
+        stream = self._open_stream(task, resume, max_num_buffered)
+        try:
+            yield from stream
+        finally:
+            stream.close()
 
-        num_pages_scraped = 0
-        num_items_scraped = 0
+    async def aiter_items(self, task: VintedSearchScrapeTask, resume: bool = False, max_num_buffered: int = 256) -> AsyncIterator[VintedSearchItem]:
+        stream = self._open_stream(task, resume, max_num_buffered)
+        try:
+            async for item in stream:
+                yield item
+        finally:
+            stream.close()
+
+    def _open_stream(self, task: VintedSearchScrapeTask, resume: bool, max_num_buffered: int) -> ItemStream:
+        assert task.id is not None and len(task.id) > 0
+        if task.id not in self.result_map:
+            ts = self._timestamp()
+            self.result_map[task.id] = VintedSearchScrapeResult(task=task, commit_ts=ts, launch_ts=ts, finish_ts=ts, pages=[])
+        assert task.id not in self.streams, f"task {task.id} is already streamed"
+        stream = ItemStream(max_num_buffered=max_num_buffered)
+        self.streams[task.id] = stream
+        threading.Thread(target=self._stream_task, args=(task, resume, stream), name=f'VintedSearchStream-{task.id}', daemon=True).start()
+        return stream
+
+    def _stream_task(self, task: VintedSearchScrapeTask, resume: bool, stream: ItemStream):
+        error = None
+        try:
+            self._run_task(task, resume=resume)
+            if task.id in self.failed_task_ids:
+                error = RuntimeError(f"task {task.id} failed, see logs/{task.id}.log")
+        except StreamClosed:
+            self.logger.info(msg=f"task {task.id} stopped, its items are no longer consumed")
+        except Exception as e:
+            self.logger.exception(msg=f"task {task.id} failed")
+            error = e
+        finally:
+            del self.streams[task.id]
+            stream.finish(error)
+
+    # a failed task is logged and left to the next run, the other tasks go on
+    def _run_task(self, task: VintedSearchScrapeTask, resume: bool = False):
+        if self.quarantine is not None and task.id in self.quarantine:
+            self.failed_task_ids.add(task.id)
+            self.logger.warning(msg=f"task {task.id} is in quarantine, skipped")
+            return
+
+        with self.log_pipeline.task(task.id):
+            try:
+                with self.metrics.task(task.id):
+                    self._execute_task(task, resume=resume)
+            except StreamClosed:
+                raise
+            except Exception:
+                self.failed_task_ids.add(task.id)
+                self.logger.exception(msg=f"task {task.id} failed")
+            finally:
+                self.metrics.save()
+
+        if self.quarantine is None:
+            return
+        if task.id not in self.failed_task_ids:
+            self.quarantine.record_success(task.id)
+        elif self.quarantine.record_failure(task.id, error=f"see logs/{task.id}.log"):
+            self.logger.warning(msg=f"task {task.id} failed {self.quarantine.max_num_failures} runs in a row, quarantined")
+
+    def _execute_task(self, task: VintedSearchScrapeTask, resume: bool = False):
+        self.failed_task_ids.discard(task.id)
+        state = None
+        if resume and self.checkpoint is not None and os.path.exists(f'results/{task.id}.jsonl'):
+            state = self.checkpoint.load(task.id)
+
+        if state is not None and state['finished']:
+            self.result_map[task.id] = VintedSearchScrapeResult.load(f'results/{task.id}.jsonl')
+            self.logger.info(msg=f"task {task.id} already finished, skipped")
+            return
+
+        result = self.result_map[task.id]
+        if state is None:
+            result.launch_ts = self._timestamp()
+            writer = JsonlResultWriter(path=f'results/{task.id}.jsonl', mode='w')
+            writer.write('task', task=task, commit_ts=result.commit_ts, launch_ts=result.launch_ts)
+
+            num_pages_scraped = 0
+            num_items_scraped = 0
+            seen_ids = set()
+        else:
+            writer = self._restore(task, state)
+
+            num_pages_scraped = state['page_idx']
+            num_items_scraped = state['num_items_scraped']
+            seen_ids = set(state['seen_ids'])
+            self.logger.info(msg=f"resume task {task.id} after page {num_pages_scraped}")
+
+        if task.delta:
+            assert self.item_index is not None, "delta crawls need an item index"
+            self.deltas[task.id] = DeltaTracker(
+                self.item_index, 'vinted', urlsplit(task.url).query, fields=DELTA_FIELDS, record_mark=state is None
+            )
+        try:
+            failed = self._scrape_pages(task, num_pages_scraped, num_items_scraped, seen_ids, writer)
+        finally:
+            writer.close()
+            tracker = self.deltas.pop(task.id, None)
+        if failed:
+            self.failed_task_ids.add(task.id)
+            self.logger.warning(msg=f"task {task.id} stopped after {result.num_pages} pages, run again with resume to continue")
+            return
+
+        if tracker is not None:
+            tracker.finish()
+            if tracker.reached:
+                self.logger.info(msg=f"task {task.id} reached the items of the run of {tracker.mark_ts or 'earlier runs'} on page {result.num_pages}")
+        if self.checkpoint is not None:
+            self.checkpoint.save(task.id, {'finished': True})
+        self.logger.info(msg=(
+            f"task {task.id} finished with {result.num_pages} pages and {result.num_items} new items, "
+            f"{result.num_known_items} known items skipped"
+            + (f", {len(result.deltas)} of them changed" if task.delta else "")
+        ))
 
-        self.webdriver.get(task.url)
-        self.logger.info(msg=f"goto web page {task.url}")
+    def _scrape_pages(
+        self,
+        task: VintedSearchScrapeTask,
+        num_pages_scraped: int,
+        num_items_scraped: int,
+        seen_ids: Set[str],
+        writer: JsonlResultWriter
+    ) -> bool:
+        # pages come back in any order and are saved in order, pages past the end
+        # of the catalog or past max_num_items are fetched but dropped
+        futures: Dict[int, Future] = {}
+        done_pages: Dict[int, Optional[VintedSearchPage]] = {}
+        next_page_idx = num_pages_scraped + 1
+        stop_page_idx = task.max_num_pages + 1
+        # a failed page only fails the task if it is not dropped anyway
+        failed_page_idx = stop_page_idx
+        failed = False
+        budget = RetryBudget(self.retry_policy)
+
+        with ThreadPoolExecutor(max_workers=self.max_num_sessions, thread_name_prefix='VintedPageWorker') as executor:
+            while True:
+                while len(futures) < self.max_num_sessions and next_page_idx < min(stop_page_idx, failed_page_idx):
+                    futures[next_page_idx] = executor.submit(self._scrape_page, task, next_page_idx, budget)
+                    next_page_idx += 1
+                if len(futures) == 0:
+                    break
+
+                wait(futures.values(), return_when=FIRST_COMPLETED)
+                for page_idx in sorted(page_idx for page_idx, future in futures.items() if future.done()):
+                    try:
+                        done_pages[page_idx] = futures.pop(page_idx).result()
+                    except Exception:
+                        self.logger.exception(msg=f"page {page_idx} of task {task.id} failed")
+                        done_pages[page_idx] = None
+                        failed_page_idx = min(failed_page_idx, page_idx)
+
+                while num_pages_scraped + 1 in done_pages and num_pages_scraped + 1 < stop_page_idx:
+                    page = done_pages.pop(num_pages_scraped + 1)
+                    if page is None:
+                        # the task stops here and resumes from this page
+                        stop_page_idx = num_pages_scraped + 1
+                        failed = True
+                        break
+                    num_pages_scraped += 1
+                    num_items_scraped += page.num_items
+                    if page.num_items == 0 or num_items_scraped >= task.max_num_items:
+                        stop_page_idx = min(stop_page_idx, page.page_idx + 1)
+
+                    if self._commit_page(task, page, seen_ids, num_items_scraped, writer):
+                        # a delta crawl reached known items
+                        stop_page_idx = min(stop_page_idx, page.page_idx + 1)
+
+        return failed
+
+    def _commit_page(
+        self,
+        task: VintedSearchScrapeTask,
+        page: VintedSearchPage,
+        seen_ids: Set[str],
+        num_items_scraped: int,
+        writer: JsonlResultWriter
+    ) -> bool:
+        result = self.result_map[task.id]
+        num_known_items = result.num_known_items
+        tracker = self.deltas.get(task.id)
+
+        with self.metrics.time('save'):
+            deltas = commit_page(
+                result, page, seen_ids, num_items_scraped, writer,
+                item_index=self.item_index, tracker=tracker, checkpoint=self.checkpoint, downloader=self.downloader
+            )
 
-        while True:
-            self._wait_content()
+        self.logger.info(msg=f"scrape {page.num_items} new items of page {page.page_idx}")
+        if self.logger.isEnabledFor(logging.DEBUG):
+            for item in page.items:
+                self.logger.debug(msg=f"new item {item.url}", extra=event('item', page_idx=page.page_idx, id=item.id, url=item.url))
+        self.metrics.count('pages')
+        self.metrics.count('items', page.num_items)
+        self.metrics.count('images', sum(item.num_imgs for item in page.items))
+        self.metrics.count('known_items', result.num_known_items - num_known_items)
+        self.metrics.count('changed_items', len(deltas))
+
+        stream = self.streams.get(task.id)
+        if stream is not None:
+            # handed over instead of kept, saved first so the consumer only ever
+            # sees items which survive a crash
+            items = page.items
+            result.num_released_items += len(items)
+            page.items = []
+            stream.put(items)
+
+        return tracker is not None and tracker.reached
+
+    # runs on a page worker, every attempt takes a browser from the pool and a
+    # crashed browser is replaced by a new one
+    def _scrape_page(self, task: VintedSearchScrapeTask, page_idx: int, budget: RetryBudget) -> VintedSearchPage:
+        attempts: Dict[str, int] = {}
+        with self.log_pipeline.task(task.id), self.metrics.task(task.id):
+            for retry_idx in range(self.max_num_page_retries + 1):
+                driver = self.driver_pool.acquire()
+                broken = False
+                self.worker_local.webdriver = driver
+                self.metrics.watch(driver)
+                try:
+                    if self.extract_mode == 'capture':
+                        self.worker_local.capture = start_capture(driver, CATALOG_API_PATTERN, self.logger)
+                    return self._do_scrape_page(task, page_idx)
+                except Exception as e:
+                    kind = classify_error(e)
+                    # a crashed browser is quit, also when the page is given up
+                    broken = kind == 'crash'
+                    if broken:
+                        self.metrics.count('crashes')
+                    delay = budget.retry(e, attempts) if retry_idx < self.max_num_page_retries else None
+                    if delay is None:
+                        raise
+                    self.metrics.count('retries')
+                    self.logger.warning(msg=f"retry page {page_idx} of task {task.id} in {delay:.1f}s ({retry_idx + 1}/{self.max_num_page_retries}), {kind}: {e!r}")
+                finally:
+                    if self.capture is not None:
+                        self.capture.stop()
+                        self.worker_local.capture = None
+                    self.worker_local.webdriver = None
+                    self.driver_pool.release(driver, broken=broken)
+                with self.metrics.time('backoff'):
+                    sleep(delay)
+
+    def _do_scrape_page(self, task: VintedSearchScrapeTask, page_idx: int) -> VintedSearchPage:
+        url = task.page_url(page_idx)
+        self._goto(url)
+        self.logger.info(msg=f"goto web page {url}")
+
+        self._wait_content()
+        with self.metrics.time('popups'):
             self._close_domain_popup()
             self._close_cookie_popup()
+        self._wait_feed_ready()
 
+        with self.metrics.time('extraction'):
             items = self._do_scrape_items(scrape_item_page=task.scrape_item_page)
-            self.logger.info(msg=f"scrape new items: {[item.url for item in items]}")
-
-            self.result_map[task.id].pages.append(VintedSearchPage(
-                page_idx=num_pages_scraped + 1,
-                items=items
-            ))
 
-            self._save(result=self.result_map[task.id])
-
-            # NOTE: pretend to not being a robot 🤖
+        # NOTE: pretend to not being a robot 🤖
+        with self.metrics.time('scrolling'):
             self._pretend_to_scroll(
                 times=random.randint(5, 8),
-                interval=(2, 4),
                 scroll=random.randint(800, 1200)
             )
+        return VintedSearchPage(page_idx=page_idx, items=items)
 
-            num_pages_scraped += 1
-            num_items_scraped += self.result_map[task.id].pages[-1].num_items
+    def _do_scrape_items(self, scrape_item_page: bool = False) -> List[VintedSearchItem]:
+        if self.extract_mode == 'capture' and self.capture is not None:
+            items = self._do_scrape_items_from_capture()
+            if len(items) > 0:
+                return items
+        if self.extract_mode in ['soup', 'capture']:
+            return self._do_scrape_items_from_source(self.webdriver.page_source)
+        return self._do_scrape_items_from_webdriver()
+
+    # the feed is ready by now, so the catalog response of this page has been captured
+    # unless the page came rendered from the server
+    def _do_scrape_items_from_capture(self) -> List[VintedSearchItem]:
+        items: List[VintedSearchItem] = []
+        for response in self.capture.wait(timeout=1):
+            if response.status == 200:
+                items.extend(parse_catalog_items(response.body))
+        return items
 
-            if num_pages_scraped >= task.max_num_pages or num_items_scraped >= task.max_num_items:
-                break
+    def _do_scrape_items_from_source(self, page_source: str) -> List[VintedSearchItem]:
+        items: List[VintedSearchItem] = []
+        soup = BeautifulSoup(page_source, 'html.parser')
 
-            self._goto_next_page()
+        for feed_item_div in soup.select("div[class^=feed-grid__item-content]"):
+            for item_div in feed_item_div.select("div[class=new-item-box__container]"):
+                item = VintedSearchItem()
+                item.id = item_div.get('data-testid', '').split('-')[-1]
 
-        self._sleep(2, 4)
-        self.webdriver.quit()
-        self.logger.info(msg=f"task {task.id} finished with {self.result_map[task.id].num_pages} pages and {self.result_map[task.id].num_items} items")
-        self.logger.info(msg=f"{self.webdriver} exited gracefully")
+                for item_img_div in item_div.select("div[class^=new-item-box__image]"):
+                    item_img = item_img_div.select_one("img[class=web_ui__Image__content]")
+                    if item_img is not None and item_img.get('src'):
+                        item.img_urls.append(item_img.get('src'))
 
+                item_a = item_div.select_one("a[class^=new-item-box__overlay]")
+                if item_a is not None:
+                    item.url = item_a.get('href', '').split('?')[0]
+                    self._parse_item_info(item, item_a.get('title', ''))
 
-    def _do_scrape_items(self, scrape_item_page: bool = False) -> List[VintedSearchItem]:
-        self._sleep(3, 5)
+                item_title_p = item_div.select_one(f"p[data-testid$='{item.id}--description-title']")
+                item_subtitle_p = item_div.select_one(f"p[data-testid$='{item.id}--description-subtitle']")
+                item_price_p = item_div.select_one(f"p[data-testid$='{item.id}--price-text']")
+
+                if item_title_p is not None:
+                    item.title = item_title_p.get_text(strip=True)
+                if item_subtitle_p is not None:
+                    item.subtitle = item_subtitle_p.get_text(strip=True)
+                if item_price_p is not None:
+                    item.price = item_price_p.get_text(strip=True)
+
+                items.append(item)
+
+        return items
+
+    def _do_scrape_items_from_webdriver(self) -> List[VintedSearchItem]:
         items: List[VintedSearchItem] = []
 
         feed_item_divs = self.webdriver.find_elements(By.CSS_SELECTOR, "div[class^=feed-grid__item-content]")
@@ -184,31 +676,16 @@ class VintedSearchScraper:
                 # NOTE: Some item has more than one thumbnails in a collage style, there might be several
                 item_img_divs = item_div.find_elements(By.CSS_SELECTOR, "div[class^=new-item-box__image]")
                 for item_img_div in item_img_divs:
+                    # image boxes of a collage may have no image yet
                     try:
                         item_img = item_img_div.find_element(By.CSS_SELECTOR, "img[class=web_ui__Image__content]")
-                        item.img_urls.append(item_img.get_attribute('src'))
-                    except Exception as e:
-                        pass
+                    except NoSuchElementException:
+                        continue
+                    item.img_urls.append(item_img.get_attribute('src'))
 
-                # disgusting, ew...
                 item_a = item_div.find_element(By.CSS_SELECTOR, "a[class^=new-item-box__overlay]")
                 item.url = item_a.get_attribute('href').split('?')[0]
-                item_info = item_a.get_attribute('title')
-                split_idx = item_info.find('price')
-                last_comma_idx = item_info[:split_idx].rfind(',')
-                item.description = item_info[:split_idx][:last_comma_idx]
-                price_brand_size = {}
-                for kv in item_info[split_idx:].split(','):
-                    k, v = kv.split(':')
-                    k = k.strip()
-                    v = v.strip()
-                    price_brand_size[k] = v
-                    if k == 'price':
-                        item.price = v
-                    elif k == 'brand':
-                        item.brand = v
-                    elif k == 'size':
-                        item.size = v
+                self._parse_item_info(item, item_a.get_attribute('title'))
 
                 # I don't know why the fuck vinted has different data-testid for ordinary items and closet items
                 item_title_p = item_div.find_element(By.CSS_SELECTOR, f"p[data-testid$='{item.id}--description-title']")
@@ -228,71 +705,135 @@ class VintedSearchScraper:
 
         return items
 
-    def _pretend_to_scroll(self, times: int, interval: Tuple[float, float], scroll: int):
-        low = interval[0]
-        high = interval[1]
+    # disgusting, ew...
+    def _parse_item_info(self, item: VintedSearchItem, item_info: str):
+        split_idx = item_info.find('price')
+        if split_idx < 0:
+            item.description = item_info
+            return
+        last_comma_idx = item_info[:split_idx].rfind(',')
+        item.description = item_info[:split_idx][:last_comma_idx]
+        for kv in item_info[split_idx:].split(','):
+            if ':' not in kv:
+                continue
+            k, v = kv.split(':', 1)
+            k = k.strip()
+            v = v.strip()
+            if k == 'price':
+                item.price = v
+            elif k == 'brand':
+                item.brand = v
+            elif k == 'size':
+                item.size = v
+
+    # load the results saved so far and drop a page saved right before a crash
+    # but not checkpointed, it is scraped again
+    def _restore(self, task: VintedSearchScrapeTask, state: dict) -> JsonlResultWriter:
+        loaded = VintedSearchScrapeResult.load(f'results/{task.id}.jsonl')
+
+        result = self.result_map[task.id]
+        result.commit_ts = loaded.commit_ts
+        result.launch_ts = loaded.launch_ts
+        result.num_known_items = state['num_known_items']
+        result.pages = []
+        result.num_imgs = 0
+        result.deltas = [delta for delta in loaded.deltas if delta['page_idx'] <= state['page_idx']]
+
+        writer = JsonlResultWriter(path=f'results/{task.id}.jsonl', mode='w')
+        writer.write('task', task=task, commit_ts=result.commit_ts, launch_ts=result.launch_ts)
+        for page in loaded.pages:
+            if page.page_idx <= state['page_idx']:
+                result.add_page(page)
+                deltas = [delta for delta in result.deltas if delta['page_idx'] == page.page_idx]
+                self._save(result=result, page=page, writer=writer, deltas=deltas)
+        return writer
+
+    # scrolls as long as the lazily loaded content keeps coming, the pace between
+    # pages is up to the pacer
+    def _pretend_to_scroll(self, times: int, scroll: int):
         for _ in range(times):
-            self._sleep(low, high)
             self.webdriver.execute_script(
                 f"window.scrollTo({{ top: window.scrollY + {scroll}, left: 0, behavior: 'smooth' }});"
             )
-
-    def _goto_next_page(self):
-        self._sleep(1, 3)
-        next_page_a = self.webdriver.find_element(
-            By.CSS_SELECTOR,
-            "a[data-testid=catalog-pagination--next-page]"
-        )
-        next_page_a.click()
+            wait_network_idle(self.webdriver, idle=0.3, timeout=3)
+
+    def _goto(self, url: str):
+        with self.metrics.time('pacing'):
+            self.pacer.acquire(urlsplit(url).netloc)
+        self.worker_local.nav_ts = monotonic()
+        self.driver_pool.count_page(self.webdriver)
+        with self.metrics.time('navigation'):
+            self.webdriver.get(url)
+
+    # wait for the grid to render instead of sleeping a fixed time, and tell the pacer
+    # how the site is doing. A challenge page is retried after the backoff.
+    def _wait_feed_ready(self, max_num_retries: int = 3):
+        domain = urlsplit(self.webdriver.current_url).netloc
+        for _ in range(max_num_retries):
+            with self.metrics.time('wait_feed'):
+                ready = wait_until(
+                    self.webdriver,
+                    "return document.querySelector('div[class^=feed-grid__item-content]') !== null;",
+                    timeout=15
+                )
+                if ready:
+                    wait_network_idle(self.webdriver, idle=0.5, timeout=5)
+                else:
+                    self.metrics.count('timeouts')
+                challenged = not ready and is_challenge_page(self.webdriver)
+            self.pacer.report(domain, monotonic() - self.worker_local.nav_ts, challenged=challenged)
+            if not challenged:
+                return
+
+            self.metrics.count('challenges')
+            self.logger.warning(msg=f"challenge page at {self.webdriver.current_url}, retry after backoff")
+            with self.metrics.time('pacing'):
+                self.pacer.acquire(domain)
+            self.worker_local.nav_ts = monotonic()
+            with self.metrics.time('navigation'):
+                self.webdriver.refresh()
+        raise ChallengeError(f"still challenged at {self.webdriver.current_url} after {max_num_retries} tries")
 
     def _timestamp(self):
         return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
     def _sleep(self, t1: float, t2: float):
-        sleep(random.uniform(t1, t2))
+        with self.metrics.time('sleep'):
+            sleep(random.uniform(t1, t2))
 
+    # a timeout is raised to the page retry, the browser is left alone
     def _wait_content(self):
-        try:
-            WebDriverWait(driver=self.webdriver, timeout=5).until(
-                EC.presence_of_element_located((
-                    By.CSS_SELECTOR,
-                    "section[class=site-content]"
-                ))
-            )
-        except:
-            self.webdriver.quit()
+        with self.metrics.time('wait_content'):
+            try:
+                WebDriverWait(driver=self.webdriver, timeout=5).until(
+                    EC.presence_of_element_located((
+                        By.CSS_SELECTOR,
+                        "section[class=site-content]"
+                    ))
+                )
+            except TimeoutException:
+                self.metrics.count('timeouts')
+                raise
 
     def _close_domain_popup(self):
-        try:
-            domain_close_btn = self.webdriver.find_element(
-                By.CSS_SELECTOR,
-                "button[data-testid=domain-select-modal-close-button]"
-            )
-            if domain_close_btn is not None:
-                self._sleep(1, 3)
-                domain_close_btn.click()
-        except:
-            pass
+        self._click_popup_button("button[data-testid=domain-select-modal-close-button]")
 
     def _close_cookie_popup(self):
-        try:
-            reject_cookie_btn = self.webdriver.find_element(
-                By.CSS_SELECTOR,
-                "button[id=onetrust-reject-all-handler]"
-            )
-            if reject_cookie_btn is not None:
-                self._sleep(1, 3)
-                reject_cookie_btn.click()
-        except:
-            pass
+        self._click_popup_button("button[id=onetrust-reject-all-handler]")
 
-    def _save(self, result: VintedSearchScrapeResult):
-        os.makedirs('results', exist_ok=True)
-        result.finish_ts = self._timestamp()
-        with open(f'results/{result.task.id}.json', 'w') as file:
-            file.write(json.dumps(
-                asdict(result)
-            , ensure_ascii=False, indent=4))
+    # popups come and go, a button which can't be clicked is not worth failing the page
+    def _click_popup_button(self, selector: str):
+        for btn in self.webdriver.find_elements(By.CSS_SELECTOR, selector):
+            self._sleep(1, 3)
+            try:
+                btn.click()
+            except (ElementClickInterceptedException, ElementNotInteractableException, StaleElementReferenceException) as e:
+                self.logger.warning(msg=f"failed to click popup button {selector}: {e.msg}")
+
+    # append only the new page, read back with VintedSearchScrapeResult.load
+    def _save(self, result: VintedSearchScrapeResult, page: VintedSearchPage, writer: JsonlResultWriter, deltas: List[Dict[str, Any]] = []):
+        with self.metrics.time('save'):
+            save_page(result, page, writer, deltas)
 
 
 if __name__ == "__main__":
@@ -304,11 +845,10 @@ if __name__ == "__main__":
         scrape_item_page=False,
     )
 
-    scraper = VintedSearchScraper(
+    with VintedSearchScraper(
         tasks=[task],
         browser='firefox',
         verbose=True,
         headless=False,
-    )
-
-    scraper.run()
+    ) as scraper:
+        scraper.run()
@@ -0,0 +1,180 @@
+import os
+import sys
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from models import (
+    VintedSearchItem,
+    VintedSearchPage,
+)
+from scraper import (
+    VintedSearchScrapeTask,
+    VintedSearchScrapeResult,
+    VintedSearchScraper,
+)
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from common.result_writer import JsonlResultWriter
+from common.driver_pool import DriverPool
+from common.log_pipeline import LogPipeline
+from common.metrics import Metrics
+from common.sharding import ShardPlanner, PriceBands, Choices
+
+__all__ = [
+    'VintedShardedScraper',
+]
+
+
+# in the currency of the site, like the price_from/price_to params
+VINTED_PRICE_EDGES = [0, 5, 10, 20, 50, 100, None]
+# new with tags, new without tags, very good, good, satisfactory
+VINTED_STATUS_IDS = ['6', '1', '2', '3', '4']
+VINTED_ORDERS = ['newest_first', 'price_low_to_high', 'price_high_to_low']
+
+
+# runs one VintedSearchScrapeTask as shards over price bands, statuses, brands, sizes and sort orders
+class VintedShardedScraper:
+    def __init__(
+        self,
+        task: VintedSearchScrapeTask,
+        cap: int = 960,
+        max_num_shards: int = 256,
+        brand_ids: List[str] = [],
+        size_ids: List[str] = [],
+        orders: List[str] = VINTED_ORDERS,
+        splitters: Optional[List[Any]] = None,
+        max_num_sessions: int = 4,
+        headless: bool = False,
+        verbose: bool = True,
+        **scraper_kwargs,
+    ) -> None:
+        assert task.id is not None and len(task.id) > 0
+
+        # the scrapers of the shards log through the same pipeline
+        self.log_pipeline = scraper_kwargs.setdefault('log_pipeline', LogPipeline.shared())
+        self.logger = logging.getLogger(name='VintedShardedScraper')
+        self.logger.setLevel(logging.INFO)
+        self.log_pipeline.attach(self.logger, console=verbose)
+
+        if splitters is None:
+            splitters = [
+                PriceBands('price_from', 'price_to', VINTED_PRICE_EDGES, min_width=1),
+                Choices('status_ids[]', VINTED_STATUS_IDS),
+                Choices('brand_ids[]', brand_ids),
+                Choices('size_ids[]', size_ids),
+                Choices('order', orders),
+            ]
+        self.planner = ShardPlanner(splitters, max_num_shards=max_num_shards)
+
+        self.task = task
+        self.cap = cap
+        self.verbose = verbose
+        self.max_num_sessions = max_num_sessions
+        self.scraper_kwargs = scraper_kwargs
+        # one snapshot for every round
+        self.scraper_kwargs.setdefault('metrics', Metrics(name='vinted_search'))
+
+        ts = self._timestamp()
+        self.result = VintedSearchScrapeResult(task=task, commit_ts=ts, launch_ts=ts, finish_ts=ts, pages=[])
+        self.item_map: Dict[str, VintedSearchItem] = {}
+        self.num_shards = 0
+
+        # one pool for every round, browsers stay warm between rounds
+        self.owns_driver_pool = 'driver_pool' not in scraper_kwargs
+        if self.owns_driver_pool:
+            self.scraper_kwargs['driver_pool'] = DriverPool(
+                max_num_drivers=max_num_sessions,
+                headless=headless,
+                bidi=scraper_kwargs.get('extract_mode') == 'capture'
+            )
+
+    def run(self) -> VintedSearchScrapeResult:
+        self.result.launch_ts = self._timestamp()
+        root = dict(self.task.filters)
+        if self.task.order:
+            root['order'] = self.task.order
+        try:
+            shards = self.planner.run(self._run_shards, root=root)
+        finally:
+            if self.owns_driver_pool:
+                self.scraper_kwargs['driver_pool'].close()
+
+        # the merged items as one page
+        page = VintedSearchPage(page_idx=1, items=list(self.item_map.values()))
+        self.result.add_page(page)
+        self.result.finish_ts = self._timestamp()
+        with JsonlResultWriter(path=f'results/{self.task.id}.jsonl', mode='w') as writer:
+            writer.write('task', task=self.task, commit_ts=self.result.commit_ts, launch_ts=self.result.launch_ts)
+            writer.write('page', page_idx=page.page_idx)
+            writer.write_items(page.items)
+            writer.write('progress', finish_ts=self.result.finish_ts, num_pages=self.result.num_pages, num_items=self.result.num_items, num_known_items=self.result.num_known_items)
+
+        self.logger.info(msg=f"task {self.task.id} finished with {self.result.num_items} unique items over {len(shards)} shards")
+        return self.result
+
+    def _run_shards(self, shards: List[Dict[str, Any]]) -> List[bool]:
+        tasks = []
+        for shard in shards:
+            filters = dict(shard)
+            tasks.append(VintedSearchScrapeTask(
+                id=f'{self.task.id}.{self.num_shards}',
+                search_text=self.task.search_text,
+                max_num_items=self.cap,
+                max_num_pages=self.task.max_num_pages,
+                scrape_item_page=self.task.scrape_item_page,
+                order=filters.pop('order', ''),
+                filters=filters,
+                base_url=self.task.base_url,
+            ))
+            self.num_shards += 1
+
+        # shards of a round are independent searches, the browsers are split between
+        # the shards running at once and their pages
+        num_parallel_tasks = min(len(tasks), self.max_num_sessions)
+        self.logger.info(msg=f"run {len(tasks)} shards of task {self.task.id}, {num_parallel_tasks} at a time: {shards}")
+        scraper = VintedSearchScraper(
+            verbose=self.verbose,
+            tasks=tasks,
+            max_num_sessions=max(1, self.max_num_sessions // num_parallel_tasks),
+            **self.scraper_kwargs
+        )
+        scraper.run(max_num_parallel_tasks=num_parallel_tasks)
+
+        capped = []
+        for task in tasks:
+            result = scraper.result_map[task.id]
+            for item in result.items:
+                self.item_map.setdefault(item.id, item)
+            # by id like the items, shards overlap
+            self.result.known_ids.update(result.known_ids)
+            capped.append(result.num_pages >= task.max_num_pages or result.num_items + result.num_known_items >= self.cap)
+
+        # with an item index, the items an earlier shard of this run found are known to the later ones
+        self.result.num_known_items = len(self.result.known_ids - self.item_map.keys())
+
+        # enough unique items, stop splitting
+        if len(self.item_map) >= self.task.max_num_items:
+            return [False] * len(tasks)
+        return capped
+
+    def _timestamp(self):
+        return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+if __name__ == "__main__":
+    task = VintedSearchScrapeTask(
+        id='123456789',
+        search_text='earring',
+        max_num_items=10000,
+        max_num_pages=10,
+        scrape_item_page=False,
+    )
+
+    scraper = VintedShardedScraper(
+        task=task,
+        verbose=True,
+        headless=False,
+    )
+
+    scraper.run()